@@ -0,0 +1 @@
+from src.backend.api.asgi import app
@@ -0,0 +1,312 @@
+"""Punto de entrada ASGI con /extract-meta y /analyze asíncronos.
+
+Con workers síncronos cada petición ocupa un proceso mientras espera a la
+página de origen o a OpenAI. Aquí esas dos rutas se atienden con corrutinas
+sobre clientes httpx y AsyncOpenAI compartidos, así que un solo proceso puede
+tener cientos de peticiones en vuelo. El resto de rutas se sirven con la app
+de Flask a través de WsgiToAsgi, cada petición en un hilo de un pool de
+ASYNC_WSGI_THREADS (asgiref las ejecutaría de una en una en un único hilo).
+
+Las rutas asíncronas pasan igualmente por Flask (límites de uso, sesión,
+CORS y encabezados de seguridad) usando su contexto de petición. Todo lo que
+toca SQLite (sesión, límites, cuotas, cachés) o gasta CPU (el parseo de la
+página) se ejecuta en hilos para no bloquear el bucle de eventos.
+"""
+
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from flask import request, jsonify
+
+from .routes import (app as flask_app, analysis_api_key, can_use_tool, quota_subject,
+                     reserve_analyses, settle_analyses, usage_limit_exceeded)
+from .batch import build_async_client, extract_page_async
+from .cache import analysis_cache
+from .llm import (analysis_cache_key, read_analysis_input, analysis_payload, request_analysis,
+                  analyze_structured_async, format_analysis, AnalysisFailed, PROMPT_VERSION,
+                  STRUCTURED_PROMPT_VERSION, token_cost as llm_token_cost)
+from .scoring import score_inputs
+from .openai_clients import async_openai_clients
+from .validation import validate_url_async
+from .config import ASYNC_MAX_IN_FLIGHT, ASYNC_UPSTREAM_CONNECTIONS, ASYNC_WSGI_THREADS
+
+
+def wsgi_environ(scope, body):
+    """Construir el environ WSGI de una petición ASGI para el contexto de Flask"""
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'SERVER_NAME': scope.get('server', ('localhost', 80))[0],
+        'SERVER_PORT': str(scope.get('server', ('localhost', 80))[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': BytesIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1')
+        if name == 'content-length':
+            continue
+        key = 'CONTENT_TYPE' if name == 'content-type' else 'HTTP_' + name.upper().replace('-', '_')
+        value = value.decode('latin1')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+class ThreadedWsgiInstance(WsgiToAsgiInstance):
+    """Petición WSGI ejecutada en un hilo del pool (no en el hilo compartido de asgiref)."""
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        run = WsgiToAsgiInstance.__dict__['run_wsgi_app'].func
+        await sync_to_async(run, thread_sensitive=False, executor=self.executor)(self, body)
+
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi con un pool de hilos: las rutas largas de Flask (streams, lotes,
+    /jobs/<id>/events) no se esperan unas a otras."""
+
+    def __init__(self, wsgi_application, threads=ASYNC_WSGI_THREADS):
+        super().__init__(wsgi_application)
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        await ThreadedWsgiInstance(self.wsgi_application, self.executor)(scope, receive, send)
+
+
+class AsyncAPI:
+    """Aplicación ASGI: rutas asíncronas propias y el resto delegado en Flask."""
+
+    def __init__(self, flask_app, max_in_flight=ASYNC_MAX_IN_FLIGHT,
+                 upstream_connections=ASYNC_UPSTREAM_CONNECTIONS):
+        self.flask_app = flask_app
+        self.wsgi = ThreadedWsgiToAsgi(flask_app)
+        self.max_in_flight = max_in_flight
+        self.upstream_connections = upstream_connections
+        self.in_flight = 0
+        self.client = None
+        self.handlers = {
+            ('POST', '/extract-meta'): self.extract_meta,
+            ('POST', '/analyze'): self.analyze,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        handler = None
+        if scope['type'] == 'http':
+            handler = self.handlers.get((scope['method'], scope['path']))
+        if handler is None:
+            return await self.wsgi(scope, receive, send)
+
+        if self.in_flight >= self.max_in_flight:
+            busy = self.flask_app.response_class(self.flask_app.json.dumps({
+                "error": "Server busy",
+                "message": "Too many requests in progress. Please try again later."
+            }), status=503, mimetype='application/json')
+            return await self.send_response(send, busy)
+
+        self.in_flight += 1
+        try:
+            body = await self.read_body(receive)
+            response = await self.dispatch(handler, scope, body)
+            await self.send_response(send, response)
+        finally:
+            self.in_flight -= 1
+
+    async def lifespan(self, receive, send):
+        """Abrir el cliente de descargas al arrancar y cerrar los pools al parar"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.upstream_client()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.client is not None:
+                    await self.client.aclose()
+                    self.client = None
+                await async_openai_clients.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def upstream_client(self):
+        """Cliente httpx compartido por todas las descargas de este proceso"""
+        if self.client is None:
+            self.client = build_async_client(self.upstream_connections)
+        return self.client
+
+    async def read_body(self, receive):
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        return b''.join(chunks)
+
+    async def send_response(self, send, response):
+        """Enviar una respuesta de Flask (ya completa) por ASGI"""
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin1'), value.encode('latin1'))
+                        for name, value in response.headers.items()],
+        })
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+
+    async def dispatch(self, handler, scope, body):
+        """Ejecutar una ruta asíncrona dentro del contexto de petición de Flask
+
+        Así se aplican los mismos before_request (límites de uso) y
+        after_request (CORS, encabezados de seguridad, sesión) que en WSGI.
+        Esa parte síncrona se ejecuta en un hilo y la ruta en el bucle de
+        eventos, las dos sobre el mismo contexto de variables de la petición.
+        """
+        app = self.flask_app
+        request_ctx = app.request_context(wsgi_environ(scope, body))
+        context = contextvars.copy_context()
+
+        def run_sync(func, *args):
+            return asyncio.get_running_loop().run_in_executor(None, context.run, func, *args)
+
+        def start():
+            # Abrir la sesión y aplicar los before_request
+            request_ctx.push()
+            try:
+                return app.preprocess_request()
+            except Exception as e:
+                return self.handle_error(e)
+
+        def finish(rv):
+            try:
+                return app.finalize_request(rv)
+            finally:
+                request_ctx.pop()
+
+        rv = await run_sync(start)
+        if rv is None:
+            try:
+                rv = await asyncio.get_running_loop().create_task(handler(), context=context)
+            except Exception as e:
+                rv = await run_sync(self.handle_error, e)
+        return await run_sync(finish, rv)
+
+    def handle_error(self, exc):
+        app = self.flask_app
+        try:
+            return app.handle_user_exception(exc)
+        except Exception as unhandled:
+            return app.handle_exception(unhandled)
+
+    async def extract_meta(self):
+        data = request.json
+        url = data.get("url")
+
+        if not url:
+            return jsonify({"message": "Please provide a URL"}), 400
+
+        # Validación de URL para evitar SSRF y otros ataques
+        rejected = await validate_url_async(url)
+        if rejected:
+            payload, status = rejected
+            return jsonify(payload), status
+
+        # Verificar si el usuario puede usar la herramienta
+        if not await asyncio.to_thread(can_use_tool):
+            return usage_limit_exceeded()
+
+        payload, status = await extract_page_async(self.upstream_client(), url,
+                                                   subject=quota_subject())
+        return jsonify(payload), status
+
+    async def analyze(self):
+        try:
+            data = request.json
+
+            inputs, error = read_analysis_input(data)
+            if error:
+                payload, status = error
+                return jsonify(payload), status
+
+            # Puntuación local: si el par ya cumple todas las reglas no se llama a OpenAI
+            score = score_inputs(inputs) if data.get("prescreen") else None
+            if score and score['passed']:
+                return jsonify(analysis_payload(inputs, None, 0, 'skipped', score))
+
+            # Verificar si el usuario puede usar la herramienta (reserva el gasto estimado)
+            subject = quota_subject()
+            if not await asyncio.to_thread(reserve_analyses, subject):
+                return usage_limit_exceeded('analyze')
+
+            token_cost = 0
+            try:
+                # Consultar la caché de resultados (salvo que se pida ignorarla)
+                use_cache = not data.get("no_cache", False)
+                # Modo estructurado: campos tipados y límites comprobados en local
+                structured = bool(data.get("structured"))
+                cache_key = analysis_cache_key(
+                    **inputs,
+                    prompt_version=STRUCTURED_PROMPT_VERSION if structured else PROMPT_VERSION)
+                if use_cache:
+                    cached = await asyncio.to_thread(analysis_cache.get, cache_key)
+                    if cached and cached.fresh:
+                        return jsonify(analysis_payload(inputs, cached.value['analysis'], 0,
+                                                        'hit', score, cached.value.get('result')))
+
+                fields = None
+                with async_openai_clients.lease(analysis_api_key()) as client:
+                    if structured:
+                        try:
+                            fields, token_cost = await analyze_structured_async(client, inputs)
+                        except AnalysisFailed as e:
+                            # Respuesta inservible: se cobran igualmente los tokens gastados
+                            token_cost = e.token_cost
+                            raise
+                        result = format_analysis(fields)
+                    else:
+                        response = await request_analysis(client, inputs)
+                        result = response.output_text
+                        token_cost = llm_token_cost(response.usage)
+            finally:
+                # Cobrar el coste real y devolver el resto de la reserva
+                await asyncio.to_thread(settle_analyses, subject, 1, 1, token_cost)
+            flask_app.logger.info("Analysis completed", extra={
+                'sample': True, 'token_cost': token_cost, 'analysis': result})
+
+            # No guardar un resultado estructurado que siga incumpliendo los límites
+            if fields is None or fields['valid']:
+                await asyncio.to_thread(analysis_cache.set, cache_key,
+                                        {'analysis': result, 'result': fields})
+
+            return jsonify(analysis_payload(inputs, result, token_cost,
+                                            'miss' if use_cache else 'bypass', score, fields))
+        except Exception as e:
+            flask_app.logger.exception("Analysis failed")
+
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 500
+
+
+app = AsyncAPI(flask_app)
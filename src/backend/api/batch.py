@@ -0,0 +1,210 @@
+"""Extracción de metadatos de muchas URLs en paralelo con httpx asíncrono.
+
+Cada URL pasa por la misma validación, descarga parcial (hasta </head>) y
+extracción que /extract-meta, pero las descargas se hacen de forma
+concurrente con un límite global y otro por dominio. El lote tiene un plazo
+(max_seconds): las URLs que no terminan a tiempo se devuelven como error.
+"""
+
+import asyncio
+import time
+from collections import defaultdict
+from contextlib import AsyncExitStack
+from urllib.parse import urlparse
+
+import httpx
+
+from .config import (FETCH_TIMEOUT, FETCH_BODY_BUDGET, FETCH_MAX_BYTES, BATCH_MAX_SECONDS,
+                     BATCH_CONCURRENCY, BATCH_PER_HOST_CONCURRENCY, UPSTREAM_MAX_REDIRECTS)
+from .fetcher import (DEFAULT_HEADERS, HeadBuffer, FetchResult, UnsupportedContentType,
+                      RedirectRejected, is_html_content_type)
+from .http_client import async_client_options
+from .extractor import page_response
+from .validation import validate_url_async
+from .resolver import BlockedAddress
+from .cache import metadata_cache, with_cache_status
+from .duplicates import duplicate_store
+from .metrics import upstream_fetch_seconds
+
+
+async def fetch_head_async(client, url, headers=None, body_budget=FETCH_BODY_BUDGET,
+                           max_bytes=FETCH_MAX_BYTES):
+    """Versión asíncrona de fetch_head: descarga por bloques y corta tras </head>"""
+    start_time = time.time()
+
+    async with client.stream('GET', url, headers=headers or DEFAULT_HEADERS) as response:
+        content = b''
+        truncated = False
+
+        if response.status_code == 200:
+            # Comprobar el tipo de contenido antes de descargar el cuerpo
+            content_type = response.headers.get('Content-Type')
+            if not is_html_content_type(content_type):
+                raise UnsupportedContentType(content_type)
+
+            head = HeadBuffer(body_budget, max_bytes)
+            async for chunk in response.aiter_bytes():
+                if head.feed(chunk):
+                    truncated = True
+                    break
+            content = head.content()
+
+    elapsed = time.time() - start_time
+    upstream_fetch_seconds.observe(elapsed)
+    return FetchResult(
+        url=str(response.url),
+        status_code=response.status_code,
+        headers=response.headers,
+        content=content,
+        truncated=truncated,
+        elapsed=elapsed
+    )
+
+
+async def validate_redirect(request):
+    """Hook de httpx: validar contra SSRF cada petición, incluidos los saltos de redirección"""
+    url = str(request.url)
+    rejected = await validate_url_async(url)
+    if rejected:
+        payload, status = rejected
+        raise RedirectRejected(url, payload, status)
+
+
+def error_response(exc):
+    """Traducir una excepción de la descarga al mismo (payload, status) que /extract-meta"""
+    if isinstance(exc, RedirectRejected):
+        return exc.payload, exc.status
+    if isinstance(exc, BlockedAddress):
+        return {"error": "Private or loopback IPs are not allowed"}, 403
+    if isinstance(exc, UnsupportedContentType):
+        return {
+            "error": "Unsupported Content-Type",
+            "message": f"The URL did not return an HTML document ({exc.content_type})"
+        }, 415
+    if isinstance(exc, (httpx.TimeoutException, asyncio.TimeoutError)):
+        return {
+            "error": "Timeout",
+            "message": "Request exceeded timeout (10 seconds)"
+        }, 504
+    if isinstance(exc, httpx.TooManyRedirects):
+        return {
+            "error": "Too Many Redirects",
+            "message": "The request encountered too many redirects. Please check the URL."
+        }, 500
+    if isinstance(exc, (httpx.ConnectError, httpx.RemoteProtocolError)):
+        return {
+            "error": "Connection Error",
+            "message": "Could not connect to server. Please check the URL and your internet connection."
+        }, 502
+    return {
+        "error": str(exc),
+        "message": "An error occurred while processing the request"
+    }, 500
+
+
+def build_async_client(max_connections):
+    """Cliente httpx asíncrono para descargas: redirecciones validadas e IPs fijadas"""
+    return httpx.AsyncClient(follow_redirects=True, max_redirects=UPSTREAM_MAX_REDIRECTS,
+                             event_hooks={'request': [validate_redirect]},
+                             **async_client_options(max_connections))
+
+
+async def extract_page_async(client, url, limits=(), timeout=FETCH_TIMEOUT, subject=None):
+    """Validar, consultar la caché, descargar y extraer una URL; devuelve (payload, status)
+
+    `limits` son semáforos (u otros gestores de contexto asíncronos) que se
+    mantienen solo mientras dura la descarga. La página se guarda en el índice
+    de duplicados de `subject` (el titular de cuota que la pidió), también si
+    sale de la caché.
+    """
+    # Validación de URL para evitar SSRF (resolución DNS sin bloquear el bucle de eventos)
+    rejected = await validate_url_async(url)
+    if rejected:
+        return rejected
+
+    # Consultar la caché de metadatos (compartida con /extract-meta)
+    cached = await asyncio.to_thread(metadata_cache.lookup, url)
+    if cached and cached.fresh:
+        await asyncio.to_thread(duplicate_store.record, url, cached.value, subject)
+        return with_cache_status(cached.value, 'hit'), 200
+
+    headers = None
+    if cached:
+        headers = {**DEFAULT_HEADERS, **cached.conditional_headers()}
+
+    try:
+        async with AsyncExitStack() as stack:
+            for limit in limits:
+                await stack.enter_async_context(limit)
+            response = await asyncio.wait_for(fetch_head_async(client, url, headers), timeout)
+
+        if response.status_code == 304 and cached:
+            await asyncio.to_thread(metadata_cache.revalidated, cached)
+            await asyncio.to_thread(duplicate_store.record, url, cached.value, subject)
+            return with_cache_status(cached.value, 'revalidated'), 200
+
+        # El parseo gasta CPU (cientos de ms en una página de 2 MB): fuera del bucle de eventos
+        payload, status = await asyncio.to_thread(page_response, response, url, response.elapsed)
+        if status == 200:
+            await asyncio.to_thread(metadata_cache.save, url, payload, response.headers)
+            await asyncio.to_thread(duplicate_store.record, url, payload, subject)
+            payload = with_cache_status(payload, 'miss')
+        return payload, status
+    except Exception as e:
+        return error_response(e)
+
+
+class BatchExtractor:
+    """Ejecuta la extracción de una lista de URLs con límites de concurrencia."""
+
+    def __init__(self, concurrency=BATCH_CONCURRENCY, per_host=BATCH_PER_HOST_CONCURRENCY,
+                 timeout=FETCH_TIMEOUT, max_seconds=BATCH_MAX_SECONDS, subject=None):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_seconds = max_seconds
+        self.subject = subject
+        self.expired = 0
+
+    async def extract_one(self, client, url, global_limit, host_limits):
+        """Extraer una URL respetando el límite global y el del dominio"""
+        if not isinstance(url, str) or not url:
+            return {"url": url, "status": 400, "message": "Please provide a URL"}
+
+        host = urlparse(url).netloc.lower()
+        payload, status = await extract_page_async(
+            client, url, (global_limit, host_limits[host]), self.timeout, self.subject)
+        return {"url": url, "status": status, **payload}
+
+    def deadline_exceeded(self, url):
+        self.expired += 1
+        return {"url": url, "status": 504, "error": "Deadline exceeded",
+                "message": "The batch ran out of time before this URL was extracted"}
+
+    async def run(self, urls):
+        """Extraer todas las URLs; devuelve los resultados en el mismo orden"""
+        if not urls:
+            return []
+        global_limit = asyncio.Semaphore(self.concurrency)
+        host_limits = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+
+        async with build_async_client(self.concurrency) as client:
+            tasks = [asyncio.create_task(self.extract_one(client, url, global_limit, host_limits))
+                     for url in urls]
+            _, pending = await asyncio.wait(tasks, timeout=self.max_seconds)
+            # Plazo cumplido: las descargas que siguen en marcha (o en espera) se cancelan
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        return [self.deadline_exceeded(url) if task in pending else task.result()
+                for task, url in zip(tasks, urls)]
+
+
+def extract_batch(urls, subject=None):
+    """Punto de entrada síncrono para las vistas de Flask
+
+    Devuelve (resultados, URLs que se quedaron sin extraer por el plazo).
+    """
+    extractor = BatchExtractor(subject=subject)
+    results = asyncio.run(extractor.run(urls))
+    return results, extractor.expired
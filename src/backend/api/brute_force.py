@@ -0,0 +1,196 @@
+"""Estado de la protección contra fuerza bruta de /set-key.
+
+Los intentos fallidos y los bloqueos se guardan por IP con una caducidad y
+un número máximo de entradas, para que un escaneo desde muchas direcciones
+no haga crecer la memoria sin límite. El almacén SQLite es compartido por
+todos los workers, así que el límite de intentos es el mismo para todo el
+servidor y no uno por proceso.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .config import (BRUTE_FORCE_BACKEND, BRUTE_FORCE_PATH, BRUTE_FORCE_MAX_ENTRIES,
+                     BRUTE_FORCE_MAX_ATTEMPTS, BRUTE_FORCE_BLOCK_SECONDS)
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBruteForceStore:
+    """Intentos y bloqueos por IP en memoria del proceso (LRU con caducidad)."""
+
+    def __init__(self, max_attempts=BRUTE_FORCE_MAX_ATTEMPTS, block_seconds=BRUTE_FORCE_BLOCK_SECONDS,
+                 max_entries=BRUTE_FORCE_MAX_ENTRIES):
+        self.max_attempts = max_attempts
+        self.block_seconds = block_seconds
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        # ip -> [intentos, bloqueada hasta, caduca en]
+        self.entries = OrderedDict()
+
+    def prune(self, now):
+        """Quitar las entradas caducadas y las que sobran por el límite.
+
+        Cada entrada se mueve al final al actualizarse y su caducidad siempre
+        es now + block_seconds, así que las más antiguas están al principio.
+        """
+        while self.entries:
+            ip, entry = next(iter(self.entries.items()))
+            if entry[2] > now and len(self.entries) <= self.max_entries:
+                break
+            del self.entries[ip]
+
+    def blocked_until(self, ip):
+        """Momento (epoch) hasta el que la IP está bloqueada, o None"""
+        now = time.time()
+        with self.lock:
+            self.prune(now)
+            entry = self.entries.get(ip)
+            if entry and entry[1] > now:
+                return entry[1]
+        return None
+
+    def record_failure(self, ip):
+        """Contar un intento fallido y bloquear la IP al llegar al máximo"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.pop(ip, None)
+            attempts = entry[0] if entry and entry[2] > now else 0
+            blocked_until = entry[1] if entry else 0
+
+            attempts += 1
+            if attempts >= self.max_attempts:
+                # Bloquear la IP por el tiempo configurado
+                blocked_until = now + self.block_seconds
+                attempts = 0
+
+            self.entries[ip] = [attempts, blocked_until, now + self.block_seconds]
+            self.prune(now)
+
+    def reset(self, ip):
+        """Restablecer el contador tras un intento correcto"""
+        with self.lock:
+            self.entries.pop(ip, None)
+
+
+class SQLiteBruteForceStore:
+    """Intentos y bloqueos por IP compartidos entre workers en un archivo SQLite."""
+
+    # Cada cuántas escrituras se borran las entradas caducadas y las que sobran
+    PRUNE_EVERY = 256
+
+    def __init__(self, path, max_attempts=BRUTE_FORCE_MAX_ATTEMPTS,
+                 block_seconds=BRUTE_FORCE_BLOCK_SECONDS, max_entries=BRUTE_FORCE_MAX_ENTRIES):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.block_seconds = block_seconds
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+        self.writes = 0
+        # Si SQLite falla se sigue protegiendo con el estado del proceso
+        self.fallback = MemoryBruteForceStore(max_attempts, block_seconds, max_entries)
+
+    def connect(self):
+        """Abrir (o reabrir tras un fork) la conexión de este proceso"""
+        pid = os.getpid()
+        if self.conn is None or self.pid != pid:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS brute_force (
+                ip TEXT PRIMARY KEY,
+                attempts INTEGER NOT NULL,
+                blocked_until REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )''')
+            conn.execute('CREATE INDEX IF NOT EXISTS brute_force_expires_at '
+                         'ON brute_force (expires_at)')
+            self.conn = conn
+            self.pid = pid
+        return self.conn
+
+    def blocked_until(self, ip):
+        now = time.time()
+        try:
+            with self.lock:
+                row = self.connect().execute(
+                    'SELECT blocked_until FROM brute_force WHERE ip = ?', (ip,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Brute force store error: %s", e)
+            return self.fallback.blocked_until(ip)
+        if row and row[0] > now:
+            return row[0]
+        return None
+
+    def record_failure(self, ip):
+        now = time.time()
+        expires_at = now + self.block_seconds
+        try:
+            with self.lock:
+                conn = self.connect()
+                # Leer y escribir en la misma transacción para que dos workers
+                # no pierdan intentos
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    row = conn.execute(
+                        'SELECT attempts, blocked_until, expires_at FROM brute_force WHERE ip = ?',
+                        (ip,)).fetchone()
+                    attempts = row[0] if row and row[2] > now else 0
+                    blocked_until = row[1] if row else 0
+
+                    attempts += 1
+                    if attempts >= self.max_attempts:
+                        blocked_until = now + self.block_seconds
+                        attempts = 0
+
+                    conn.execute(
+                        'INSERT OR REPLACE INTO brute_force (ip, attempts, blocked_until, expires_at) '
+                        'VALUES (?, ?, ?, ?)', (ip, attempts, blocked_until, expires_at))
+
+                    self.writes += 1
+                    if self.writes % self.PRUNE_EVERY == 0:
+                        self.prune(conn, now)
+                    conn.execute('COMMIT')
+                except BaseException:
+                    conn.execute('ROLLBACK')
+                    raise
+        except sqlite3.Error as e:
+            logger.warning("Brute force store error: %s", e)
+            self.fallback.record_failure(ip)
+
+    def reset(self, ip):
+        try:
+            with self.lock:
+                self.connect().execute('DELETE FROM brute_force WHERE ip = ?', (ip,))
+        except sqlite3.Error as e:
+            logger.warning("Brute force store error: %s", e)
+        self.fallback.reset(ip)
+
+    def prune(self, conn, now):
+        """Borrar las entradas caducadas y, si aún sobran, las que caducan antes"""
+        conn.execute('DELETE FROM brute_force WHERE expires_at <= ?', (now,))
+        count = conn.execute('SELECT COUNT(*) FROM brute_force').fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            conn.execute(
+                'DELETE FROM brute_force WHERE ip IN '
+                '(SELECT ip FROM brute_force ORDER BY expires_at LIMIT ?)', (excess,))
+
+
+def create_store(backend=BRUTE_FORCE_BACKEND):
+    """Crear el almacén configurado ('sqlite' o 'memory')"""
+    if backend == 'memory':
+        return MemoryBruteForceStore()
+    if backend == 'sqlite':
+        return SQLiteBruteForceStore(BRUTE_FORCE_PATH)
+    raise ValueError(f"Unknown brute force backend: {backend}")
+
+
+brute_force_store = create_store()
@@ -0,0 +1,168 @@
+"""Análisis masivo de títulos y descripciones.
+
+Los elementos se analizan con un número limitado de llamadas simultáneas a
+OpenAI; los errores de límite de uso (429) y los 5xx se reintentan con
+backoff exponencial. Los resultados se devuelven a medida que terminan y al
+final se añade un resumen con los tokens y el coste total.
+
+Con max_seconds el lote tiene un plazo: los elementos que no han empezado a
+tiempo se devuelven como error y ni las llamadas ni los reintentos lo pasan.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import openai
+
+from .config import BULK_CONCURRENCY, BULK_MAX_RETRIES, BULK_BACKOFF_BASE, BULK_BACKOFF_MAX
+from .cache import analysis_cache
+from .scoring import score_batch
+from .llm import (analysis_cache_key, read_analysis_input, analysis_payload, request_analysis,
+                  token_cost)
+
+# Errores de OpenAI que merece la pena reintentar
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.InternalServerError)
+
+
+def retry_delay(error, attempt, base=BULK_BACKOFF_BASE, cap=BULK_BACKOFF_MAX):
+    """Espera antes del siguiente intento: Retry-After si lo hay, si no backoff con jitter"""
+    response = getattr(error, 'response', None)
+    if response is not None:
+        retry_after = response.headers.get('retry-after')
+        try:
+            if retry_after is not None:
+                return min(cap, float(retry_after))
+        except ValueError:
+            pass
+    return min(cap, base * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+
+class BulkAnalyzer:
+    """Ejecuta muchos análisis con concurrencia limitada y reintentos."""
+
+    def __init__(self, client, concurrency=BULK_CONCURRENCY, max_retries=BULK_MAX_RETRIES,
+                 use_cache=True, prescreen=False, sleep=time.sleep, max_seconds=None,
+                 on_item=None):
+        self.client = client
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.use_cache = use_cache
+        # Con prescreen solo se envían a OpenAI los elementos que no pasan la puntuación local
+        self.prescreen = prescreen
+        self.sleep = sleep
+        self.max_seconds = max_seconds
+        self.deadline = None
+        # on_item(analizado, coste) se llama al terminar cada elemento (p. ej. para cobrarlo)
+        self.on_item = on_item
+        self.lock = threading.Lock()
+        self.totals = {'items': 0, 'succeeded': 0, 'failed': 0, 'cache_hits': 0, 'prescreened': 0,
+                       'expired': 0, 'retries': 0, 'input_tokens': 0, 'output_tokens': 0,
+                       'token_cost': 0.0}
+
+    def count(self, **values):
+        with self.lock:
+            for field, value in values.items():
+                self.totals[field] += value
+
+    def remaining(self):
+        """Segundos que quedan del plazo del lote (None si no tiene)"""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def call_with_retry(self, inputs):
+        """Llamar a OpenAI reintentando los errores de límite de uso"""
+        attempt = 0
+        while True:
+            client = self.client
+            remaining = self.remaining()
+            if remaining is not None:
+                # La llamada tampoco puede pasar del plazo del lote
+                client = client.with_options(timeout=max(remaining, 1))
+            try:
+                return request_analysis(client, inputs)
+            except RETRYABLE_ERRORS as e:
+                delay = retry_delay(e, attempt)
+                remaining = self.remaining()
+                if attempt >= self.max_retries or (remaining is not None and delay >= remaining):
+                    raise
+                self.count(retries=1)
+                self.sleep(delay)
+                attempt += 1
+
+    def analyze_item(self, index, item, score=None):
+        """Analizar un elemento; los errores se devuelven en el propio resultado"""
+        result, analyzed, cost = self.evaluate(index, item, score)
+        if self.on_item:
+            self.on_item(analyzed, cost)
+        return result
+
+    def evaluate(self, index, item, score):
+        """Resultado del elemento, si llegó a analizarse (caché u OpenAI) y su coste"""
+        item_id = item.get('id') if isinstance(item, dict) else None
+        result = {'index': index, 'id': item_id}
+
+        inputs, error = read_analysis_input(item if isinstance(item, dict) else {})
+        if error:
+            payload, _ = error
+            self.count(failed=1)
+            return {**result, 'status': 'error', **payload}, False, 0
+
+        if score and score['passed']:
+            self.count(succeeded=1, prescreened=1)
+            return {**result, **analysis_payload(inputs, None, 0, 'skipped', score)}, False, 0
+
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            self.count(failed=1, expired=1)
+            return {**result, 'status': 'error', 'error': 'Deadline exceeded',
+                    'message': 'The batch ran out of time before this item was analyzed'}, False, 0
+
+        cache_key = analysis_cache_key(**inputs)
+        if self.use_cache:
+            cached = analysis_cache.get(cache_key)
+            if cached and cached.fresh:
+                self.count(succeeded=1, cache_hits=1)
+                return {**result, **analysis_payload(inputs, cached.value['analysis'], 0, 'hit',
+                                                     score)}, True, 0
+
+        try:
+            response = self.call_with_retry(inputs)
+        except Exception as e:
+            # La llamada falló: no cuenta como análisis
+            self.count(failed=1)
+            return {**result, 'status': 'error', 'message': str(e)}, False, 0
+
+        usage = response.usage
+        cost = token_cost(usage)
+        self.count(succeeded=1, input_tokens=int(usage.input_tokens),
+                   output_tokens=int(usage.output_tokens), token_cost=cost)
+
+        analysis_cache.set(cache_key, {'analysis': response.output_text})
+        payload = analysis_payload(inputs, response.output_text, cost,
+                                   'miss' if self.use_cache else 'bypass', score)
+        return {**result, **payload}, True, cost
+
+    def run(self, items):
+        """Generar los resultados según terminan y, al final, el resumen"""
+        self.count(items=len(items))
+        if self.max_seconds is not None:
+            self.deadline = time.monotonic() + self.max_seconds
+        # La puntuación local de todo el lote se calcula de una vez
+        scores = score_batch(items) if self.prescreen else [None] * len(items)
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            futures = [executor.submit(self.analyze_item, index, item, score)
+                       for index, (item, score) in enumerate(zip(items, scores))]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # Si el cliente se desconecta, no lanzar los elementos pendientes; las llamadas en
+            # curso terminan (y cuentan en el gasto) antes de devolver el cliente de OpenAI
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        with self.lock:
+            summary = dict(self.totals)
+        yield {'summary': summary}
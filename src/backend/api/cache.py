@@ -0,0 +1,239 @@
+"""Caché persistente compartida entre workers, basada en SQLite.
+
+Todos los workers de gunicorn abren el mismo archivo (en modo WAL), así que
+una entrada guardada por uno la ven los demás. Cada entrada tiene un TTL y
+la tabla se limita a un número máximo de entradas, expulsando las usadas
+hace más tiempo (LRU).
+
+Para no escribir en cada lectura, la hora de último acceso se guarda con una
+resolución de TOUCH_INTERVAL segundos y en lotes, y el número de entradas se
+comprueba cada EVICT_EVERY escrituras (el límite puede superarse en unas
+pocas entradas por worker entre comprobaciones).
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from .config import (METADATA_CACHE_ENABLED, METADATA_CACHE_PATH, METADATA_CACHE_TTL,
+                     METADATA_CACHE_MAX_ENTRIES, ANALYSIS_CACHE_ENABLED, ANALYSIS_CACHE_PATH,
+                     ANALYSIS_CACHE_TTL, ANALYSIS_CACHE_MAX_ENTRIES)
+from .metrics import cache_requests
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry:
+    """Entrada leída de la caché."""
+
+    def __init__(self, key, value, etag, last_modified, expires_at):
+        self.key = key
+        self.value = value
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+
+    @property
+    def fresh(self):
+        return time.time() < self.expires_at
+
+    def conditional_headers(self):
+        """Encabezados para revalidar la entrada con un GET condicional"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class SQLiteCache:
+    """Caché clave/valor (JSON) con TTL y expulsión LRU sobre SQLite."""
+
+    # Escrituras de este proceso entre comprobaciones del número de entradas
+    EVICT_EVERY = 100
+    # Segundos de resolución del último acceso y accesos pendientes antes de escribirlos
+    TOUCH_INTERVAL = 60
+    TOUCH_BATCH = 256
+
+    def __init__(self, path, table, ttl, max_entries, enabled=True):
+        self.enabled = enabled
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+        self.writes = 0
+        # Clave -> hora del último acceso aún no guardada
+        self.touched = {}
+        self.touched_at = time.monotonic()
+
+    def connect(self):
+        """Abrir (o reabrir tras un fork) la conexión de este proceso"""
+        pid = os.getpid()
+        if self.conn is None or self.pid != pid:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'''CREATE TABLE IF NOT EXISTS {self.table} (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )''')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_last_access '
+                         f'ON {self.table} (last_access)')
+            self.conn = conn
+            self.pid = pid
+            self.touched = {}
+        return self.conn
+
+    def get(self, key):
+        """Leer una entrada (aunque esté caducada) o None si no existe"""
+        if not self.enabled:
+            return None
+        try:
+            with self.lock:
+                conn = self.connect()
+                row = conn.execute(
+                    f'SELECT value, etag, last_modified, expires_at, last_access FROM {self.table} '
+                    f'WHERE key = ?', (key,)).fetchone()
+                now = time.time()
+                if row is not None and now - row[4] >= self.TOUCH_INTERVAL:
+                    self.touched[key] = now
+                if (len(self.touched) >= self.TOUCH_BATCH
+                        or time.monotonic() - self.touched_at >= self.TOUCH_INTERVAL):
+                    self.flush_touched(conn)
+        except sqlite3.Error as e:
+            logger.warning("Cache read error: %s", e)
+            return None
+
+        if row is None:
+            return None
+        value, etag, last_modified, expires_at, _ = row
+        return CacheEntry(key, json.loads(value), etag, last_modified, expires_at)
+
+    def set(self, key, value, etag=None, last_modified=None, ttl=None):
+        """Guardar una entrada y expulsar las menos usadas si se supera el límite"""
+        if not self.enabled:
+            return
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        try:
+            with self.lock:
+                conn = self.connect()
+                conn.execute(
+                    f'INSERT OR REPLACE INTO {self.table} '
+                    f'(key, value, etag, last_modified, expires_at, last_access) '
+                    f'VALUES (?, ?, ?, ?, ?, ?)',
+                    (key, json.dumps(value), etag, last_modified, expires_at, now))
+                self.touched.pop(key, None)
+                self.writes += 1
+                if self.writes % self.EVICT_EVERY == 0:
+                    self.evict(conn)
+        except sqlite3.Error as e:
+            logger.warning("Cache write error: %s", e)
+
+    def refresh(self, key, ttl=None):
+        """Renovar el TTL de una entrada (p. ej. tras un 304 Not Modified)"""
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        try:
+            with self.lock:
+                self.connect().execute(
+                    f'UPDATE {self.table} SET expires_at = ?, last_access = ? WHERE key = ?',
+                    (expires_at, now, key))
+        except sqlite3.Error as e:
+            logger.warning("Cache write error: %s", e)
+
+    def flush_touched(self, conn):
+        """Guardar en una sola transacción los últimos accesos pendientes"""
+        touched, self.touched = self.touched, {}
+        self.touched_at = time.monotonic()
+        if not touched:
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                f'UPDATE {self.table} SET last_access = ? WHERE key = ? AND last_access < ?',
+                [(accessed, key, accessed) for key, accessed in touched.items()])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def evict(self, conn):
+        """Borrar las entradas menos usadas que sobren por encima de max_entries"""
+        count = conn.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            conn.execute(
+                f'DELETE FROM {self.table} WHERE key IN '
+                f'(SELECT key FROM {self.table} ORDER BY last_access LIMIT ?)',
+                (excess,))
+
+
+def normalize_url(url):
+    """Normalizar una URL para usarla como clave de caché"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+
+    # Quitar el puerto por defecto
+    port = parts.port
+    if port and not ((scheme == 'http' and port == 80) or (scheme == 'https' and port == 443)):
+        host = f"{host}:{port}"
+
+    path = parts.path or '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+
+    # El fragmento (#...) no llega al servidor, así que se descarta
+    return urlunsplit((scheme, host, path, query, ''))
+
+
+class MetadataCache:
+    """Caché de resultados de /extract-meta indexada por URL normalizada."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def lookup(self, url):
+        """Devolver la entrada de la URL (fresca o caducada) o None"""
+        return self.store.get(normalize_url(url))
+
+    def save(self, url, payload, headers):
+        """Guardar el payload de una extracción con sus validadores HTTP"""
+        self.store.set(normalize_url(url), payload,
+                       etag=headers.get('ETag'),
+                       last_modified=headers.get('Last-Modified'))
+
+    def revalidated(self, entry):
+        """La página no cambió (304): renovar el TTL de la entrada"""
+        self.store.refresh(entry.key)
+
+
+metadata_cache = MetadataCache(
+    SQLiteCache(METADATA_CACHE_PATH, 'metadata_cache', METADATA_CACHE_TTL,
+                METADATA_CACHE_MAX_ENTRIES, enabled=METADATA_CACHE_ENABLED)
+)
+
+# Resultados de /analyze indexados por el hash de entradas, versión del prompt y modelo
+analysis_cache = SQLiteCache(ANALYSIS_CACHE_PATH, 'analysis_cache', ANALYSIS_CACHE_TTL,
+                             ANALYSIS_CACHE_MAX_ENTRIES, enabled=ANALYSIS_CACHE_ENABLED)
+
+
+def with_cache_status(payload, status):
+    """Copiar el payload indicando en metadata si vino de la caché"""
+    cache_requests.labels('metadata', status).inc()
+    payload = dict(payload)
+    payload['metadata'] = {**payload['metadata'], 'cache': status}
+    return payload
@@ -0,0 +1,131 @@
+"""Detección de la codificación de las páginas descargadas.
+
+BeautifulSoup recibía los bytes tal cual: UnicodeDammit buscaba la
+declaración en una parte del documento proporcional a su tamaño y, si no la
+encontraba, pasaba el detector estadístico por la página entera. Ahora la
+codificación se resuelve antes de parsear, en el orden del estándar HTML:
+
+1. BOM al principio del documento.
+2. charset de la cabecera Content-Type.
+3. <meta charset> (o http-equiv) en los primeros CHARSET_SNIFF_BYTES.
+4. UTF-8 válido o detección estadística (charset-normalizer), solo sobre
+   CHARSET_DETECT_BYTES a partir del primer byte no ASCII.
+
+El coste de la detección no depende del tamaño de la página y el camino
+elegido se devuelve para guardarlo en los metadatos.
+"""
+
+import codecs
+import re
+
+from charset_normalizer import from_bytes
+
+from .config import CHARSET_SNIFF_BYTES, CHARSET_DETECT_BYTES
+
+BOMS = (
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+)
+
+HEADER_CHARSET_RE = re.compile(r'charset\s*=\s*["\']?([^\s;"\']+)', re.I)
+# Cubre <meta charset="x"> y <meta http-equiv="Content-Type" content="text/html; charset=x">
+META_CHARSET_RE = re.compile(rb'<meta\s[^>]*?charset\s*=\s*["\']?\s*([a-zA-Z0-9_.:-]+)', re.I)
+
+# Etiquetas que los navegadores leen como otra codificación (superconjunto)
+ENCODING_OVERRIDES = {
+    'ascii': 'cp1252',
+    'iso8859-1': 'cp1252',
+    'iso8859-9': 'cp1254',
+    'gb2312': 'gb18030',
+    'gbk': 'gb18030',
+}
+# Codificaciones que no se aceptan de una declaración (UTF-7 permite colar etiquetas)
+REJECTED_ENCODINGS = frozenset(('utf-7',))
+
+# Último recurso, como en los navegadores y en UnicodeDammit
+DEFAULT_ENCODING = 'cp1252'
+
+# Codificaciones heredadas que se usan en la web (en caso de empate gana la primera)
+WEB_ENCODINGS = (
+    'cp1252', 'cp1250', 'cp1251', 'cp1253', 'cp1254', 'cp1255', 'cp1256', 'cp1257', 'cp1258',
+    'iso8859_2', 'iso8859_5', 'iso8859_7', 'iso8859_8', 'koi8_r', 'koi8_u', 'cp866', 'cp874',
+    'shift_jis', 'euc_jp', 'iso2022_jp', 'gb18030', 'big5', 'euc_kr',
+)
+
+NON_ASCII_RE = re.compile(rb'[\x80-\xff]')
+
+
+def normalize_encoding(label, from_meta=False):
+    """Nombre de codec de Python para una etiqueta declarada (None si no se conoce)"""
+    try:
+        name = codecs.lookup(label.strip()).name
+    except LookupError:
+        return None
+    if name in REJECTED_ENCODINGS:
+        return None
+    # Un <meta> legible como ASCII no puede estar en UTF-16: se lee como UTF-8
+    if from_meta and name.startswith('utf-16'):
+        return 'utf-8'
+    return ENCODING_OVERRIDES.get(name, name)
+
+
+def header_encoding(content_type):
+    match = HEADER_CHARSET_RE.search(content_type or '')
+    return normalize_encoding(match.group(1)) if match else None
+
+
+def meta_encoding(content, limit=CHARSET_SNIFF_BYTES):
+    match = META_CHARSET_RE.search(content, 0, limit)
+    return normalize_encoding(match.group(1).decode('ascii'), from_meta=True) if match else None
+
+
+def detect_encoding(content, limit=CHARSET_DETECT_BYTES):
+    """(codificación, camino) a partir de `limit` bytes desde el primer carácter no ASCII"""
+    first = NON_ASCII_RE.search(content)
+    if first is None:
+        # Solo ASCII: cualquier codificación compatible da el mismo texto
+        return 'utf-8', 'detected'
+    sample = content[first.start():first.start() + limit]
+    try:
+        # Sin final=True un carácter cortado por el límite no cuenta como error
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8', 'detected'
+    except UnicodeDecodeError:
+        pass
+    matches = from_bytes(sample, cp_isolation=list(WEB_ENCODINGS))
+    best = matches.best()
+    if best is None:
+        return DEFAULT_ENCODING, 'default'
+    # Entre las igual de probables (y las que decodifican la muestra igual) se prefiere
+    # la más común: charset-normalizer no desempata
+    tied = [name for match in matches
+            if match.chaos == best.chaos and match.coherence == best.coherence
+            for name in match.could_be_from_charset]
+    encoding = min(tied, key=lambda name: WEB_ENCODINGS.index(name)
+                   if name in WEB_ENCODINGS else len(WEB_ENCODINGS))
+    return normalize_encoding(encoding) or DEFAULT_ENCODING, 'detected'
+
+
+def resolve_encoding(content, content_type=None):
+    """(codificación, camino, bytes del BOM) de una página
+
+    El camino es 'bom', 'header', 'meta', 'detected' o 'default'.
+    """
+    for bom, encoding in BOMS:
+        if content.startswith(bom):
+            return encoding, 'bom', len(bom)
+    encoding = header_encoding(content_type)
+    if encoding:
+        return encoding, 'header', 0
+    encoding = meta_encoding(content)
+    if encoding:
+        return encoding, 'meta', 0
+    encoding, source = detect_encoding(content)
+    return encoding, source, 0
+
+
+def decode_page(content, content_type=None):
+    """(texto, codificación, camino) de los bytes descargados"""
+    encoding, source, skip = resolve_encoding(content, content_type)
+    return content[skip:].decode(encoding, errors='replace'), encoding, source
@@ -0,0 +1,225 @@
+"""Configuración compartida de la API.
+
+Todos los ajustes se leen de variables de entorno (o del archivo .env) para
+poder cambiarlos en producción sin tocar el código.
+"""
+
+import os
+import tempfile
+from dotenv import load_dotenv
+
+# Cargar el .env antes de leer cualquier ajuste
+load_dotenv()
+
+
+def data_path(name):
+    """Archivo SQLite por defecto de un almacén: cada uno tiene el suyo para no compartir
+    el bloqueo de escritura del WAL"""
+    return os.path.join(tempfile.gettempdir(), f"serp_title_{name}.sqlite3")
+
+
+# Descarga de páginas para /extract-meta
+# Tiempo máximo (segundos) para descargar una página
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "10"))
+# Tamaño de cada bloque leído del socket
+FETCH_CHUNK_SIZE = int(os.getenv("FETCH_CHUNK_SIZE", "16384"))
+# Bytes extra que se leen después de </head> (h1, categorías y etiquetas de WordPress)
+FETCH_BODY_BUDGET = int(os.getenv("FETCH_BODY_BUDGET", str(512 * 1024)))
+# Límite absoluto de bytes descargados por página
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(2 * 1024 * 1024)))
+# Bytes que se leen del cuerpo de una redirección para reutilizar la conexión (si hay más, se cierra)
+FETCH_REDIRECT_DRAIN_BYTES = int(os.getenv("FETCH_REDIRECT_DRAIN_BYTES", "65536"))
+
+# Detección de la codificación: bytes en los que se busca <meta charset> y bytes
+# que se pasan al detector estadístico si la página no declara ninguna
+CHARSET_SNIFF_BYTES = int(os.getenv("CHARSET_SNIFF_BYTES", "4096"))
+CHARSET_DETECT_BYTES = int(os.getenv("CHARSET_DETECT_BYTES", "65536"))
+
+# Backend de parseo del HTML: 'events' (tokenizador sin árbol), 'lxml' (requiere el paquete lxml)
+# o 'html.parser' (árbol completo de BeautifulSoup). Todos dan los mismos metadatos.
+HTML_PARSER = os.getenv("HTML_PARSER", "events").lower()
+
+# Cliente HTTP compartido para las descargas de origen
+# Número de dominios con pool propio y conexiones keep-alive por dominio
+UPSTREAM_POOL_HOSTS = int(os.getenv("UPSTREAM_POOL_HOSTS", "32"))
+UPSTREAM_POOL_MAXSIZE = int(os.getenv("UPSTREAM_POOL_MAXSIZE", "4"))
+# Esperar a una conexión libre en lugar de abrir más de UPSTREAM_POOL_MAXSIZE
+UPSTREAM_POOL_BLOCK = os.getenv("UPSTREAM_POOL_BLOCK", "false").lower() == "true"
+# Timeouts separados de conexión y lectura (segundos)
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "3.05"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", str(FETCH_TIMEOUT)))
+# HTTP/2 para el cliente asíncrono (requiere el paquete h2)
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "false").lower() == "true"
+# Redirecciones máximas (cada salto se valida contra SSRF)
+UPSTREAM_MAX_REDIRECTS = int(os.getenv("UPSTREAM_MAX_REDIRECTS", "10"))
+
+# Caché DNS de la protección SSRF (segundos y número de nombres)
+DNS_CACHE_TTL = float(os.getenv("DNS_CACHE_TTL", "60"))
+DNS_NEGATIVE_TTL = float(os.getenv("DNS_NEGATIVE_TTL", "5"))
+DNS_CACHE_MAX_ENTRIES = int(os.getenv("DNS_CACHE_MAX_ENTRIES", "4096"))
+
+# Extracción por lotes (/extract-meta/batch): se atiende dentro de la petición, así que
+# debe terminar antes del timeout del worker (30 s); las listas largas van a /jobs
+# Número máximo de URLs por petición
+BATCH_MAX_URLS = int(os.getenv("BATCH_MAX_URLS", "500"))
+# Segundos máximos de un lote; las URLs que no terminan a tiempo se devuelven como error
+BATCH_MAX_SECONDS = float(os.getenv("BATCH_MAX_SECONDS", "20"))
+# Descargas simultáneas en total y por dominio
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "50"))
+BATCH_PER_HOST_CONCURRENCY = int(os.getenv("BATCH_PER_HOST_CONCURRENCY", "4"))
+
+# Rastreo de sitemaps (/extract-meta/sitemap): se atiende dentro de la petición, así que
+# el rastreo se corta a los SITEMAP_MAX_SECONDS (antes del timeout de 30 s del worker)
+SITEMAP_MAX_SECONDS = float(os.getenv("SITEMAP_MAX_SECONDS", "20"))
+# URLs máximas por rastreo y sitemaps máximos que se leen de un índice
+SITEMAP_MAX_URLS = int(os.getenv("SITEMAP_MAX_URLS", "1000"))
+SITEMAP_MAX_SITEMAPS = int(os.getenv("SITEMAP_MAX_SITEMAPS", "1000"))
+# Tamaño máximo de un sitemap descomprimido (el protocolo permite 50 MB) y tiempo máximo
+# para descargarlo (segundos)
+SITEMAP_MAX_BYTES = int(os.getenv("SITEMAP_MAX_BYTES", str(50 * 1024 * 1024)))
+SITEMAP_FETCH_TIMEOUT = float(os.getenv("SITEMAP_FETCH_TIMEOUT", "15"))
+# Bytes del sitemap que se guardan en memoria antes de pasar a un archivo temporal
+SITEMAP_SPOOL_BYTES = int(os.getenv("SITEMAP_SPOOL_BYTES", str(1024 * 1024)))
+# Extracciones simultáneas en total y por dominio
+SITEMAP_CONCURRENCY = int(os.getenv("SITEMAP_CONCURRENCY", "16"))
+SITEMAP_PER_HOST_CONCURRENCY = int(os.getenv("SITEMAP_PER_HOST_CONCURRENCY", "4"))
+
+# Caché de metadatos compartida entre workers (SQLite)
+METADATA_CACHE_ENABLED = os.getenv("METADATA_CACHE_ENABLED", "true").lower() == "true"
+METADATA_CACHE_PATH = os.getenv("METADATA_CACHE_PATH", data_path("cache"))
+# Segundos que una entrada se considera fresca
+METADATA_CACHE_TTL = int(os.getenv("METADATA_CACHE_TTL", "3600"))
+# Número máximo de entradas (se expulsan las usadas hace más tiempo)
+METADATA_CACHE_MAX_ENTRIES = int(os.getenv("METADATA_CACHE_MAX_ENTRIES", "10000"))
+
+# Caché de resultados de /analyze
+ANALYSIS_CACHE_ENABLED = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() == "true"
+ANALYSIS_CACHE_PATH = os.getenv("ANALYSIS_CACHE_PATH", data_path("analysis"))
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", str(7 * 86400)))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "50000"))
+
+# Índice de títulos y descripciones casi duplicados (/duplicates)
+DUPLICATES_ENABLED = os.getenv("DUPLICATES_ENABLED", "true").lower() == "true"
+DUPLICATES_PATH = os.getenv("DUPLICATES_PATH", data_path("duplicates"))
+# Similitud (Jaccard estimada) mínima para considerar dos textos casi duplicados
+DUPLICATES_THRESHOLD = float(os.getenv("DUPLICATES_THRESHOLD", "0.8"))
+# Bandas de LSH (divisor de 64): más bandas encuentran más pares con similitud baja
+DUPLICATES_BANDS = int(os.getenv("DUPLICATES_BANDS", "16"))
+# Número máximo de páginas guardadas (se borran las actualizadas hace más tiempo)
+DUPLICATES_MAX_PAGES = int(os.getenv("DUPLICATES_MAX_PAGES", "200000"))
+
+# Análisis masivo (/analyze/bulk): se atiende dentro de la petición, así que el lote
+# debe terminar antes del timeout del worker (30 s); los lotes grandes van a /jobs
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "50"))
+# Segundos máximos de un lote; los elementos que no empiezan a tiempo se devuelven como error
+BULK_MAX_SECONDS = float(os.getenv("BULK_MAX_SECONDS", "20"))
+# Llamadas simultáneas a OpenAI
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "8"))
+# Reintentos ante 429/5xx y backoff exponencial (segundos)
+BULK_MAX_RETRIES = int(os.getenv("BULK_MAX_RETRIES", "5"))
+BULK_BACKOFF_BASE = float(os.getenv("BULK_BACKOFF_BASE", "1"))
+BULK_BACKOFF_MAX = float(os.getenv("BULK_BACKOFF_MAX", "30"))
+# Elementos por petición de /score (puntuación local, sin OpenAI)
+SCORE_MAX_ITEMS = int(os.getenv("SCORE_MAX_ITEMS", "5000"))
+
+# Trabajos en segundo plano (/jobs): cola persistente en SQLite
+JOBS_PATH = os.getenv("JOBS_PATH", data_path("jobs"))
+# Hilos que ejecutan trabajos en cada worker de gunicorn (0 = solo con `python -m api.jobs`)
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "1"))
+# Elementos (URLs o pares título/descripción) por trabajo y trabajos sin terminar por usuario
+JOBS_MAX_ITEMS = int(os.getenv("JOBS_MAX_ITEMS", "5000"))
+JOBS_MAX_PENDING = int(os.getenv("JOBS_MAX_PENDING", "3"))
+# Duración máxima de cada intento (segundos) y gasto máximo en OpenAI de un trabajo (USD)
+JOBS_MAX_SECONDS = float(os.getenv("JOBS_MAX_SECONDS", "3600"))
+JOBS_MAX_LLM_DOLLARS = float(os.getenv("JOBS_MAX_LLM_DOLLARS", "1.0"))
+# Descargas o llamadas a OpenAI simultáneas de cada trabajo
+JOBS_CONCURRENCY = int(os.getenv("JOBS_CONCURRENCY", "8"))
+# Intentos antes de pasar a la cola de fallidos ('dead') y espera base entre intentos (segundos)
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+JOBS_RETRY_BACKOFF = float(os.getenv("JOBS_RETRY_BACKOFF", "30"))
+# Reserva de un trabajo en ejecución: se renueva mientras avanza y, si el proceso muere,
+# otro worker lo retoma al caducar
+JOBS_LEASE_SECONDS = float(os.getenv("JOBS_LEASE_SECONDS", "60"))
+# Espera entre consultas cuando la cola está vacía (segundos)
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "1"))
+# Tiempo que se guardan los trabajos terminados y sus resultados (segundos)
+JOBS_RETENTION_SECONDS = int(os.getenv("JOBS_RETENTION_SECONDS", str(7 * 86400)))
+# Duración de /jobs/<id>/events, por debajo del timeout de gunicorn (el cliente vuelve a conectar)
+JOBS_STREAM_SECONDS = float(os.getenv("JOBS_STREAM_SECONDS", "25"))
+
+# Clientes de OpenAI reutilizables (uno por API key)
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+# Conexiones keep-alive por cliente
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+# Número máximo de clientes y segundos de inactividad antes de expulsarlos
+OPENAI_CLIENT_CACHE_SIZE = int(os.getenv("OPENAI_CLIENT_CACHE_SIZE", "64"))
+OPENAI_CLIENT_IDLE_TTL = float(os.getenv("OPENAI_CLIENT_IDLE_TTL", "900"))
+
+# Análisis estructurado (/analyze con structured): intentos de reparación de un campo que
+# incumple los límites (cada uno es una llamada más a OpenAI)
+STRUCTURED_MAX_REPAIRS = int(os.getenv("STRUCTURED_MAX_REPAIRS", "2"))
+
+# Almacenamiento de los límites de uso (Flask-Limiter) compartido entre workers
+# sqlite:///ruta (un servidor), redis://host:puerto/0 (varios servidores) o memory://
+RATELIMIT_STORAGE_URI = os.getenv(
+    "RATELIMIT_STORAGE_URI",
+    "sqlite:///" + data_path("limits"))
+
+# Protección contra fuerza bruta en /set-key
+# 'sqlite' (compartido entre workers) o 'memory' (por proceso)
+BRUTE_FORCE_BACKEND = os.getenv("BRUTE_FORCE_BACKEND", "sqlite").lower()
+BRUTE_FORCE_PATH = os.getenv("BRUTE_FORCE_PATH", data_path("brute_force"))
+# Intentos fallidos permitidos y duración del bloqueo (también es la vida de un contador)
+BRUTE_FORCE_MAX_ATTEMPTS = int(os.getenv("BRUTE_FORCE_MAX_ATTEMPTS", "5"))
+BRUTE_FORCE_BLOCK_SECONDS = int(os.getenv("BRUTE_FORCE_BLOCK_SECONDS", str(15 * 60)))
+# Número máximo de IPs guardadas
+BRUTE_FORCE_MAX_ENTRIES = int(os.getenv("BRUTE_FORCE_MAX_ENTRIES", "100000"))
+
+# Cuotas por usuario (cubos de tokens que se rellenan a lo largo del periodo)
+QUOTA_ENABLED = os.getenv("QUOTA_ENABLED", "true").lower() == "true"
+# 'sqlite' (compartido entre workers) o 'memory' (por proceso)
+QUOTA_BACKEND = os.getenv("QUOTA_BACKEND", "sqlite").lower()
+QUOTA_PATH = os.getenv("QUOTA_PATH", data_path("quotas"))
+QUOTA_MAX_ENTRIES = int(os.getenv("QUOTA_MAX_ENTRIES", "100000"))
+QUOTA_PERIOD_SECONDS = int(os.getenv("QUOTA_PERIOD_SECONDS", "86400"))
+# Extracciones (una por URL descargada) y análisis por periodo, y gasto máximo en OpenAI
+# (USD) por periodo (0 = sin límite)
+QUOTA_EXTRACT_LIMIT = float(os.getenv("QUOTA_EXTRACT_LIMIT", "3"))
+QUOTA_ANALYZE_LIMIT = float(os.getenv("QUOTA_ANALYZE_LIMIT", "3"))
+QUOTA_LLM_DOLLARS = float(os.getenv("QUOTA_LLM_DOLLARS", "0.25"))
+# Gasto estimado (USD) que se reserva por análisis antes de llamar a OpenAI; al terminar
+# se cobra el coste real y se devuelve lo que sobra
+QUOTA_LLM_RESERVE = float(os.getenv("QUOTA_LLM_RESERVE", "0.01"))
+
+# Sesiones en el servidor
+# 'sqlite' (LRU en memoria + tabla compartida), 'memory' (por proceso) o 'filesystem' (Flask-Session)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite").lower()
+SESSION_PATH = os.getenv("SESSION_PATH", data_path("sessions"))
+# Sesiones en la LRU de cada worker y segundos entre barridos de las caducadas
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "300"))
+
+# Modo de servidor asíncrono (ASGI)
+# Peticiones simultáneas por proceso en /extract-meta y /analyze antes de responder 503
+ASYNC_MAX_IN_FLIGHT = int(os.getenv("ASYNC_MAX_IN_FLIGHT", "1000"))
+# Conexiones simultáneas del cliente httpx compartido para las descargas
+ASYNC_UPSTREAM_CONNECTIONS = int(os.getenv("ASYNC_UPSTREAM_CONNECTIONS", "200"))
+# Hilos por proceso para las rutas de Flask que no tienen versión asíncrona
+ASYNC_WSGI_THREADS = int(os.getenv("ASYNC_WSGI_THREADS", "32"))
+
+# Métricas de Prometheus en /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Si se define, /metrics y /api/pool-stats exigen la cabecera "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Registro estructurado (JSON por línea en stderr)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Registros en cola antes de empezar a descartar (nunca se bloquea la petición)
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Fracción de los registros de éxito (análisis completados, accesos 2xx/3xx) que se escriben
+LOG_SUCCESS_SAMPLE_RATE = float(os.getenv("LOG_SUCCESS_SAMPLE_RATE", "0.1"))
+# Caracteres máximos por campo y por traza de error
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "2000"))
+LOG_MAX_TRACEBACK_CHARS = int(os.getenv("LOG_MAX_TRACEBACK_CHARS", "8000"))
@@ -0,0 +1,330 @@
+"""Índice de títulos y meta descriptions casi duplicados por dominio.
+
+Cada página extraída (/extract-meta, /extract-meta/batch,
+/extract-meta/sitemap y los trabajos de extracción) se guarda en SQLite a
+nombre de quien la extrajo (su titular de cuota), que es el único que la ve
+en los informes, con su título, su descripción y una firma MinHash de cada
+texto: BINS enteros de 32 bits calculados sobre sus n-gramas de caracteres.
+La fracción de posiciones en la que dos firmas coinciden estima la similitud
+de Jaccard de los textos. La firma se calcula con una sola permutación (cada
+n-grama cae en una cubeta y se guarda el mínimo de cada una) y las cubetas
+vacías se rellenan con densificación óptima, así que cuesta una pasada por
+los n-gramas y no una por permutación.
+
+Al consultar un dominio sus firmas se cargan en un array plano (256 bytes
+por texto) y se agrupan con LSH: cada firma se divide en bandas y solo se
+comparan las páginas que coinciden en una banda completa, así que el coste
+es casi lineal en el número de páginas en lugar de comparar todos los pares.
+"""
+
+import logging
+import os
+import random
+import re
+import sqlite3
+import threading
+import unicodedata
+import zlib
+from array import array
+from collections import Counter, defaultdict
+from operator import eq
+from urllib.parse import urlsplit
+
+from .cache import normalize_url
+from .config import (DUPLICATES_ENABLED, DUPLICATES_PATH, DUPLICATES_THRESHOLD, DUPLICATES_BANDS,
+                     DUPLICATES_MAX_PAGES)
+
+logger = logging.getLogger(__name__)
+
+# Campo del índice -> (clave del payload de /extract-meta, texto que pone el extractor si falta)
+FIELDS = {
+    'title': ('title', 'Title not found'),
+    'description': ('meta_description', 'Meta description not found'),
+}
+
+# Longitud de los n-gramas de caracteres y cubetas de la firma (potencia de 2)
+SHINGLE_SIZE = 4
+BIN_BITS = 6
+BINS = 1 << BIN_BITS
+# Mezcla multiplicativa del CRC32 de cada n-grama: los bits altos eligen la cubeta y los
+# 32 siguientes son el valor
+MIX = 0x9E3779B97F4A7C15
+MASK64 = (1 << 64) - 1
+EMPTY = 1 << 32
+# Orden fijo en el que cada cubeta vacía toma el valor de otra (densificación óptima). La
+# semilla es fija para que las firmas guardadas valgan para todos los procesos
+SEED = 20240611
+_rng = random.Random(SEED)
+DENSIFY_ORDER = tuple(tuple(_rng.sample(range(BINS), BINS)) for _ in range(BINS))
+
+# Páginas de un cubo con las que se compara cada página (un cubo enorme no es cuadrático)
+MAX_LEADERS = 4
+# Páginas que se listan por grupo (el tamaño se da completo)
+MAX_CLUSTER_PAGES = 100
+# Variables por consulta de SQLite
+SQLITE_BATCH = 500
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """Texto comparable: NFKC, sin mayúsculas y con los espacios reducidos"""
+    return WHITESPACE_RE.sub(' ', unicodedata.normalize('NFKC', text).casefold()).strip()
+
+
+def shingle_hashes(text):
+    """Hashes (CRC32) de los n-gramas de caracteres de un texto normalizado"""
+    if len(text) <= SHINGLE_SIZE:
+        return {zlib.crc32(text.encode())}
+    return {zlib.crc32(text[i:i + SHINGLE_SIZE].encode())
+            for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text):
+    """Firma MinHash (bytes) de un texto, o None si está vacío"""
+    text = normalize_text(text)
+    if not text:
+        return None
+    bins = [EMPTY] * BINS
+    for shingle in shingle_hashes(text):
+        mixed = (shingle * MIX) & MASK64
+        position = mixed >> (64 - BIN_BITS)
+        value = (mixed >> (32 - BIN_BITS)) & 0xFFFFFFFF
+        if value < bins[position]:
+            bins[position] = value
+    if EMPTY in bins:
+        filled = bins
+        bins = [value if value != EMPTY else
+                next(filled[other] for other in DENSIFY_ORDER[position] if filled[other] != EMPTY)
+                for position, value in enumerate(filled)]
+    return array('I', bins).tobytes()
+
+
+def site_domain(value):
+    """Dominio de una URL (o de un dominio escrito sin esquema)"""
+    value = (value or '').strip()
+    if '://' not in value:
+        value = 'http://' + value
+    try:
+        return (urlsplit(value).hostname or '').rstrip('.')
+    except ValueError:
+        return ''
+
+
+class DuplicateIndex:
+    """Firmas MinHash en arrays planos y agrupación de casi duplicados con LSH."""
+
+    def __init__(self, bands=DUPLICATES_BANDS, threshold=DUPLICATES_THRESHOLD):
+        if bands <= 0 or BINS % bands:
+            raise ValueError(f"DUPLICATES_BANDS must divide {BINS}")
+        self.bands = bands
+        self.rows = BINS // bands
+        self.threshold = threshold
+        self.ids = array('q')
+        self.signatures = array('I')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, page_id, signature):
+        self.ids.append(page_id)
+        self.signatures.frombytes(signature)
+
+    def similarity(self, i, j):
+        """Jaccard estimada entre las páginas en las posiciones i y j"""
+        sig = self.signatures
+        a, b = i * BINS, j * BINS
+        return sum(map(eq, sig[a:a + BINS], sig[b:b + BINS])) / BINS
+
+    def candidate_groups(self):
+        """Posiciones que coinciden en una banda completa, banda a banda"""
+        count = len(self.ids)
+        data = self.signatures.tobytes()
+        stride = BINS * self.signatures.itemsize
+        width = self.rows * self.signatures.itemsize
+        for band in range(self.bands):
+            offset = band * width
+            keys = array('q', [hash(data[start:start + width])
+                               for start in range(offset, count * stride, stride)])
+            # Solo se agrupan las claves repetidas (la mayoría de las páginas no tiene pareja)
+            repeated = {key for key, times in Counter(keys).items() if times > 1}
+            groups = defaultdict(list)
+            for position, key in enumerate(keys):
+                if key in repeated:
+                    groups[key].append(position)
+            yield from groups.values()
+
+    def clusters(self):
+        """Grupos de posiciones casi duplicadas, el más grande primero"""
+        parent = array('q', range(len(self.ids)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for group in self.candidate_groups():
+            # Cada página se compara con las primeras distintas del cubo
+            leaders = []
+            for item in group:
+                root = find(item)
+                for leader in leaders:
+                    leader_root = find(leader)
+                    if leader_root == root:
+                        break
+                    if self.similarity(leader, item) >= self.threshold:
+                        parent[root] = leader_root
+                        break
+                else:
+                    if len(leaders) < MAX_LEADERS:
+                        leaders.append(item)
+
+        roots = array('q', (find(i) for i in range(len(self.ids))))
+        sizes = Counter(roots)
+        groups = defaultdict(list)
+        for position, root in enumerate(roots):
+            if sizes[root] > 1:
+                groups[root].append(position)
+        return sorted(groups.values(), key=len, reverse=True)
+
+
+class DuplicateStore:
+    """Textos y firmas de las páginas extraídas, compartidos entre workers (SQLite)."""
+
+    def __init__(self, path, max_pages, bands=DUPLICATES_BANDS, threshold=DUPLICATES_THRESHOLD,
+                 enabled=True):
+        # Comprobar la configuración al arrancar
+        DuplicateIndex(bands, threshold)
+        self.enabled = enabled
+        self.path = path
+        self.max_pages = max_pages
+        self.bands = bands
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+
+    def connect(self):
+        """Abrir (o reabrir tras un fork) la conexión de este proceso"""
+        pid = os.getpid()
+        if self.conn is None or self.pid != pid:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(page_signatures)')}
+            if columns and 'subject' not in columns:
+                # Tabla de antes de separar las páginas por usuario: sus filas no tienen dueño
+                conn.execute('DROP TABLE page_signatures')
+            conn.execute('''CREATE TABLE IF NOT EXISTS page_signatures (
+                subject TEXT NOT NULL,
+                url TEXT NOT NULL,
+                domain TEXT NOT NULL,
+                title TEXT,
+                description TEXT,
+                title_signature BLOB,
+                description_signature BLOB,
+                PRIMARY KEY (subject, url)
+            )''')
+            conn.execute('CREATE INDEX IF NOT EXISTS page_signatures_domain '
+                         'ON page_signatures (subject, domain)')
+            self.conn = conn
+            self.pid = pid
+        return self.conn
+
+    def record(self, url, payload, subject):
+        """Guardar el título y la descripción de una extracción correcta de `subject`"""
+        if not self.enabled or not subject:
+            return
+        # La URL final: una redirección no es un duplicado de su destino
+        url = normalize_url(payload.get('metadata', {}).get('url_final') or url)
+        domain = site_domain(url)
+        if not domain:
+            return
+        values = []
+        for key, missing in FIELDS.values():
+            text = payload.get(key)
+            if not isinstance(text, str) or text == missing:
+                text = None
+            values += [text, minhash(text) if text else None]
+        try:
+            with self.lock:
+                conn = self.connect()
+                # REPLACE da a la fila un rowid nuevo, así que el rowid ordena por actualización
+                cursor = conn.execute(
+                    'INSERT OR REPLACE INTO page_signatures (subject, url, domain, title, '
+                    'title_signature, description, description_signature) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)', (subject, url, domain, *values))
+                conn.execute('DELETE FROM page_signatures WHERE rowid <= ?',
+                             (cursor.lastrowid - self.max_pages,))
+        except sqlite3.Error as e:
+            logger.warning("Duplicate index write error: %s", e)
+
+    def load(self, subject, domain, field):
+        """Índice con las firmas de un campo de las páginas de `subject` en el dominio"""
+        index = DuplicateIndex(self.bands, self.threshold)
+        with self.lock:
+            rows = self.connect().execute(
+                f'SELECT rowid, {field}_signature FROM page_signatures '
+                f'WHERE subject = ? AND domain = ? AND {field}_signature IS NOT NULL',
+                (subject, domain))
+            for rowid, signature in rows:
+                index.add(rowid, signature)
+        return index
+
+    def texts(self, rowids, field):
+        """rowid -> (url, texto) de las páginas indicadas"""
+        found = {}
+        with self.lock:
+            conn = self.connect()
+            for start in range(0, len(rowids), SQLITE_BATCH):
+                batch = rowids[start:start + SQLITE_BATCH]
+                placeholders = ', '.join('?' * len(batch))
+                found.update((rowid, (url, text)) for rowid, url, text in conn.execute(
+                    f'SELECT rowid, url, {field} FROM page_signatures '
+                    f'WHERE rowid IN ({placeholders})', batch))
+        return found
+
+    def count(self, subject, domain):
+        with self.lock:
+            return self.connect().execute(
+                'SELECT COUNT(*) FROM page_signatures WHERE subject = ? AND domain = ?',
+                (subject, domain)).fetchone()[0]
+
+    def field_report(self, subject, domain, field, limit):
+        """Grupos de un campo: tamaño, similitud mínima con el primero y páginas"""
+        index = self.load(subject, domain, field)
+        clusters = index.clusters()
+        listed = [cluster[:MAX_CLUSTER_PAGES] for cluster in clusters[:limit]]
+        texts = self.texts([index.ids[position] for cluster in listed for position in cluster],
+                           field)
+
+        groups = []
+        for cluster, positions in zip(clusters, listed):
+            pages = [texts.get(index.ids[position]) for position in positions]
+            groups.append({
+                "size": len(cluster),
+                "similarity": round(min(index.similarity(cluster[0], other)
+                                        for other in cluster[1:]), 2),
+                "text": pages[0][1] if pages[0] else None,
+                "pages": [{"url": url, field: text} for url, text in filter(None, pages)],
+            })
+        return {
+            "indexed": len(index),
+            "clusters": len(clusters),
+            "duplicated_pages": sum(len(cluster) for cluster in clusters),
+            "groups": groups,
+        }
+
+    def report(self, subject, domain, limit=100):
+        """Casi duplicados de títulos y descripciones de las páginas de `subject` en un dominio"""
+        return {
+            "domain": domain,
+            "pages": self.count(subject, domain),
+            "threshold": self.threshold,
+            **{field: self.field_report(subject, domain, field, limit) for field in FIELDS},
+        }
+
+
+duplicate_store = DuplicateStore(DUPLICATES_PATH, DUPLICATES_MAX_PAGES, enabled=DUPLICATES_ENABLED)
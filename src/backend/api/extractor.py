@@ -0,0 +1,241 @@
+"""Extracción de metadatos SEO en una sola pasada.
+
+El documento se recorre una única vez recogiendo todas las etiquetas
+candidatas; después se aplican las mismas prioridades de fallback que
+usaba /extract-meta (description, og:title, twitter:title, og:image, etc.).
+"""
+
+import html
+
+from .charset import decode_page
+from .metrics import html_parse_seconds
+from .parsers import DEFAULT_BACKEND, WATCHED_TAGS, parse_elements
+
+# Atributos que identifican cada candidato (por etiqueta)
+MATCH_ATTRS = {
+    'meta': ('name', 'property', 'itemprop'),
+    'link': ('rel',),
+    'a': ('rel',),
+}
+
+# Tabla de campos: lista ordenada de (etiqueta, atributo, valor, atributo a leer).
+# El primer candidato encontrado según este orden es el que se usa.
+FIELDS = {
+    'description': (
+        ('meta', 'name', 'description', 'content'),
+        ('meta', 'property', 'og:description', 'content'),
+        ('meta', 'property', 'twitter:description', 'content'),
+        ('meta', 'itemprop', 'description', 'content'),
+    ),
+    'generator': (
+        ('meta', 'name', 'generator', 'content'),
+    ),
+    'og_title': (
+        ('meta', 'property', 'og:title', 'content'),
+    ),
+    'twitter_title': (
+        ('meta', 'property', 'twitter:title', 'content'),
+        ('meta', 'name', 'twitter:title', 'content'),
+    ),
+    'og_image': (
+        ('meta', 'property', 'og:image', 'content'),
+        ('meta', 'name', 'og:image', 'content'),
+        ('meta', 'property', 'twitter:image', 'content'),
+        ('meta', 'name', 'twitter:image', 'content'),
+    ),
+    'canonical': (
+        ('link', 'rel', 'canonical', 'href'),
+        ('meta', 'property', 'og:url', 'content'),
+    ),
+    'keywords': (
+        ('meta', 'name', 'keywords', 'content'),
+    ),
+}
+
+# Candidatos de los que se guardan todas las apariciones (no solo la primera)
+LIST_KEYS = {
+    'wp_api': ('link', 'rel', 'https://api.w.org/'),
+    'categories': ('a', 'rel', 'category'),
+    'tags': ('a', 'rel', 'tag'),
+}
+
+
+class MetadataExtractor:
+    """Extractor de metadatos guiado por tablas.
+
+    `collect` recorre el documento una sola vez y `resolve` aplica las
+    prioridades. Los elementos solo necesitan `.get(attr)` y `.get_text()`,
+    por lo que sirven tanto etiquetas de BeautifulSoup como otros objetos
+    equivalentes.
+    """
+
+    def __init__(self, fields=FIELDS, list_keys=LIST_KEYS):
+        self.fields = fields
+        self.list_keys = list_keys
+        # Compilar el conjunto de claves (etiqueta, atributo, valor) buscadas
+        self.wanted = set()
+        for candidates in fields.values():
+            for tag, attr, value, _ in candidates:
+                self.wanted.add((tag, attr, value))
+        self.list_lookup = {key: name for name, key in list_keys.items()}
+
+    def collect(self, elements):
+        """Recoger los candidatos de un iterable de elementos en una sola pasada"""
+        first = {}
+        lists = {name: [] for name in self.list_keys}
+        wanted = self.wanted
+        list_lookup = self.list_lookup
+
+        for element in elements:
+            tag = element.name
+            if tag not in WATCHED_TAGS:
+                continue
+
+            if tag == 'title' or tag == 'h1':
+                first.setdefault(tag, element)
+                continue
+
+            for attr in MATCH_ATTRS[tag]:
+                values = element.get(attr)
+                if values is None:
+                    continue
+                if isinstance(values, str):
+                    values = (values,)
+                for value in values:
+                    key = (tag, attr, value)
+                    if key in wanted and key not in first:
+                        first[key] = element
+                    name = list_lookup.get(key)
+                    if name is not None:
+                        lists[name].append(element)
+
+        return first, lists
+
+    def pick(self, first, field):
+        """Devolver (elemento, atributo a leer) del primer candidato de un campo"""
+        for tag, attr, value, read_attr in self.fields[field]:
+            element = first.get((tag, attr, value))
+            if element is not None:
+                return element, read_attr
+        return None, None
+
+    def resolve(self, first, lists, url):
+        """Aplicar las prioridades de fallback y construir (título, metadatos)"""
+        # Extracción del título
+        title = first.get('title')
+        title_text = title.get_text() if title else 'Title not found'
+
+        # Sanitizar salida
+        title_text = html.escape(title_text)
+
+        metadata = {}
+
+        # Meta description - diferentes formatos
+        element, read_attr = self.pick(first, 'description')
+        desc_content = element.get(read_attr) if element else 'Meta description not found'
+        # Sanitizar contenido
+        metadata['description'] = html.escape(desc_content)
+
+        # Detección de plataforma CMS (generator o enlaces a wp-json)
+        is_wordpress = False
+        generator, _ = self.pick(first, 'generator')
+        if generator and 'wordpress' in generator.get('content', '').lower():
+            is_wordpress = True
+        if lists['wp_api']:
+            is_wordpress = True
+
+        metadata['platform'] = 'WordPress' if is_wordpress else 'Unknown'
+
+        # Open Graph title y Twitter title
+        for field in ('og_title', 'twitter_title'):
+            element, read_attr = self.pick(first, field)
+            metadata[field] = element.get(read_attr) if element else title_text
+
+        # Open Graph image - diferentes variantes
+        element, read_attr = self.pick(first, 'og_image')
+        metadata['og_image'] = element.get(read_attr) if element else 'Image not found'
+
+        # Canonical URL - link rel=canonical u og:url
+        element, read_attr = self.pick(first, 'canonical')
+        metadata['canonical'] = element.get(read_attr) if element else url
+
+        # Meta keywords
+        element, read_attr = self.pick(first, 'keywords')
+        metadata['keywords'] = element.get(read_attr) if element else 'Keywords not found'
+
+        # Extracción de categorías y etiquetas para WordPress
+        if is_wordpress:
+            categories = [link.get_text().strip() for link in lists['categories'] if link.get_text()]
+            tags = [link.get_text().strip() for link in lists['tags'] if link.get_text()]
+
+            metadata['categories'] = categories
+            metadata['tags'] = tags
+
+            # Si no hay keywords pero hay etiquetas, usar etiquetas como keywords
+            if metadata['keywords'] == 'Keywords not found' and tags:
+                metadata['keywords'] = ', '.join(tags)
+
+        # H1 (primer encabezado)
+        h1 = first.get('h1')
+        metadata['h1'] = h1.get_text().strip() if h1 else 'H1 not found'
+
+        return title_text, metadata
+
+    def extract(self, soup, url):
+        """Extraer (título, metadatos) de un documento de BeautifulSoup"""
+        return self.extract_elements(soup.descendants, url)
+
+    def extract_elements(self, elements, url):
+        """Extraer (título, metadatos) de los elementos de cualquier backend de parsers"""
+        first, lists = self.collect(elements)
+        return self.resolve(first, lists, url)
+
+
+# Instancia por defecto, compilada una sola vez por proceso
+default_extractor = MetadataExtractor()
+
+
+def extract_metadata(soup, url):
+    """Extraer título y metadatos de un documento ya parseado"""
+    return default_extractor.extract(soup, url)
+
+
+def extract_content(content, url, backend=DEFAULT_BACKEND):
+    """Parsear el HTML con el backend elegido y extraer título y metadatos"""
+    return default_extractor.extract_elements(parse_elements(content, backend), url)
+
+
+def page_response(response, url, response_time, backend=DEFAULT_BACKEND):
+    """Construir (payload, status) de /extract-meta a partir de una descarga"""
+    if response.status_code != 200:
+        return {
+            "error": f"Failed with status code: {response.status_code}",
+            "message": f"Request failed with status code {response.status_code}"
+        }, 500
+
+    with html_parse_seconds.time():
+        markup, encoding, charset_source = decode_page(
+            response.content, response.headers.get('Content-Type'))
+
+        # Extracción de título y metadatos en una sola pasada
+        title_text, metadata = extract_content(markup, url, backend)
+
+    # Información adicional para diagnóstico
+    metadata['response_time'] = f"{response_time:.2f} seconds"
+    metadata['status_code'] = response.status_code
+    metadata['content_type'] = response.headers.get(
+        'Content-Type', 'Unknown')
+    # URL final después de redirecciones
+    metadata['url_final'] = str(response.url)
+    # Bytes descargados y si se cortó la descarga tras </head>
+    metadata['bytes_downloaded'] = len(response.content)
+    metadata['truncated'] = response.truncated
+    # Codificación usada y de dónde salió (bom, header, meta, detected o default)
+    metadata['charset'] = encoding
+    metadata['charset_source'] = charset_source
+
+    return {
+        "title": title_text,
+        "meta_description": metadata['description'],
+        "metadata": metadata
+    }, 200
@@ -0,0 +1,214 @@
+"""Descarga en streaming de páginas para la extracción de metadatos.
+
+En lugar de descargar la página completa, se lee por bloques y se corta la
+conexión en cuanto llega </head> (más un presupuesto configurable de bytes
+para el h1 y los enlaces de categorías/etiquetas de WordPress).
+"""
+
+import time
+from urllib.parse import urljoin
+
+import requests
+
+from .config import (FETCH_TIMEOUT, FETCH_CHUNK_SIZE, FETCH_BODY_BUDGET, FETCH_MAX_BYTES,
+                     FETCH_REDIRECT_DRAIN_BYTES, UPSTREAM_MAX_REDIRECTS)
+from .http_client import get_session, upstream_timeout
+from .validation import validate_url
+from .metrics import upstream_fetch_seconds
+
+# Encabezados que se envían al servidor de origen
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Referer': 'https://www.google.com/'
+}
+
+# Tipos de contenido que se consideran HTML
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+
+HEAD_END = b'</head>'
+
+
+class UnsupportedContentType(Exception):
+    """El servidor de origen no devolvió un documento HTML."""
+
+    def __init__(self, content_type):
+        self.content_type = content_type
+        super().__init__(f"Unsupported Content-Type: {content_type}")
+
+
+class RedirectRejected(Exception):
+    """Una redirección apunta a una URL que no pasa la validación SSRF."""
+
+    def __init__(self, url, payload, status):
+        self.url = url
+        self.payload = payload
+        self.status = status
+        super().__init__(f"Redirect to rejected URL: {url}")
+
+
+class FetchResult:
+    """Resultado de una descarga parcial de una página."""
+
+    def __init__(self, url, status_code, headers, content, truncated, elapsed):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.truncated = truncated
+        self.elapsed = elapsed
+
+
+def is_html_content_type(content_type):
+    """Comprobar si un Content-Type corresponde a HTML (sin cabecera se asume HTML)"""
+    if not content_type:
+        return True
+    media_type = content_type.split(';')[0].strip().lower()
+    return media_type in HTML_CONTENT_TYPES
+
+
+class HeadBuffer:
+    """Acumula bloques hasta </head> más body_budget bytes.
+
+    Sirve tanto para el cliente síncrono como para el asíncrono: `feed`
+    devuelve True cuando ya no hace falta leer más.
+    """
+
+    def __init__(self, body_budget=FETCH_BODY_BUDGET, max_bytes=FETCH_MAX_BYTES):
+        self.buffer = bytearray()
+        self.body_budget = body_budget
+        self.max_bytes = max_bytes
+        self.limit = max_bytes
+        self.head_found = False
+        self.scanned = 0
+
+    def feed(self, chunk):
+        """Añadir un bloque; devuelve True si se alcanzó el límite"""
+        buffer = self.buffer
+        buffer += chunk
+
+        # Buscar </head> solo en la parte nueva (con solapamiento por si
+        # la etiqueta quedó partida entre dos bloques)
+        if not self.head_found:
+            start = max(0, self.scanned - len(HEAD_END))
+            position = buffer[start:].lower().find(HEAD_END)
+            self.scanned = len(buffer)
+            if position != -1:
+                self.head_found = True
+                head_end = start + position + len(HEAD_END)
+                self.limit = min(self.max_bytes, head_end + self.body_budget)
+
+        return len(buffer) >= self.limit
+
+    def content(self):
+        """Contenido leído, recortado al límite"""
+        return bytes(self.buffer[:self.limit])
+
+
+def read_until_head(chunks, body_budget=FETCH_BODY_BUDGET, max_bytes=FETCH_MAX_BYTES, deadline=None):
+    """Leer bloques hasta </head> más body_budget bytes.
+
+    Devuelve una tupla (contenido, truncado).
+    """
+    head = HeadBuffer(body_budget, max_bytes)
+
+    for chunk in chunks:
+        if not chunk:
+            continue
+        done = head.feed(chunk)
+
+        if deadline is not None and time.monotonic() > deadline:
+            raise requests.exceptions.Timeout("Download exceeded timeout")
+
+        if done:
+            return head.content(), True
+
+    return head.content(), False
+
+
+def drain_redirect(response, deadline=None, max_bytes=FETCH_REDIRECT_DRAIN_BYTES):
+    """Vaciar el cuerpo (corto) de una redirección para devolver la conexión al pool
+
+    Si pasa de max_bytes o del tiempo límite la conexión se cierra sin leer el resto.
+    """
+    read = 0
+    try:
+        for chunk in response.iter_content(chunk_size=FETCH_CHUNK_SIZE):
+            read += len(chunk)
+            if read > max_bytes or (deadline is not None and time.monotonic() > deadline):
+                break
+    finally:
+        response.close()
+
+
+def open_stream(url, headers=None, deadline=None, max_redirects=UPSTREAM_MAX_REDIRECTS):
+    """Abrir la respuesta siguiendo las redirecciones a mano.
+
+    Usa la sesión compartida (pool keep-alive) y valida cada salto contra
+    SSRF antes de conectarse a él.
+    """
+    session = get_session()
+    current = url
+
+    for _ in range(max_redirects + 1):
+        if deadline is not None and time.monotonic() > deadline:
+            raise requests.exceptions.Timeout("Download exceeded timeout")
+
+        # Asegurar la verificación de certificados
+        response = session.get(current, headers=headers or DEFAULT_HEADERS,
+                               timeout=upstream_timeout(), verify=True,
+                               stream=True, allow_redirects=False)
+        if not response.is_redirect:
+            return response
+
+        location = response.headers['Location']
+        drain_redirect(response, deadline)
+
+        current = urljoin(current, location)
+        rejected = validate_url(current)
+        if rejected:
+            payload, status = rejected
+            raise RedirectRejected(current, payload, status)
+
+    raise requests.exceptions.TooManyRedirects(f"Exceeded {max_redirects} redirects")
+
+
+def fetch_head(url, headers=None, timeout=FETCH_TIMEOUT,
+               body_budget=FETCH_BODY_BUDGET, max_bytes=FETCH_MAX_BYTES):
+    """Descargar una página por bloques y cerrar la conexión tras </head>"""
+    start_time = time.time()
+    deadline = time.monotonic() + timeout
+
+    response = open_stream(url, headers, deadline)
+    try:
+        content = b''
+        truncated = False
+
+        if response.status_code == 200:
+            # Comprobar el tipo de contenido antes de descargar el cuerpo
+            content_type = response.headers.get('Content-Type')
+            if not is_html_content_type(content_type):
+                raise UnsupportedContentType(content_type)
+
+            content, truncated = read_until_head(
+                response.iter_content(chunk_size=FETCH_CHUNK_SIZE),
+                body_budget=body_budget,
+                max_bytes=max_bytes,
+                deadline=deadline
+            )
+
+        elapsed = time.time() - start_time
+        upstream_fetch_seconds.observe(elapsed)
+        return FetchResult(
+            url=response.url,
+            status_code=response.status_code,
+            headers=response.headers,
+            content=content,
+            truncated=truncated,
+            elapsed=elapsed
+        )
+    finally:
+        # Si la página se leyó entera la conexión vuelve al pool; si se cortó
+        # tras </head> se cierra sin leer el resto del cuerpo
+        response.close()
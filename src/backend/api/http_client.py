@@ -0,0 +1,240 @@
+"""Cliente HTTP compartido (por worker) para descargar páginas de origen.
+
+Se reutiliza una única sesión de requests con pool de conexiones keep-alive,
+de modo que las peticiones seguidas al mismo sitio no repiten el handshake
+TCP/TLS. También lleva estadísticas del pool (aciertos, conexiones nuevas,
+expulsiones) para poder observarlo.
+
+Todas las conexiones (síncronas y asíncronas) se abren contra la IP ya
+validada por la caché DNS (ver resolver.py), nunca contra una resolución nueva.
+"""
+
+import os
+import socket
+import sys
+import threading
+
+import httpcore
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+from urllib3.util import connection
+
+from .config import (UPSTREAM_POOL_HOSTS, UPSTREAM_POOL_MAXSIZE, UPSTREAM_CONNECT_TIMEOUT,
+                     UPSTREAM_READ_TIMEOUT, UPSTREAM_HTTP2, UPSTREAM_POOL_BLOCK)
+from .resolver import dns_cache
+
+
+class PoolStats:
+    """Contadores del pool de conexiones (protegidos por un lock)."""
+
+    FIELDS = ('requests', 'hits', 'new_connections', 'discarded', 'evicted_pools')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = dict.fromkeys(self.FIELDS, 0)
+
+    def incr(self, field):
+        with self.lock:
+            self.counters[field] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+stats = PoolStats()
+
+
+class PinnedConnectionMixin:
+    """Conectar a la IP validada por la caché DNS en lugar de volver a resolver.
+
+    `self.host` sigue siendo el nombre original, así que SNI y la
+    verificación del certificado no cambian.
+    """
+
+    def _new_conn(self):
+        try:
+            address = dns_cache.pinned_address(self.host)
+            sock = connection.create_connection(
+                (address, self.port),
+                self.timeout,
+                source_address=self.source_address,
+                socket_options=self.socket_options,
+            )
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        except socket.timeout as e:
+            raise ConnectTimeoutError(
+                self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})"
+            ) from e
+        except OSError as e:
+            raise NewConnectionError(self, f"Failed to establish a new connection: {e}") from e
+
+        sys.audit("http.client.connect", self, self.host, self.port)
+        return sock
+
+
+class PinnedHTTPConnection(PinnedConnectionMixin, HTTPConnection):
+    pass
+
+
+class PinnedHTTPSConnection(PinnedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class StatsPoolMixin:
+    """Cuenta conexiones nuevas, reutilizadas y descartadas de un pool de urllib3."""
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        stats.incr('requests')
+        # Una conexión con socket abierto es un acierto; si no, se abrirá una nueva
+        stats.incr('hits' if getattr(conn, 'sock', None) is not None else 'new_connections')
+        return conn
+
+    def _put_conn(self, conn):
+        # Si el pool del dominio está lleno, urllib3 cierra la conexión
+        if conn is not None and self.pool is not None and self.pool.full():
+            stats.incr('discarded')
+        return super()._put_conn(conn)
+
+
+class StatsHTTPConnectionPool(StatsPoolMixin, HTTPConnectionPool):
+    ConnectionCls = PinnedHTTPConnection
+
+
+class StatsHTTPSConnectionPool(StatsPoolMixin, HTTPSConnectionPool):
+    ConnectionCls = PinnedHTTPSConnection
+
+
+class PooledAdapter(HTTPAdapter):
+    """Adaptador de requests con pools instrumentados y límite por dominio."""
+
+    pool_classes = {
+        'http': StatsHTTPConnectionPool,
+        'https': StatsHTTPSConnectionPool,
+    }
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = dict(self.pool_classes)
+
+        # Contar los pools de dominio expulsados por el LRU del PoolManager
+        pools = self.poolmanager.pools
+        dispose = pools.dispose_func
+
+        def dispose_pool(pool):
+            stats.incr('evicted_pools')
+            if dispose:
+                dispose(pool)
+
+        pools.dispose_func = dispose_pool
+
+
+class UpstreamSession(requests.Session):
+    """Sesión que no sigue redirecciones: fetcher.open_stream las valida y sigue a mano."""
+
+    def resolve_redirects(self, resp, req, **kwargs):
+        # Con allow_redirects=False, requests llama aquí para rellenar Response.next y antes
+        # lee el cuerpo entero de la redirección, sin límite de bytes ni de tiempo
+        return iter(())
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Devolver la sesión del worker actual (se recrea tras un fork)"""
+    global _session, _session_pid
+
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                session = UpstreamSession()
+                adapter = PooledAdapter(pool_connections=UPSTREAM_POOL_HOSTS,
+                                        pool_maxsize=UPSTREAM_POOL_MAXSIZE,
+                                        pool_block=UPSTREAM_POOL_BLOCK)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+                _session_pid = pid
+                stats.reset()
+    return _session
+
+
+def upstream_timeout():
+    """Timeouts separados de conexión y lectura para requests"""
+    return (UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT)
+
+
+def http2_available():
+    """HTTP/2 solo se activa si se pidió y el paquete h2 está instalado"""
+    if not UPSTREAM_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class PinnedAsyncBackend(httpcore.AsyncNetworkBackend):
+    """Backend de red de httpcore que conecta a la IP validada por la caché DNS.
+
+    httpcore sigue usando el nombre original para SNI y el certificado.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def connect_tcp(self, host, port, **kwargs):
+        try:
+            address = await dns_cache.pinned_address_async(host)
+        except socket.gaierror as e:
+            # httpx lo traduce a httpx.ConnectError, igual que un fallo de conexión
+            raise httpcore.ConnectError(str(e)) from e
+        return await self.backend.connect_tcp(address, port, **kwargs)
+
+    async def connect_unix_socket(self, path, **kwargs):
+        return await self.backend.connect_unix_socket(path, **kwargs)
+
+    async def sleep(self, seconds):
+        await self.backend.sleep(seconds)
+
+
+def async_transport(max_connections):
+    """Transporte de httpx con límites del pool y conexiones fijadas a la IP validada"""
+    transport = httpx.AsyncHTTPTransport(
+        verify=True,
+        http2=http2_available(),
+        limits=httpx.Limits(max_connections=max_connections,
+                            max_keepalive_connections=max_connections),
+    )
+    # httpx no permite pasar el backend de red, así que se envuelve el del pool
+    pool = transport._pool
+    pool._network_backend = PinnedAsyncBackend(pool._network_backend)
+    return transport
+
+
+def async_client_options(max_connections):
+    """Opciones comunes para los httpx.AsyncClient de las descargas concurrentes"""
+    return {
+        'transport': async_transport(max_connections),
+        'timeout': httpx.Timeout(UPSTREAM_READ_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+    }
+
+
+def pool_stats():
+    """Estadísticas del pool y de la caché DNS del worker actual"""
+    return {'pid': os.getpid(), **stats.snapshot(), 'dns': dns_cache.snapshot()}
@@ -0,0 +1,646 @@
+"""Cola persistente de trabajos en segundo plano (SQLite, sin broker externo).
+
+Una auditoría larga no cabe en una petición: gunicorn mata al worker a los
+30 segundos. POST /jobs guarda el trabajo en la tabla `jobs` y devuelve su
+id. Los hilos de JobPool (dentro de cada worker de gunicorn o en un proceso
+aparte con `python -m api.jobs`) lo reservan, lo ejecutan y guardan cada
+resultado en `job_results` según termina, así que el progreso se puede
+consultar o seguir en directo y un reintento continúa donde se quedó.
+
+- La reserva dura JOBS_LEASE_SECONDS y se renueva mientras el trabajo se
+  ejecuta; si el proceso muere, otro worker lo retoma al caducar.
+- Un error del trabajo se reintenta con backoff exponencial hasta
+  JOBS_MAX_ATTEMPTS intentos. Después queda en estado 'dead' (cola de
+  fallidos) y solo vuelve a la cola con POST /jobs/<id>/retry.
+- Cada trabajo tiene sus propios límites: elementos, duración de cada
+  intento, concurrencia y gasto en OpenAI.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import signal
+import sqlite3
+import threading
+import time
+import uuid
+from base64 import b64decode, b64encode
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+from Crypto.Cipher import AES
+
+from .config import (JOBS_PATH, JOBS_WORKERS, JOBS_MAX_SECONDS, JOBS_MAX_LLM_DOLLARS,
+                     JOBS_CONCURRENCY, JOBS_MAX_ATTEMPTS, JOBS_RETRY_BACKOFF, JOBS_LEASE_SECONDS,
+                     JOBS_POLL_INTERVAL, JOBS_RETENTION_SECONDS, BATCH_PER_HOST_CONCURRENCY,
+                     QUOTA_LLM_RESERVE)
+from .batch import build_async_client, extract_page_async
+from .bulk import BulkAnalyzer
+from .metrics import jobs_finished
+from .openai_clients import openai_clients
+from .quotas import quota_engine
+from .scoring import score_batch
+
+logger = logging.getLogger(__name__)
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+# Error que no se reintenta (p. ej. gasto máximo superado)
+FAILED = 'failed'
+# Intentos agotados: cola de fallidos
+DEAD = 'dead'
+CANCELLED = 'cancelled'
+ACTIVE = (QUEUED, RUNNING)
+RETRYABLE = (FAILED, DEAD, CANCELLED)
+
+# Cada cuántos segundos se borran los trabajos terminados que superan JOBS_RETENTION_SECONDS
+PRUNE_INTERVAL = 3600
+
+
+class JobInterrupted(Exception):
+    """El trabajo debe parar: 'cancelled', 'timeout', 'shutdown' o 'lost' (reserva perdida)."""
+
+    def __init__(self, reason):
+        self.reason = reason
+        super().__init__(reason)
+
+
+class JobFailed(Exception):
+    """Error del trabajo que no se reintenta."""
+
+
+def secret_key():
+    passphrase = os.getenv("ENCRYPTION_KEY")
+    if not passphrase:
+        raise ValueError("Encryption key is missing")
+    return hashlib.sha256(passphrase.encode()).digest()
+
+
+def seal_secret(secret):
+    """Cifrar la API key de la sesión para guardarla con el trabajo (AES-GCM)"""
+    cipher = AES.new(secret_key(), AES.MODE_GCM)
+    ciphertext, tag = cipher.encrypt_and_digest(secret.encode())
+    return b64encode(cipher.nonce + tag + ciphertext).decode('ascii')
+
+
+def open_secret(sealed):
+    data = b64decode(sealed)
+    cipher = AES.new(secret_key(), AES.MODE_GCM, nonce=data[:16])
+    return cipher.decrypt_and_verify(data[32:], data[16:32]).decode('utf-8')
+
+
+def iso(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+def describe(job):
+    """Estado público de un trabajo"""
+    return {
+        "id": job['id'],
+        "type": job['kind'],
+        "status": job['status'],
+        "progress": {"done": job['done'], "total": job['total']},
+        "attempts": job['attempts'],
+        "max_attempts": job['max_attempts'],
+        "llm_cost": round(job['llm_cost'], 6),
+        "error": job['error'],
+        "created_at": iso(job['created_at']),
+        "started_at": iso(job['started_at']),
+        "finished_at": iso(job['finished_at']),
+    }
+
+
+class JobStore:
+    """Trabajos y resultados en un archivo SQLite compartido por todos los workers."""
+
+    def __init__(self, path, retention=JOBS_RETENTION_SECONDS):
+        self.path = path
+        self.retention = retention
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+
+    def connect(self):
+        """Abrir (o reabrir tras un fork) la conexión de este proceso"""
+        pid = os.getpid()
+        if self.conn is None or self.pid != pid:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False,
+                                   isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                status TEXT NOT NULL,
+                params TEXT NOT NULL,
+                api_key TEXT,
+                total INTEGER NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                llm_cost REAL NOT NULL DEFAULT 0,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                worker TEXT,
+                locked_until REAL,
+                available_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )''')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status_available '
+                         'ON jobs (status, available_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_subject_status ON jobs (subject, status)')
+            conn.execute('''CREATE TABLE IF NOT EXISTS job_results (
+                job_id TEXT NOT NULL,
+                item INTEGER NOT NULL,
+                result TEXT NOT NULL,
+                PRIMARY KEY (job_id, item)
+            ) WITHOUT ROWID''')
+            self.conn = conn
+            self.pid = pid
+        return self.conn
+
+    def transaction(self, work):
+        """Ejecutar `work(conn)` en una transacción de escritura"""
+        with self.lock:
+            conn = self.connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = work(conn)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        return result
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            return self.connect().execute(sql, params).rowcount
+
+    def submit(self, kind, subject, items, params=None, api_key=None,
+               max_attempts=JOBS_MAX_ATTEMPTS):
+        """Encolar un trabajo y devolver su id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self.execute(
+            'INSERT INTO jobs (id, kind, subject, status, params, api_key, total, max_attempts, '
+            'available_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (job_id, kind, subject, QUEUED, json.dumps({**(params or {}), 'items': items}),
+             api_key, len(items), max_attempts, now, now))
+        return job_id
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def pending(self, subject):
+        """Trabajos del usuario que aún no han terminado"""
+        with self.lock:
+            return self.connect().execute(
+                'SELECT COUNT(*) FROM jobs WHERE subject = ? AND status IN (?, ?)',
+                (subject, *ACTIVE)).fetchone()[0]
+
+    def claim(self, lease=JOBS_LEASE_SECONDS):
+        """Reservar el siguiente trabajo disponible (o None) con un token de reserva nuevo"""
+        token = uuid.uuid4().hex
+
+        def work(conn):
+            now = time.time()
+            # Los trabajos de un worker que dejó de renovar su reserva vuelven a la cola
+            # (o a la de fallidos si ya no les quedan intentos)
+            conn.execute(
+                'UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END, '
+                'finished_at = CASE WHEN attempts >= max_attempts THEN ? END, '
+                'error = ?, worker = NULL, locked_until = NULL, available_at = ? '
+                'WHERE status = ? AND locked_until < ?',
+                (DEAD, QUEUED, now, "Worker stopped responding (lease expired)", now, RUNNING, now))
+            row = conn.execute(
+                'SELECT id FROM jobs WHERE status = ? AND available_at <= ? '
+                'ORDER BY available_at LIMIT 1', (QUEUED, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                'UPDATE jobs SET status = ?, worker = ?, locked_until = ?, attempts = attempts + 1, '
+                'started_at = COALESCE(started_at, ?) WHERE id = ?',
+                (RUNNING, token, now + lease, now, row['id']))
+            return dict(conn.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone())
+
+        return self.transaction(work)
+
+    def extend(self, leases, lease=JOBS_LEASE_SECONDS):
+        """Renovar las reservas {id: token}; devuelve {id: motivo} de los que deben parar"""
+        def work(conn):
+            until = time.time() + lease
+            stop = {}
+            for job_id, token in leases.items():
+                row = conn.execute('SELECT status, worker, cancel_requested FROM jobs WHERE id = ?',
+                                   (job_id,)).fetchone()
+                if row is None or row['status'] != RUNNING or row['worker'] != token:
+                    stop[job_id] = 'lost'
+                    continue
+                conn.execute('UPDATE jobs SET locked_until = ? WHERE id = ?', (until, job_id))
+                if row['cancel_requested']:
+                    stop[job_id] = 'cancelled'
+            return stop
+
+        return self.transaction(work)
+
+    def done_items(self, job_id):
+        with self.lock:
+            return {row[0] for row in self.connect().execute(
+                'SELECT item FROM job_results WHERE job_id = ?', (job_id,))}
+
+    def add_result(self, job_id, item, result):
+        def work(conn):
+            # Si otro worker ya guardó este elemento (reserva perdida), se conserva el suyo
+            inserted = conn.execute(
+                'INSERT OR IGNORE INTO job_results (job_id, item, result) VALUES (?, ?, ?)',
+                (job_id, item, json.dumps(result))).rowcount
+            if inserted:
+                conn.execute('UPDATE jobs SET done = done + 1 WHERE id = ?', (job_id,))
+
+        self.transaction(work)
+
+    def add_cost(self, job_id, amount):
+        """Sumar gasto en OpenAI al trabajo y devolver el total"""
+        def work(conn):
+            conn.execute('UPDATE jobs SET llm_cost = llm_cost + ? WHERE id = ?', (amount, job_id))
+            return conn.execute('SELECT llm_cost FROM jobs WHERE id = ?', (job_id,)).fetchone()[0]
+
+        return self.transaction(work)
+
+    def results(self, job_id, offset=0, limit=500):
+        """Resultados desde el elemento `offset`, en orden"""
+        with self.lock:
+            rows = self.connect().execute(
+                'SELECT item, result FROM job_results WHERE job_id = ? AND item >= ? '
+                'ORDER BY item LIMIT ?', (job_id, offset, limit)).fetchall()
+        return [(item, json.loads(result)) for item, result in rows]
+
+    def finish(self, job, status, error=None):
+        """Cerrar el intento en curso (solo si la reserva sigue siendo de este worker)"""
+        self.execute(
+            'UPDATE jobs SET status = ?, error = ?, finished_at = ?, worker = NULL, '
+            'locked_until = NULL, api_key = NULL WHERE id = ? AND worker = ?',
+            (status, error, time.time(), job['id'], job['worker']))
+
+    def retry_later(self, job, error, delay):
+        self.execute(
+            'UPDATE jobs SET status = ?, error = ?, available_at = ?, worker = NULL, '
+            'locked_until = NULL WHERE id = ? AND worker = ?',
+            (QUEUED, error, time.time() + delay, job['id'], job['worker']))
+
+    def release(self, job):
+        """Devolver a la cola un trabajo interrumpido al parar el proceso (no cuenta como intento)"""
+        self.execute(
+            'UPDATE jobs SET status = ?, attempts = attempts - 1, available_at = ?, worker = NULL, '
+            'locked_until = NULL WHERE id = ? AND worker = ?',
+            (QUEUED, time.time(), job['id'], job['worker']))
+
+    def cancel(self, job_id):
+        """Cancelar un trabajo: en cola, al momento; en ejecución, en la siguiente renovación"""
+        def work(conn):
+            conn.execute(
+                'UPDATE jobs SET status = ?, finished_at = ?, api_key = NULL '
+                'WHERE id = ? AND status = ?', (CANCELLED, time.time(), job_id, QUEUED))
+            conn.execute('UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?',
+                         (job_id, RUNNING))
+
+        self.transaction(work)
+
+    def requeue(self, job_id, api_key=None):
+        """Volver a encolar un trabajo fallido, muerto o cancelado; sigue donde se quedó"""
+        return self.execute(
+            'UPDATE jobs SET status = ?, attempts = 0, error = NULL, cancel_requested = 0, '
+            'finished_at = NULL, available_at = ?, api_key = COALESCE(?, api_key) '
+            'WHERE id = ? AND status IN (?, ?, ?)',
+            (QUEUED, time.time(), api_key, job_id, *RETRYABLE)) > 0
+
+    def prune(self):
+        """Borrar los trabajos terminados hace más de `retention` segundos"""
+        def work(conn):
+            cutoff = time.time() - self.retention
+            expired = [row[0] for row in conn.execute(
+                'SELECT id FROM jobs WHERE finished_at < ? AND status NOT IN (?, ?)',
+                (cutoff, *ACTIVE))]
+            for job_id in expired:
+                conn.execute('DELETE FROM job_results WHERE job_id = ?', (job_id,))
+                conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+            return len(expired)
+
+        return self.transaction(work)
+
+
+class JobContext:
+    """Trabajo en ejecución: sus elementos, el progreso y las comprobaciones de parada."""
+
+    def __init__(self, store, job, stopping, max_seconds=JOBS_MAX_SECONDS):
+        self.store = store
+        self.job = job
+        self.params = json.loads(job['params'])
+        self.stopping = stopping
+        self.deadline = time.monotonic() + max_seconds
+        self.reason = None
+
+    def interrupt(self, reason):
+        self.reason = reason
+
+    def check(self):
+        """Lanzar JobInterrupted si el trabajo debe parar"""
+        if self.reason:
+            raise JobInterrupted(self.reason)
+        if self.stopping.is_set():
+            raise JobInterrupted('shutdown')
+        if time.monotonic() > self.deadline:
+            raise JobInterrupted('timeout')
+
+    def remaining(self):
+        return max(0.0, self.deadline - time.monotonic())
+
+    def pending(self):
+        """(índice, elemento) que faltan (un reintento no repite lo ya guardado)"""
+        done = self.store.done_items(self.job['id'])
+        return [(index, item) for index, item in enumerate(self.params['items'])
+                if index not in done]
+
+    def save(self, index, result):
+        """Guardar un resultado y comprobar después si hay que parar"""
+        self.store.add_result(self.job['id'], index, result)
+        self.check()
+
+
+def run_extract(context):
+    """Extraer los metadatos de cada URL, como /extract-meta/batch"""
+    pending = context.pending()
+    if pending:
+        asyncio.run(extract_pending(context, pending))
+
+
+async def extract_pending(context, pending):
+    queue = deque(pending)
+    host_limits = defaultdict(lambda: asyncio.Semaphore(BATCH_PER_HOST_CONCURRENCY))
+
+    async def work(client):
+        while queue:
+            index, url = queue.popleft()
+            if not isinstance(url, str) or not url:
+                result = {"url": url, "status": 400, "message": "Please provide a URL"}
+            else:
+                host = urlparse(url).netloc.lower()
+                payload, status = await extract_page_async(
+                    client, url, (host_limits[host],), subject=context.job['subject'])
+                result = {"url": url, "status": status, **payload}
+            await asyncio.to_thread(context.save, index, result)
+
+    async with build_async_client(JOBS_CONCURRENCY) as client:
+        tasks = [asyncio.create_task(work(client))
+                 for _ in range(min(JOBS_CONCURRENCY, len(pending)))]
+        try:
+            await asyncio.wait_for(asyncio.gather(*tasks), context.remaining())
+        except asyncio.TimeoutError:
+            raise JobInterrupted('timeout')
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def run_analyze(context):
+    """Analizar cada par título/descripción, como /analyze/bulk, sin pasar de JOBS_MAX_LLM_DOLLARS
+    ni de la cuota de gasto en OpenAI del usuario"""
+    pending = context.pending()
+    if not pending:
+        return
+    if context.job['llm_cost'] >= JOBS_MAX_LLM_DOLLARS:
+        raise JobFailed(f"Job reached its OpenAI budget (${JOBS_MAX_LLM_DOLLARS:g})")
+    sealed = context.job['api_key']
+    api_key = open_secret(sealed) if sealed else OPENAI_API_KEY
+    subject = context.job['subject']
+
+    def settle_item(analyzed, token_cost):
+        # Cobrar el coste real del elemento y devolver el resto de su reserva
+        quota_engine.settle(subject, 'llm_dollars', QUOTA_LLM_RESERVE, token_cost)
+
+    with openai_clients.lease(api_key) as client:
+        # Los reintentos los gestiona BulkAnalyzer con su propio backoff
+        analyzer = BulkAnalyzer(client.with_options(max_retries=0),
+                                use_cache=not context.params.get('no_cache', False),
+                                prescreen=bool(context.params.get('prescreen')),
+                                on_item=settle_item)
+        stopped = analyze_pending(context, analyzer, pending)
+    if stopped and context.pending():
+        raise JobFailed(STOP_MESSAGES[stopped])
+
+
+# Motivos por los que un análisis deja de lanzar elementos
+STOP_MESSAGES = {
+    'budget': f"Job reached its OpenAI budget (${JOBS_MAX_LLM_DOLLARS:g})",
+    'quota': "Your OpenAI usage quota is exhausted; retry the job when it refills",
+}
+
+
+def analyze_pending(context, analyzer, pending):
+    """Analizar los elementos pendientes; devuelve 'budget' o 'quota' si se paró por gasto
+
+    Antes de lanzar cada elemento se reserva su gasto estimado en la cuota del
+    usuario; si no queda, no se lanzan más y se esperan los que están en curso.
+    """
+    items = [item for _, item in pending]
+    scores = score_batch(items) if analyzer.prescreen else [None] * len(items)
+    queue = deque(zip(pending, scores))
+    subject = context.job['subject']
+
+    charged = 0.0
+    stopped = None
+    running = set()
+    executor = ThreadPoolExecutor(max_workers=JOBS_CONCURRENCY)
+    try:
+        while queue or running:
+            while queue and not stopped and len(running) < JOBS_CONCURRENCY:
+                if not quota_engine.allow(subject, 'llm_dollars', cost=QUOTA_LLM_RESERVE):
+                    # Las reservas de los elementos en curso vuelven al terminar: solo se
+                    # para si ya no queda ninguno
+                    if not running:
+                        stopped = 'quota'
+                    break
+                (index, item), score = queue.popleft()
+                running.add(executor.submit(analyzer.analyze_item, index, item, score))
+            if not running:
+                break
+
+            done, running = wait(running, timeout=context.remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                raise JobInterrupted('timeout')
+            for future in done:
+                result = future.result()
+                with analyzer.lock:
+                    spent = analyzer.totals['token_cost']
+                total_cost = context.store.add_cost(context.job['id'], spent - charged)
+                charged = spent
+                context.save(result['index'], result)
+                if total_cost >= JOBS_MAX_LLM_DOLLARS and not stopped:
+                    # Los análisis ya lanzados se pagan igualmente: se guardan y no se lanzan más
+                    stopped = 'budget'
+    finally:
+        # No lanzar los elementos pendientes si el trabajo se para, pero esperar a las
+        # llamadas en curso: usan el cliente prestado y su coste también cuenta
+        executor.shutdown(wait=True, cancel_futures=True)
+        with analyzer.lock:
+            spent = analyzer.totals['token_cost']
+        if spent > charged:
+            context.store.add_cost(context.job['id'], spent - charged)
+    return stopped
+
+
+TASKS = {
+    'extract': run_extract,
+    'analyze': run_analyze,
+}
+
+
+class JobPool:
+    """Hilos que reservan y ejecutan trabajos de la cola, más uno que renueva sus reservas."""
+
+    def __init__(self, store, workers=JOBS_WORKERS, lease=JOBS_LEASE_SECONDS,
+                 poll_interval=JOBS_POLL_INTERVAL, retry_backoff=JOBS_RETRY_BACKOFF):
+        self.store = store
+        self.workers = workers
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.retry_backoff = retry_backoff
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.threads = []
+        # id -> JobContext de los trabajos en ejecución en este proceso
+        self.running = {}
+
+    def start(self):
+        """Arrancar los hilos (una vez por proceso, después del fork)"""
+        if self.threads or self.workers <= 0:
+            return
+        self.stopping.clear()
+        self.threads = [threading.Thread(target=self.work, name=f'job-worker-{index}', daemon=True)
+                        for index in range(self.workers)]
+        self.threads.append(threading.Thread(target=self.heartbeat, name='job-heartbeat',
+                                             daemon=True))
+        for thread in self.threads:
+            thread.start()
+        logger.info("Job workers started", extra={'workers': self.workers})
+
+    def stop(self, timeout=10):
+        """Parar los hilos; los trabajos interrumpidos vuelven a la cola sin gastar un intento"""
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def work(self):
+        while not self.stopping.is_set():
+            try:
+                job = self.store.claim(self.lease)
+            except sqlite3.Error as e:
+                logger.warning("Job queue read error: %s", e)
+                job = None
+            if job is None:
+                self.stopping.wait(self.poll_interval)
+                continue
+            self.execute(job)
+
+    def execute(self, job):
+        context = JobContext(self.store, job, self.stopping)
+        with self.lock:
+            self.running[job['id']] = context
+        try:
+            TASKS[job['kind']](context)
+        except JobInterrupted as e:
+            if e.reason == 'cancelled':
+                self.finish(job, CANCELLED)
+            elif e.reason == 'shutdown':
+                self.store.release(job)
+            elif e.reason == 'timeout':
+                self.failed(job, f"Job attempt exceeded {JOBS_MAX_SECONDS:g} seconds")
+            # 'lost': otro worker tiene ya el trabajo
+        except JobFailed as e:
+            self.finish(job, FAILED, str(e))
+        except Exception as e:
+            logger.exception("Job failed", extra={'job_id': job['id'], 'kind': job['kind']})
+            self.failed(job, str(e))
+        else:
+            self.finish(job, SUCCEEDED)
+        finally:
+            with self.lock:
+                self.running.pop(job['id'], None)
+
+    def finish(self, job, status, error=None):
+        self.store.finish(job, status, error)
+        jobs_finished.labels(job['kind'], status).inc()
+
+    def failed(self, job, error):
+        """Reintentar con backoff exponencial o, sin intentos, pasar a la cola de fallidos"""
+        if job['attempts'] >= job['max_attempts']:
+            self.finish(job, DEAD, error)
+            return
+        self.store.retry_later(job, error, self.retry_backoff * 2 ** (job['attempts'] - 1))
+        jobs_finished.labels(job['kind'], 'retried').inc()
+
+    def heartbeat(self):
+        """Renovar las reservas y avisar a los trabajos cancelados o perdidos"""
+        last_prune = 0
+        while not self.stopping.wait(self.lease / 3):
+            with self.lock:
+                contexts = dict(self.running)
+            try:
+                if contexts:
+                    stop = self.store.extend(
+                        {job_id: context.job['worker'] for job_id, context in contexts.items()},
+                        self.lease)
+                    for job_id, reason in stop.items():
+                        contexts[job_id].interrupt(reason)
+                if time.time() - last_prune > PRUNE_INTERVAL:
+                    self.store.prune()
+                    last_prune = time.time()
+            except sqlite3.Error as e:
+                logger.warning("Job queue write error: %s", e)
+
+
+job_store = JobStore(JOBS_PATH)
+job_pool = JobPool(job_store)
+
+
+def main():
+    """Ejecutar solo los workers de la cola, junto a gunicorn arrancado con JOBS_WORKERS=0"""
+    from .logs import setup_logging
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=max(JOBS_WORKERS, 1),
+                        help='Hilos que ejecutan trabajos')
+    args = parser.parse_args()
+
+    setup_logging()
+    pool = JobPool(job_store, workers=args.workers)
+    signal.signal(signal.SIGTERM, lambda *_: pool.stopping.set())
+    pool.start()
+    try:
+        while not pool.stopping.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    pool.stop()
+
+
+if __name__ == '__main__':
+    main()
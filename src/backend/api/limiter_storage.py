@@ -0,0 +1,109 @@
+"""Almacenamiento de Flask-Limiter compartido entre workers.
+
+Con el almacenamiento en memoria por defecto cada worker de gunicorn lleva
+sus propios contadores, así que "5 per day" es en realidad 5 × workers. Aquí
+se registra el esquema `sqlite://` en `limits` para guardar los contadores
+(ventana fija) en un archivo SQLite en modo WAL que ven todos los workers.
+Para varios servidores se puede usar `redis://` (soportado por `limits`).
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from limits.storage import Storage
+
+
+class SQLiteStorage(Storage):
+    """Contadores de ventana fija en SQLite: `sqlite:///ruta/al/archivo.sqlite3`"""
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    # Cada cuántas escrituras se borran los contadores caducados
+    PRUNE_EVERY = 1024
+
+    def __init__(self, uri=None, wrap_exceptions=False, **options):
+        self.path = uri[len('sqlite://'):] if uri else ':memory:'
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+        self.writes = 0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def connect(self):
+        """Abrir (o reabrir tras un fork) la conexión de este proceso"""
+        pid = os.getpid()
+        if self.conn is None or self.pid != pid:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS rate_limits (
+                key TEXT PRIMARY KEY,
+                count INTEGER NOT NULL,
+                expires_at REAL NOT NULL
+            )''')
+            self.conn = conn
+            self.pid = pid
+        return self.conn
+
+    def incr(self, key, expiry, amount=1):
+        """Incrementar el contador; si la ventana caducó empieza una nueva"""
+        now = time.time()
+        with self.lock:
+            conn = self.connect()
+            # Leer y escribir en la misma transacción para que dos workers
+            # no pierdan incrementos
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT count, expires_at FROM rate_limits WHERE key = ?',
+                                   (key,)).fetchone()
+                if row and row[1] > now:
+                    count, expires_at = row[0] + amount, row[1]
+                else:
+                    count, expires_at = amount, now + expiry
+                conn.execute('INSERT OR REPLACE INTO rate_limits (key, count, expires_at) '
+                             'VALUES (?, ?, ?)', (key, count, expires_at))
+
+                self.writes += 1
+                if self.writes % self.PRUNE_EVERY == 0:
+                    conn.execute('DELETE FROM rate_limits WHERE expires_at <= ?', (now,))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        return count
+
+    def get(self, key):
+        with self.lock:
+            row = self.connect().execute(
+                'SELECT count FROM rate_limits WHERE key = ? AND expires_at > ?',
+                (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        with self.lock:
+            row = self.connect().execute(
+                'SELECT expires_at FROM rate_limits WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self):
+        try:
+            with self.lock:
+                self.connect().execute('SELECT 1')
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        with self.lock:
+            return self.connect().execute('DELETE FROM rate_limits').rowcount
+
+    def clear(self, key):
+        with self.lock:
+            self.connect().execute('DELETE FROM rate_limits WHERE key = ?', (key,))
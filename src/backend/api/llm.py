@@ -0,0 +1,344 @@
+"""Prompt, modelo y coste de las llamadas a OpenAI para /analyze."""
+
+import hashlib
+import html
+import json
+import re
+
+from .config import STRUCTURED_MAX_REPAIRS
+from .scoring import TITLE_MAX_CHARS, DESCRIPTION_MAX_CHARS
+from .metrics import observe_tokens, cache_requests
+
+# Modelo usado para el análisis
+ANALYSIS_MODEL = "gpt-4.1"
+
+# Versión de la plantilla del prompt: cambiarla invalida la caché de resultados
+PROMPT_VERSION = "1"
+
+# Precio por token (USD) de entrada y de salida
+INPUT_TOKEN_PRICE = 3 / 1000000
+OUTPUT_TOKEN_PRICE = 12 / 1000000
+
+INSTRUCTIONS = "You are SEO Expert with more over 11 years of experience, please provide the best solution for the user to increase CTR in SERP."
+
+
+def build_prompt(title, meta_description, keyword, brand):
+    """Crear el prompt para OpenAI"""
+    return f"""
+       As a SEO Expert, evaluate the current Title "{title}" and Meta Description "{meta_description}" for SEO effectiveness and CTR potential in the SERP.
+
+The focus keyword is: "{keyword} and brand is: {brand}"
+
+Your task:
+
+1. Estimate the CTR of the current Title and Meta Description.
+2. Propose a new SEO-optimized Title and Meta Description, using the focus keyword to increase both ranking and CTR.
+3. STRICTLY RESPECT character limits:
+   - Title: maximum 60 characters including spaces and {brand} at the end.
+   - Meta Description: maximum 155 characters including spaces.
+   - You MUST count the characters (including spaces) and ensure the Title is max 60 and the Meta Description max 155. Never exceed. If needed, rewrite or shorten.
+4. Capitalize every word in the Title, except for articles, prepositions, and conjunctions (e.g., "di", "e", "a", "con", "su").
+5. The Meta Description must include the focus keyword **if possible** in a natural way and should help to increase the CTR by being clear, appealing, and action-oriented.
+6. Provide an estimation of how much the new Title and Description could increase the CTR. DON'T USE DATA (YEAR) IN TITLE OR META DESCRIPTION.
+
+Format your answer exactly as follows and REPLY IN THE SAME LANGUAGE as the user:
+
+SEO Title: [new title, max 60 characters]  
+Meta Description: [new description, max 155 characters]  
+CTR Estimation (Original): [estimated CTR in %]  
+CTR Estimation (Optimized): [estimated CTR in %]  
+CTR Increase: [estimated % increase]
+
+
+
+"""
+
+
+# Modo estructurado: el modelo responde con JSON validado por un esquema y los
+# límites se comprueban en local. Si un campo los incumple, se pide solo ese
+# campo con un prompt corto en lugar de repetir el análisis completo.
+# Versión de su prompt (structured-2: vuelven los ejemplos en italiano de la
+# regla de mayúsculas del prompt original)
+STRUCTURED_PROMPT_VERSION = "structured-2"
+
+ANALYSIS_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'seo_title': {'type': 'string'},
+        'meta_description': {'type': 'string'},
+        'ctr_original': {'type': 'number'},
+        'ctr_optimized': {'type': 'number'},
+        'ctr_increase': {'type': 'number'},
+    },
+    'required': ['seo_title', 'meta_description', 'ctr_original', 'ctr_optimized', 'ctr_increase'],
+    'additionalProperties': False,
+}
+
+REPAIR_SCHEMA = {
+    'type': 'object',
+    'properties': {'value': {'type': 'string'}},
+    'required': ['value'],
+    'additionalProperties': False,
+}
+
+
+def build_structured_prompt(title, meta_description, keyword, brand):
+    """Prompt del modo estructurado (el formato lo fija el esquema JSON)"""
+    return f"""As a SEO Expert, evaluate the current Title "{title}" and Meta Description "{meta_description}" for SEO effectiveness and CTR potential in the SERP.
+The focus keyword is: "{keyword}" and brand is: "{brand}".
+
+1. Estimate the CTR (%) of the current Title and Meta Description.
+2. Propose a new SEO-optimized Title and Meta Description using the focus keyword.
+3. Title: maximum {TITLE_MAX_CHARS} characters including spaces, with {brand} at the end. Meta Description: maximum {DESCRIPTION_MAX_CHARS} characters including spaces. Never exceed.
+4. Capitalize every word in the Title, except for articles, prepositions, and conjunctions (e.g., "di", "e", "a", "con", "su").
+5. The Meta Description must include the focus keyword if possible in a natural way, and be clear, appealing and action-oriented.
+6. Estimate the optimized CTR (%) and the increase (%). Don't use years in the Title or Meta Description.
+Reply in the same language as the user."""
+
+
+def text_format(name, schema):
+    """Parámetro `text` de la API de Responses para forzar una salida JSON con esquema"""
+    return {'format': {'type': 'json_schema', 'name': name, 'schema': schema, 'strict': True}}
+
+
+def request_structured_analysis(client, inputs):
+    """Pedir el análisis en formato JSON"""
+    return client.responses.create(
+        model=ANALYSIS_MODEL,
+        instructions=INSTRUCTIONS,
+        input=build_structured_prompt(**inputs),
+        text=text_format('seo_analysis', ANALYSIS_SCHEMA)
+    )
+
+
+def field_problems(result, inputs):
+    """Campos del resultado que incumplen los límites: {campo: requisito}"""
+    brand = html.unescape(inputs['brand']).strip()
+    problems = {}
+    title = result['seo_title']
+    if len(title) > TITLE_MAX_CHARS or (brand and not title.rstrip(' -|:').endswith(brand)):
+        brand_rule = f' and must end with "{brand}"' if brand else ''
+        problems['seo_title'] = f"at most {TITLE_MAX_CHARS} characters including spaces{brand_rule}"
+    if len(result['meta_description']) > DESCRIPTION_MAX_CHARS:
+        problems['meta_description'] = f"at most {DESCRIPTION_MAX_CHARS} characters including spaces"
+    return problems
+
+
+def build_repair_prompt(field, value, requirement, inputs):
+    """Prompt corto para corregir un único campo"""
+    label = 'SEO Title' if field == 'seo_title' else 'Meta Description'
+    return (f'Rewrite this {label} so it is {requirement}. '
+            f'It is {len(value)} characters now. Keep the focus keyword "{inputs["keyword"]}", '
+            f'the meaning and the language.\n\n{value}')
+
+
+def request_repair(client, field, value, requirement, inputs):
+    return client.responses.create(
+        model=ANALYSIS_MODEL,
+        input=build_repair_prompt(field, value, requirement, inputs),
+        text=text_format('seo_repair', REPAIR_SCHEMA)
+    )
+
+
+def parse_repair(text):
+    return json.loads(text)['value'].strip()
+
+
+# Formato de texto libre del prompt original (para el parser estricto)
+TEXT_FIELDS = {
+    'seo_title': re.compile(r'^\s*SEO Title:\s*(.+?)\s*$', re.MULTILINE),
+    'meta_description': re.compile(r'^\s*Meta Description:\s*(.+?)\s*$', re.MULTILINE),
+    'ctr_original': re.compile(r'^\s*CTR Estimation \(Original\):\s*([\d.,]+)', re.MULTILINE),
+    'ctr_optimized': re.compile(r'^\s*CTR Estimation \(Optimized\):\s*([\d.,]+)', re.MULTILINE),
+    'ctr_increase': re.compile(r'^\s*CTR Increase:\s*([\d.,]+)', re.MULTILINE),
+}
+
+
+def parse_analysis(text):
+    """Convertir la respuesta (JSON o el formato de texto del prompt) en campos tipados
+
+    Lanza ValueError si falta algún campo.
+    """
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = {}
+        for field, pattern in TEXT_FIELDS.items():
+            match = pattern.search(text)
+            if match:
+                data[field] = match.group(1)
+
+    result = {}
+    for field in ANALYSIS_SCHEMA['required']:
+        if field not in data:
+            raise ValueError(f"Missing field in analysis: {field}")
+        value = data[field]
+        if field.startswith('ctr_'):
+            value = float(str(value).replace(',', '.').rstrip('%'))
+        else:
+            value = str(value).strip()
+        result[field] = value
+    return result
+
+
+def format_analysis(result):
+    """Texto en el formato del prompt original (el que ya muestra el frontend)"""
+    return (f"SEO Title: {result['seo_title']}\n"
+            f"Meta Description: {result['meta_description']}\n"
+            f"CTR Estimation (Original): {result['ctr_original']:g}%\n"
+            f"CTR Estimation (Optimized): {result['ctr_optimized']:g}%\n"
+            f"CTR Increase: {result['ctr_increase']:g}%")
+
+
+class AnalysisFailed(Exception):
+    """El análisis estructurado falló después de pagar alguna llamada a OpenAI."""
+
+    def __init__(self, error, token_cost):
+        self.token_cost = token_cost
+        super().__init__(str(error))
+
+
+def analyze_structured(client, inputs, max_repairs=STRUCTURED_MAX_REPAIRS):
+    """Análisis estructurado con reparación de los campos que incumplen los límites
+
+    Devuelve (resultado, coste en USD). El resultado incluye `repairs` (llamadas
+    de reparación) y `valid` (si al final se cumplen todos los límites). Si algo
+    falla después de la primera llamada se lanza AnalysisFailed con lo gastado.
+    """
+    response = request_structured_analysis(client, inputs)
+    cost = token_cost(response.usage)
+    try:
+        result = parse_analysis(response.output_text)
+
+        repairs = 0
+        problems = field_problems(result, inputs)
+        while problems and repairs < max_repairs:
+            for field, requirement in problems.items():
+                repair = request_repair(client, field, result[field], requirement, inputs)
+                cost += token_cost(repair.usage)
+                result[field] = parse_repair(repair.output_text)
+            repairs += 1
+            problems = field_problems(result, inputs)
+    except Exception as e:
+        raise AnalysisFailed(e, cost) from e
+
+    return {**result, 'repairs': repairs, 'valid': not problems}, cost
+
+
+async def analyze_structured_async(client, inputs, max_repairs=STRUCTURED_MAX_REPAIRS):
+    """Versión para AsyncOpenAI de analyze_structured"""
+    response = await request_structured_analysis(client, inputs)
+    cost = token_cost(response.usage)
+    try:
+        result = parse_analysis(response.output_text)
+
+        repairs = 0
+        problems = field_problems(result, inputs)
+        while problems and repairs < max_repairs:
+            for field, requirement in problems.items():
+                repair = await request_repair(client, field, result[field], requirement, inputs)
+                cost += token_cost(repair.usage)
+                result[field] = parse_repair(repair.output_text)
+            repairs += 1
+            problems = field_problems(result, inputs)
+    except Exception as e:
+        raise AnalysisFailed(e, cost) from e
+
+    return {**result, 'repairs': repairs, 'valid': not problems}, cost
+
+
+def request_analysis(client, inputs, **kwargs):
+    """Enviar el análisis de unas entradas ya validadas a la API de Responses"""
+    return client.responses.create(
+        model=ANALYSIS_MODEL,
+        instructions=INSTRUCTIONS,
+        input=build_prompt(**inputs),
+        **kwargs
+    )
+
+
+def token_cost(usage):
+    """Coste en USD de una respuesta a partir de su uso de tokens"""
+    token_input_cost = int(usage.input_tokens) * INPUT_TOKEN_PRICE
+    token_output_cost = int(usage.output_tokens) * OUTPUT_TOKEN_PRICE
+    cost = token_input_cost + token_output_cost
+    observe_tokens(usage, cost)
+    return cost
+
+
+def normalize_text(value):
+    """Normalizar espacios de una entrada (el uso de mayúsculas sí importa al análisis)"""
+    return ' '.join(value.split())
+
+
+def analysis_cache_key(title, meta_description, keyword, brand, model=ANALYSIS_MODEL,
+                       prompt_version=PROMPT_VERSION):
+    """Hash de las entradas normalizadas, la versión del prompt y el modelo"""
+    payload = json.dumps({
+        'title': normalize_text(title),
+        'description': normalize_text(meta_description),
+        'keyword': normalize_text(keyword),
+        'brand': normalize_text(brand),
+        'model': model,
+        'prompt_version': prompt_version,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def read_analysis_input(data):
+    """Validar y sanitizar las entradas de /analyze; devuelve (entradas, error)"""
+    title = data.get("title", "")
+    meta_description = data.get("description", "")
+    keyword = data.get("keyword", "")
+    brand = data.get("brand", "")
+
+    # Validar entradas
+    if not all(isinstance(value, str) for value in (title, meta_description, keyword, brand)):
+        return None, ({
+            "error": "Invalid input",
+            "message": "Title, description, keyword and brand must be strings"
+        }, 400)
+
+    if not title or len(title) > 150:
+        return None, ({
+            "error": "Invalid title",
+            "message": "Title is required and must be less than 150 characters"
+        }, 400)
+
+    if len(meta_description) > 500:
+        return None, ({
+            "error": "Invalid description",
+            "message": "Description must be less than 500 characters"
+        }, 400)
+
+    # Sanitizar entradas para evitar inyección
+    return {
+        'title': html.escape(title),
+        'meta_description': html.escape(meta_description),
+        'keyword': html.escape(keyword),
+        'brand': html.escape(brand),
+    }, None
+
+
+def analysis_payload(inputs, analysis, token_cost, cache, score=None, result=None):
+    """Cuerpo de respuesta de /analyze (también es el evento final del streaming)"""
+    cache_requests.labels('analysis', cache).inc()
+    payload = {
+        'status': 'success',
+        'data': {
+            'analysis': analysis,
+            'original': {
+                'title': inputs['title'],
+                'description': inputs['meta_description'],
+                'token_cost': token_cost
+            },
+            'cache': cache
+        }
+    }
+    if score is not None:
+        # Puntuación local (solo si se pidió prescreen)
+        payload['data']['score'] = score
+    if result is not None:
+        # Campos tipados del modo estructurado
+        payload['data']['result'] = result
+    return payload
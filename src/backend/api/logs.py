@@ -0,0 +1,215 @@
+"""Registro estructurado (JSON) que no bloquea las peticiones.
+
+Los registros se meten en una cola acotada con `put_nowait` y un hilo de
+cada proceso los formatea y los escribe en stderr, así que una petición
+nunca espera a la salida estándar: si la cola está llena el registro se
+descarta y se cuenta. Cada línea es un objeto JSON con el id de la petición
+(cabecera X-Request-ID), los registros de éxito se muestrean
+(LOG_SUCCESS_SAMPLE_RATE) y los campos largos se recortan.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+from .config import (LOG_LEVEL, LOG_QUEUE_SIZE, LOG_SUCCESS_SAMPLE_RATE, LOG_MAX_FIELD_CHARS,
+                     LOG_MAX_TRACEBACK_CHARS)
+
+# Atributos propios de LogRecord (el resto son campos pasados con `extra`)
+RECORD_FIELDS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'sample', 'request_id', 'color_message'}
+
+# Clientes HTTP que registran cada petición en INFO (solo se conservan sus avisos)
+QUIET_LOGGERS = ('httpx', 'httpcore', 'openai', 'urllib3')
+
+# Ids de petición aceptados desde el cliente o un proxy
+REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+def request_id():
+    """Id de la petición en curso: el X-Request-ID recibido si es válido o uno nuevo"""
+    if 'request_id' not in g:
+        header = request.headers.get('X-Request-ID')
+        g.request_id = header if header and REQUEST_ID_RE.match(header) else uuid.uuid4().hex
+    return g.request_id
+
+
+def truncate(value, limit=LOG_MAX_FIELD_CHARS):
+    """Recortar un texto largo indicando cuántos caracteres se omiten"""
+    if len(value) <= limit:
+        return value
+    return f"{value[:limit]}... [+{len(value) - limit} chars]"
+
+
+def capped(value):
+    """Valor de un campo listo para JSON y con el tamaño acotado"""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        return truncate(value)
+    text = json.dumps(value, default=str, ensure_ascii=False)
+    return truncate(text) if len(text) > LOG_MAX_FIELD_CHARS else value
+
+
+class JSONFormatter(logging.Formatter):
+    """Una línea JSON por registro."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'pid': record.process,
+            'request_id': getattr(record, 'request_id', None),
+            'message': truncate(record.getMessage()),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_FIELDS:
+                entry[key] = capped(value)
+        if record.exc_info:
+            entry['exception'] = truncate(self.formatException(record.exc_info),
+                                          LOG_MAX_TRACEBACK_CHARS)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RequestContextFilter(logging.Filter):
+    """Añadir el id, el método y la ruta de la petición en curso."""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = request_id()
+            record.method = request.method
+            record.path = request.path
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Conservar solo una fracción de los registros marcados con `sample`."""
+
+    def __init__(self, rate=LOG_SUCCESS_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return not getattr(record, 'sample', False) or random.random() < self.rate
+
+
+class AccessLogFilter(logging.Filter):
+    """Campos de las líneas de acceso; las respuestas correctas se muestrean."""
+
+    def filter(self, record):
+        if isinstance(record.args, dict):
+            # gunicorn: diccionario de átomos del access_log_format
+            status = record.args.get('s')
+            record.request_id = record.args.get('{x-request-id}o') or None
+        elif isinstance(record.args, tuple) and len(record.args) == 5:
+            # uvicorn: (cliente, método, ruta, versión HTTP, status)
+            status = record.args[4]
+        else:
+            status = None
+        record.status = status
+        record.sample = str(status).isdigit() and int(status) < 400
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler que descarta (y cuenta) en lugar de esperar si la cola está llena."""
+
+    def __init__(self, pipeline):
+        super().__init__(pipeline.queue)
+        self.pipeline = pipeline
+
+    def prepare(self, record):
+        # Solo se fija el mensaje; la traza y el JSON se formatean en el hilo de escritura
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        self.pipeline.ensure_started()
+        try:
+            self.pipeline.queue.put_nowait(record)
+        except queue.Full:
+            self.pipeline.dropped += 1
+
+
+class LogPipeline:
+    """Cola de registros y su hilo de escritura (uno por proceso)."""
+
+    def __init__(self, max_size=LOG_QUEUE_SIZE, stream=None):
+        self.queue = queue.Queue(max_size)
+        self.lock = threading.Lock()
+        self.stream = stream
+        self.listener = None
+        self.pid = None
+        # Registros descartados por tener la cola llena
+        self.dropped = 0
+
+        self.handler = NonBlockingQueueHandler(self)
+        self.handler.addFilter(SamplingFilter())
+        self.handler.addFilter(RequestContextFilter())
+
+    def ensure_started(self):
+        """Arrancar (o rearrancar tras un fork) el hilo que escribe los registros"""
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            # Tras un fork la cola puede traer registros del padre sin escribir
+            self.queue = queue.Queue(self.queue.maxsize)
+            output = logging.StreamHandler(self.stream or sys.stderr)
+            output.setFormatter(JSONFormatter())
+            self.listener = QueueListener(self.queue, output)
+            self.listener.start()
+            self.pid = os.getpid()
+            atexit.register(self.stop)
+
+    def stop(self):
+        """Vaciar la cola y parar el hilo (al salir del proceso)"""
+        if self.listener is not None and self.pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+            self.pid = None
+
+
+pipeline = LogPipeline()
+
+
+def setup_logging(level=LOG_LEVEL):
+    """Enviar todos los registros del proceso a la cola en formato JSON"""
+    root = logging.getLogger()
+    if pipeline.handler not in root.handlers:
+        root.handlers = [pipeline.handler]
+    root.setLevel(level)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(max(logging.WARNING, root.level))
+    pipeline.ensure_started()
+
+
+def attach_gunicorn(glogger):
+    """Pasar los registros de gunicorn y uvicorn (error y acceso) por la misma cola"""
+    setup_logging()
+    access_handler = NonBlockingQueueHandler(pipeline)
+    access_handler.addFilter(AccessLogFilter())
+    access_handler.addFilter(SamplingFilter())
+
+    error_loggers = (glogger.error_log, logging.getLogger('uvicorn.error'))
+    access_loggers = (glogger.access_log, logging.getLogger('uvicorn.access'))
+    for logger in error_loggers:
+        logger.handlers = [pipeline.handler]
+        logger.propagate = False
+    for logger in access_loggers:
+        logger.handlers = [access_handler]
+        logger.propagate = False
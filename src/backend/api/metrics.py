@@ -0,0 +1,96 @@
+"""Métricas de Prometheus para /metrics.
+
+Histogramas de la descarga de páginas, del parseo del HTML, de las llamadas
+a OpenAI y de sus tokens, y contadores de caché, rechazos SSRF, respuestas
+429 y gasto acumulado en OpenAI.
+
+Con gunicorn cada worker escribe sus valores en archivos mmap dentro de
+PROMETHEUS_MULTIPROC_DIR (lo define gunicorn_config.py) y /metrics los suma
+al responder, así que da igual qué worker atienda la petición. Sin esa
+variable (servidor de desarrollo) se usa el registro del proceso.
+"""
+
+import os
+import time
+
+from prometheus_client import (CollectorRegistry, Counter, Histogram, REGISTRY,
+                               CONTENT_TYPE_LATEST, generate_latest)
+from prometheus_client import multiprocess
+
+PREFIX = 'serp_title'
+
+upstream_fetch_seconds = Histogram(
+    f'{PREFIX}_upstream_fetch_seconds', 'Descarga de la página de origen hasta </head>',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+html_parse_seconds = Histogram(
+    f'{PREFIX}_html_parse_seconds', 'Parseo del HTML y extracción de metadatos',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5))
+parser_fallbacks = Counter(
+    f'{PREFIX}_parser_fallbacks', 'Páginas que se volvieron a parsear con html.parser', ['backend'])
+llm_request_seconds = Histogram(
+    f'{PREFIX}_llm_request_seconds', 'Llamadas HTTP a OpenAI hasta la cabecera de la respuesta',
+    ['status'], buckets=(0.25, 0.5, 1, 2, 4, 8, 16, 32, 64))
+llm_input_tokens = Histogram(
+    f'{PREFIX}_llm_input_tokens', 'Tokens de entrada por respuesta de OpenAI',
+    buckets=(100, 200, 400, 800, 1600, 3200, 6400))
+llm_output_tokens = Histogram(
+    f'{PREFIX}_llm_output_tokens', 'Tokens de salida por respuesta de OpenAI',
+    buckets=(50, 100, 200, 400, 800, 1600, 3200))
+llm_cost_dollars = Counter(
+    f'{PREFIX}_llm_cost_dollars', 'Gasto acumulado en OpenAI (USD)')
+cache_requests = Counter(
+    f'{PREFIX}_cache_requests', 'Consultas a las cachés por resultado', ['cache', 'status'])
+ssrf_rejections = Counter(
+    f'{PREFIX}_ssrf_rejections', 'URLs rechazadas por apuntar a IPs privadas', ['stage'])
+rate_limited = Counter(
+    f'{PREFIX}_rate_limited', 'Respuestas 429 de Flask-Limiter', ['endpoint'])
+quota_denied = Counter(
+    f'{PREFIX}_quota_denied', 'Peticiones rechazadas por agotar una cuota', ['budget'])
+jobs_finished = Counter(
+    f'{PREFIX}_jobs_finished', 'Intentos de trabajos en segundo plano por resultado', ['kind', 'status'])
+
+
+def observe_tokens(usage, cost):
+    """Registrar los tokens y el coste de una respuesta de OpenAI"""
+    llm_input_tokens.observe(int(usage.input_tokens))
+    llm_output_tokens.observe(int(usage.output_tokens))
+    llm_cost_dollars.inc(cost)
+
+
+def start_llm_request(request):
+    """Hook de httpx: apuntar cuándo sale la petición a OpenAI"""
+    request.extensions['metrics_start'] = time.perf_counter()
+
+
+def observe_llm_response(response):
+    """Hook de httpx: duración de la llamada (cada reintento cuenta por separado)"""
+    start = response.request.extensions.get('metrics_start')
+    if start is not None:
+        llm_request_seconds.labels(str(response.status_code)).observe(time.perf_counter() - start)
+
+
+async def start_llm_request_async(request):
+    start_llm_request(request)
+
+
+async def observe_llm_response_async(response):
+    observe_llm_response(response)
+
+
+def llm_event_hooks():
+    return {'request': [start_llm_request], 'response': [observe_llm_response]}
+
+
+def async_llm_event_hooks():
+    return {'request': [start_llm_request_async], 'response': [observe_llm_response_async]}
+
+
+def render():
+    """(cuerpo, content type) con las métricas de todos los workers"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
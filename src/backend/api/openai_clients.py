@@ -0,0 +1,170 @@
+"""Registro de clientes de OpenAI reutilizables (uno por API key y proceso).
+
+Crear un `OpenAI(...)` por petición descarta su pool de conexiones httpx y
+obliga a repetir el handshake TLS en cada llamada. Aquí se guarda un cliente
+por API key, con timeouts y reintentos explícitos, y se expulsan (LRU) los
+clientes que llevan tiempo sin usarse (nunca uno que se esté usando).
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+
+from .config import (OPENAI_CONNECT_TIMEOUT, OPENAI_READ_TIMEOUT, OPENAI_MAX_RETRIES,
+                     OPENAI_MAX_CONNECTIONS, OPENAI_CLIENT_CACHE_SIZE, OPENAI_CLIENT_IDLE_TTL)
+from .metrics import llm_event_hooks, async_llm_event_hooks
+
+
+def key_fingerprint(api_key):
+    """Identificador de una API key que no la expone"""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+
+class OpenAIClientRegistry:
+    """Clientes de OpenAI por API key con expulsión LRU de los inactivos.
+
+    Los clientes se usan con `lease`: mientras una petición (o un análisis
+    masivo, un stream o un trabajo) tiene el cliente, no se considera inactivo
+    y, si se expulsa por el límite de clientes, se cierra al devolverlo.
+    """
+
+    def __init__(self, max_clients=OPENAI_CLIENT_CACHE_SIZE, idle_ttl=OPENAI_CLIENT_IDLE_TTL):
+        self.max_clients = max_clients
+        self.idle_ttl = idle_ttl
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Vaciar el registro (también se usa tras un fork)"""
+        self.pid = os.getpid()
+        # huella -> [cliente, último uso, préstamos activos]
+        self.clients = OrderedDict()
+        # Clientes expulsados que aún están prestados: se cierran al devolver el último
+        self.retired = {}
+        self.stats = {'hits': 0, 'created': 0, 'evicted': 0}
+
+    def build(self, api_key):
+        """Crear un cliente con pool de conexiones, timeouts y reintentos explícitos"""
+        http_client = DefaultHttpxClient(
+            timeout=httpx.Timeout(OPENAI_READ_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS,
+                                max_keepalive_connections=OPENAI_MAX_CONNECTIONS),
+            event_hooks=llm_event_hooks(),
+        )
+        return OpenAI(api_key=api_key, max_retries=OPENAI_MAX_RETRIES, http_client=http_client)
+
+    @contextmanager
+    def lease(self, api_key):
+        """Prestar el cliente de una API key durante el bloque (creándolo si hace falta)
+
+        Las copias de `with_options` comparten su pool, así que solo se deben usar
+        dentro del bloque.
+        """
+        entry = self.acquire(api_key)
+        try:
+            yield entry[0]
+        finally:
+            self.release(entry)
+
+    def acquire(self, api_key):
+        fingerprint = key_fingerprint(api_key or '')
+        now = time.monotonic()
+
+        with self.lock:
+            if self.pid != os.getpid():
+                self.reset()
+
+            entry = self.clients.get(fingerprint)
+            if entry is not None:
+                self.clients.move_to_end(fingerprint)
+                self.stats['hits'] += 1
+            else:
+                entry = [self.build(api_key), now, 0]
+                self.clients[fingerprint] = entry
+                self.stats['created'] += 1
+            entry[1] = now
+            entry[2] += 1
+            evicted = self.evict(now, fingerprint)
+
+        # Cerrar fuera del lock los pools de los clientes expulsados
+        for old_client in evicted:
+            self.close(old_client)
+        return entry
+
+    def release(self, entry):
+        with self.lock:
+            entry[1] = time.monotonic()
+            entry[2] -= 1
+            retired = entry[2] == 0 and self.retired.pop(id(entry), None) is not None
+        if retired:
+            self.close(entry[0])
+
+    def evict(self, now, keep):
+        """Quitar los clientes inactivos y los que sobran; devuelve los que se pueden cerrar ya"""
+        closable = []
+        for other, entry in list(self.clients.items()):
+            if other == keep:
+                continue
+            idle = entry[2] == 0 and now - entry[1] > self.idle_ttl
+            if idle or len(self.clients) > self.max_clients:
+                del self.clients[other]
+                self.stats['evicted'] += 1
+                if entry[2]:
+                    self.retired[id(entry)] = entry
+                else:
+                    closable.append(entry[0])
+        return closable
+
+    def close(self, client):
+        client.close()
+
+    def snapshot(self):
+        """Estadísticas del registro y conexiones abiertas por cliente"""
+        with self.lock:
+            connections = 0
+            for client, _, _ in self.clients.values():
+                pool = getattr(getattr(client._client, '_transport', None), '_pool', None)
+                connections += len(getattr(pool, 'connections', ()))
+            leased = sum(1 for _, _, leases in self.clients.values() if leases)
+            return {**self.stats, 'clients': len(self.clients), 'leased': leased,
+                    'retired': len(self.retired), 'connections': connections}
+
+
+class AsyncOpenAIClientRegistry(OpenAIClientRegistry):
+    """Igual que OpenAIClientRegistry pero con clientes AsyncOpenAI.
+
+    Debe usarse siempre desde el mismo bucle de eventos (uno por worker).
+    """
+
+    def build(self, api_key):
+        http_client = DefaultAsyncHttpxClient(
+            timeout=httpx.Timeout(OPENAI_READ_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS,
+                                max_keepalive_connections=OPENAI_MAX_CONNECTIONS),
+            event_hooks=async_llm_event_hooks(),
+        )
+        return AsyncOpenAI(api_key=api_key, max_retries=OPENAI_MAX_RETRIES, http_client=http_client)
+
+    def close(self, client):
+        # Cerrar el pool en segundo plano sin bloquear la petición actual
+        asyncio.get_running_loop().create_task(client.close())
+
+    async def aclose(self):
+        """Cerrar todos los clientes (al apagar el worker)"""
+        with self.lock:
+            clients = [entry[0] for entry in (*self.clients.values(), *self.retired.values())]
+            self.clients.clear()
+            self.retired.clear()
+        for client in clients:
+            await client.close()
+
+
+openai_clients = OpenAIClientRegistry()
+async_openai_clients = AsyncOpenAIClientRegistry()
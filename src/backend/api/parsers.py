@@ -0,0 +1,327 @@
+"""Backends de parseo del HTML para la extracción de metadatos.
+
+El extractor solo necesita recorrer una vez las etiquetas vigiladas
+(title, meta, link, a y h1) y leer sus atributos y, en algunos casos, su
+texto. Hay tres formas de obtenerlas:
+
+- 'html.parser': árbol completo de BeautifulSoup (el comportamiento original).
+- 'events': el mismo tokenizador que usa BeautifulSoup con html.parser, pero
+  sus eventos van a un receptor que no construye árbol y solo guarda las
+  etiquetas vigiladas.
+- 'lxml': el tokenizador en C de libxml2 con el mismo receptor.
+
+El receptor reproduce las reglas de BeautifulSoup que afectan a los metadatos
+(cierre de etiquetas, etiquetas vacías, texto de script/style, espacios en
+blanco), así que los tres devuelven los mismos metadatos. libxml2 repara el
+HTML mal formado a su manera: antes de aceptar su resultado se comprueba
+que ha visto exactamente las etiquetas escritas. Si un backend rápido falla
+o no pasa esa comprobación, se vuelve a parsear con 'html.parser'.
+"""
+
+import logging
+import re
+from collections import Counter
+
+from bs4 import BeautifulSoup, CData
+from bs4.builder import HTMLTreeBuilder
+from bs4.builder._htmlparser import BeautifulSoupHTMLParser, HTMLParserTreeBuilder
+
+try:
+    from lxml import etree
+except ImportError:  # lxml es opcional: sin él se usa 'events'
+    etree = None
+
+from .config import HTML_PARSER
+from .metrics import parser_fallbacks
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('html.parser', 'events', 'lxml')
+
+# Etiquetas que interesan durante el recorrido
+WATCHED_TAGS = frozenset(('title', 'meta', 'link', 'a', 'h1'))
+# Etiquetas de las que se guarda el texto (title y h1 solo la primera; a solo con rel)
+TEXT_TAGS = frozenset(('title', 'h1'))
+
+# Reglas de BeautifulSoup para HTML
+VOID_TAGS = frozenset(HTMLTreeBuilder.empty_element_tags)
+STRING_CONTAINERS = frozenset(HTMLTreeBuilder.DEFAULT_STRING_CONTAINERS)
+PRESERVE_WHITESPACE_TAGS = frozenset(HTMLTreeBuilder.DEFAULT_PRESERVE_WHITESPACE_TAGS)
+# Espacios ASCII que BeautifulSoup reduce a un solo carácter
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+# `rel` es un atributo multivalor en <a> y <link>
+MULTI_VALUED = re.compile(r'\S+')
+
+# Etiquetas escritas en el HTML (aperturas y cierres) y etiquetas no vacías autocerradas
+# (<div/>), que html.parser cierra y libxml2 deja abiertas
+TAG_RE = re.compile(r'<(/?)([a-zA-Z][^\t\n\f\r />]*)')
+SELF_CLOSING_RE = re.compile(r'<(?!(?:%s)[\s/>])[a-zA-Z][^<>]*/>' % '|'.join(sorted(VOID_TAGS)), re.I)
+# Atributo leído por el extractor repetido en una etiqueta vigilada (html.parser se queda
+# con el último valor y libxml2 con el primero)
+DUPLICATE_ATTR_RE = re.compile(
+    r'<(?:a|link|meta)\s[^>]*?\b(rel|name|property|itemprop|content|href)\s*=[^>]*\s\1\s*=', re.I)
+# Etiquetas que libxml2 añade aunque no estén escritas
+IMPLIED_TAGS = frozenset(('html', 'head', 'body'))
+
+
+class Element:
+    """Etiqueta sin árbol: nombre, atributos y (solo si hace falta) su texto."""
+
+    __slots__ = ('name', 'attrs', 'parts')
+
+    def __init__(self, name, attrs, parts=None):
+        self.name = name
+        self.attrs = attrs
+        self.parts = parts
+
+    def get(self, key, default=None):
+        return self.attrs.get(key, default)
+
+    def get_text(self):
+        return ''.join(self.parts) if self.parts else ''
+
+
+class OpenTag:
+    """Lo que el tokenizador de BeautifulSoup espera de handle_starttag."""
+
+    __slots__ = ('is_empty_element',)
+
+    def __init__(self, is_empty_element):
+        self.is_empty_element = is_empty_element
+
+
+VOID = OpenTag(True)
+NOT_VOID = OpenTag(False)
+
+
+class ElementSink:
+    """Receptor de eventos con la interfaz de BeautifulSoup que no construye árbol.
+
+    Solo mantiene la pila de etiquetas abiertas (para cerrar como lo haría
+    BeautifulSoup) y el texto de los elementos que lo necesitan.
+    """
+
+    def __init__(self, original_encoding=None):
+        self.original_encoding = original_encoding
+        self.elements = []
+        # Pila de (etiqueta, elemento que acumula texto o None)
+        self.stack = []
+        self.open_counts = Counter()
+        self.capturing = []
+        self.seen_text_tags = set()
+        self.preserve_depth = 0
+        self.container_depth = 0
+        self.data = []
+
+    def handle_starttag(self, name, namespace=None, nsprefix=None, attrs=None,
+                        sourceline=None, sourcepos=None, namespaces=None):
+        self.endData()
+        capture = None
+        if name in WATCHED_TAGS:
+            attrs = dict(attrs) if attrs else {}
+            rel = attrs.get('rel')
+            if isinstance(rel, str) and name in ('a', 'link'):
+                attrs['rel'] = MULTI_VALUED.findall(rel)
+            element = Element(name, attrs)
+            if name in TEXT_TAGS:
+                if name not in self.seen_text_tags:
+                    self.seen_text_tags.add(name)
+                    capture = element
+            elif name == 'a' and 'rel' in attrs:
+                capture = element
+            if capture is not None:
+                element.parts = []
+                self.capturing.append(element)
+            self.elements.append(element)
+
+        self.stack.append((name, capture))
+        self.open_counts[name] += 1
+        if name in PRESERVE_WHITESPACE_TAGS:
+            self.preserve_depth += 1
+        if name in STRING_CONTAINERS:
+            self.container_depth += 1
+        return VOID if name in VOID_TAGS else NOT_VOID
+
+    def handle_endtag(self, name, nsprefix=None):
+        self.endData()
+        # Como BeautifulSoup: un cierre sin apertura se ignora y uno con apertura
+        # cierra también todo lo que quedara abierto dentro
+        if not self.open_counts[name]:
+            return
+        while self.stack:
+            popped, capture = self.stack.pop()
+            self.open_counts[popped] -= 1
+            if capture is not None:
+                self.capturing.pop()
+            if popped in PRESERVE_WHITESPACE_TAGS:
+                self.preserve_depth -= 1
+            if popped in STRING_CONTAINERS:
+                self.container_depth -= 1
+            if popped == name:
+                break
+
+    def handle_data(self, data):
+        self.data.append(data)
+
+    def endData(self, containerClass=None):
+        """Cerrar el texto pendiente (comentarios y demás solo marcan el corte)"""
+        if not self.data:
+            return
+        text = ''.join(self.data)
+        self.data = []
+        if not self.capturing:
+            return
+        # get_text solo incluye texto normal (fuera de script/style/...) y CDATA
+        if containerClass is None:
+            if self.container_depth:
+                return
+        elif containerClass is not CData:
+            return
+        if not self.preserve_depth and not text.strip(ASCII_SPACES):
+            text = '\n' if '\n' in text else ' '
+        for element in self.capturing:
+            element.parts.append(text)
+
+
+class MarkupRepaired(Exception):
+    """libxml2 ha leído el HTML de una forma que puede no coincidir con html.parser."""
+
+
+class LxmlTarget:
+    """Target de lxml que pasa los eventos de libxml2 al receptor.
+
+    Apunta cada apertura y cierre para comprobar después que libxml2 no ha
+    añadido, cerrado ni ignorado ninguna etiqueta por su cuenta.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        # (etiqueta, bloques de texto recibidos hasta entonces)
+        self.tags = []
+        self.texts = 0
+
+    def start(self, tag, attrib):
+        self.tags.append((tag, self.texts))
+        self.sink.handle_starttag(tag, attrs=attrib)
+
+    def end(self, tag):
+        # El cierre de una etiqueta vacía no está escrito en el HTML
+        if tag not in VOID_TAGS:
+            self.tags.append(('/' + tag, self.texts))
+        self.sink.handle_endtag(tag)
+
+    def data(self, data):
+        self.texts += 1
+        self.sink.handle_data(data)
+
+    def comment(self, text):
+        self.sink.endData()
+
+    def pi(self, target, data=None):
+        self.sink.endData()
+
+    def doctype(self, *args):
+        self.sink.endData()
+
+    def close(self):
+        self.sink.endData()
+        return self.sink.elements
+
+
+def decode_markup(content):
+    """(texto, codificación) con la misma detección que BeautifulSoup"""
+    for markup, encoding, _, _ in HTMLParserTreeBuilder().prepare_markup(content):
+        return markup, encoding
+    return content, None
+
+
+def parse_html_parser(content):
+    return BeautifulSoup(content, 'html.parser').descendants
+
+
+def parse_events(content):
+    markup, encoding = decode_markup(content)
+    sink = ElementSink(encoding)
+    parser = BeautifulSoupHTMLParser(convert_charrefs=False)
+    parser.soup = sink
+    parser.feed(markup)
+    parser.close()
+    sink.endData()
+    return sink.elements
+
+
+def check_lxml_markup(markup):
+    """Rechazar de antemano el HTML que libxml2 y html.parser leen distinto"""
+    # libxml2 trata <![CDATA[...]]> como un comentario y html.parser como texto
+    if '<![' in markup:
+        raise MarkupRepaired("CDATA section")
+    # Etiqueta o entidad cortada al final (p. ej. descarga truncada)
+    tail = markup[markup.rfind('>') + 1:]
+    if '<' in tail or '&' in tail:
+        raise MarkupRepaired("unterminated tag or entity at the end")
+    if SELF_CLOSING_RE.search(markup):
+        raise MarkupRepaired("self-closing non-void tag")
+    if DUPLICATE_ATTR_RE.search(markup):
+        raise MarkupRepaired("duplicate attribute")
+
+
+def check_lxml_tags(markup, target):
+    """Comprobar que libxml2 ha visto exactamente las etiquetas escritas
+
+    Se permiten html/head/body implícitos si no aparecen en el HTML y cierres
+    de más al final sin texto detrás (los elementos que quedaron abiertos).
+    """
+    written = [close + name.lower() for close, name in TAG_RE.findall(markup)
+               if not (close and name.lower() in VOID_TAGS)]
+    missing = IMPLIED_TAGS.difference(tag.lstrip('/') for tag in written)
+    seen = [(tag, texts) for tag, texts in target.tags if tag.lstrip('/') not in missing]
+    extra = seen[len(written):]
+    if [tag for tag, _ in seen[:len(written)]] != written:
+        raise MarkupRepaired("libxml2 added or ignored a tag")
+    if any(tag[0] != '/' or texts != target.texts for tag, texts in extra):
+        raise MarkupRepaired("libxml2 closed a tag early")
+
+
+def parse_lxml(content):
+    markup, encoding = decode_markup(content)
+    check_lxml_markup(markup)
+    sink = ElementSink(encoding)
+    target = LxmlTarget(sink)
+    parser = etree.HTMLParser(target=target, no_network=True)
+    parser.feed(markup)
+    elements = parser.close()
+    check_lxml_tags(markup, target)
+    return elements
+
+
+PARSERS = {
+    'html.parser': parse_html_parser,
+    'events': parse_events,
+    'lxml': parse_lxml,
+}
+
+
+def resolve_backend(name):
+    """Backend disponible para `name` ('lxml' sin lxml instalado pasa a 'events')"""
+    if name not in PARSERS:
+        raise ValueError(f"Unknown HTML parser backend: {name}")
+    if name == 'lxml' and etree is None:
+        return 'events'
+    return name
+
+
+# Un HTML_PARSER desconocido falla al arrancar, no en cada petición
+DEFAULT_BACKEND = resolve_backend(HTML_PARSER)
+
+
+def parse_elements(content, backend=DEFAULT_BACKEND):
+    """Elementos del documento en orden; si el backend falla, con html.parser"""
+    backend = resolve_backend(backend)
+    if backend == 'html.parser':
+        return parse_html_parser(content)
+    try:
+        return PARSERS[backend](content)
+    except Exception as e:
+        parser_fallbacks.labels(backend).inc()
+        logger.debug("Parser %s fell back to html.parser: %s", backend, e)
+        return parse_html_parser(content)
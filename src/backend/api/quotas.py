@@ -0,0 +1,247 @@
+"""Cuotas por usuario con cubos de tokens (token buckets).
+
+Cada usuario (session_id o, en su defecto, la IP) tiene un cubo
+por presupuesto: extracciones, análisis y dólares gastados en OpenAI. Los
+cubos empiezan llenos y se rellenan de forma continua hasta su capacidad a
+lo largo del periodo configurado, así que comprobar una cuota es O(1).
+
+El estado se guarda en SQLite (compartido entre workers) o en memoria del
+proceso. Además, cada proceso recuerda hasta cuándo está agotado un cubo
+para rechazar las peticiones siguientes sin consultar el almacén.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .config import (QUOTA_ENABLED, QUOTA_BACKEND, QUOTA_PATH, QUOTA_MAX_ENTRIES,
+                     QUOTA_PERIOD_SECONDS, QUOTA_EXTRACT_LIMIT, QUOTA_ANALYZE_LIMIT,
+                     QUOTA_LLM_DOLLARS)
+
+logger = logging.getLogger(__name__)
+
+
+class Budget:
+    """Capacidad de un cubo y el periodo en el que se rellena por completo."""
+
+    def __init__(self, name, capacity, period=QUOTA_PERIOD_SECONDS):
+        self.name = name
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+
+
+def refill(tokens, updated_at, budget, now):
+    """Tokens del cubo en `now` tras rellenarlo desde `updated_at`"""
+    return min(budget.capacity, tokens + (now - updated_at) * budget.rate)
+
+
+def take_tokens(tokens, budget, cost, force):
+    """Aplicar un consumo; devuelve (tokens, permitido, segundos hasta poder repetirlo)
+
+    Con cost=0 solo se comprueba que quede saldo. Con force=True se cobra
+    aunque el cubo quede en negativo (gasto conocido después de la llamada);
+    un cost negativo devuelve tokens sin pasar de la capacidad.
+    """
+    if force or (tokens >= cost and tokens > 0):
+        return min(budget.capacity, tokens - cost), True, 0.0
+    missing = max(cost, 1e-9) - tokens
+    return tokens, False, missing / budget.rate if budget.rate else float('inf')
+
+
+def full_at(tokens, budget, now):
+    """Momento en que el cubo vuelve a estar lleno (a partir de ahí no hace falta guardarlo)"""
+    if not budget.rate:
+        return float('inf')
+    return now + (budget.capacity - tokens) / budget.rate
+
+
+class MemoryBucketStore:
+    """Cubos en memoria del proceso (LRU con límite de entradas)."""
+
+    def __init__(self, max_entries=QUOTA_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        # clave -> (tokens, actualizado en, lleno en)
+        self.buckets = OrderedDict()
+
+    def take(self, key, budget, cost, force=False):
+        now = time.time()
+        with self.lock:
+            entry = self.buckets.pop(key, None)
+            tokens = refill(entry[0], entry[1], budget, now) if entry else budget.capacity
+            tokens, allowed, retry_after = take_tokens(tokens, budget, cost, force)
+            self.buckets[key] = (tokens, now, full_at(tokens, budget, now))
+
+            # Los cubos llenos equivalen a no tenerlos; los que sobran se expulsan (LRU)
+            while self.buckets:
+                oldest, (_, _, oldest_full_at) = next(iter(self.buckets.items()))
+                if oldest_full_at > now and len(self.buckets) <= self.max_entries:
+                    break
+                del self.buckets[oldest]
+        return allowed, retry_after
+
+
+class SQLiteBucketStore:
+    """Cubos compartidos entre workers en un archivo SQLite."""
+
+    # Cada cuántas escrituras se borran los cubos que ya están llenos
+    PRUNE_EVERY = 1024
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+        self.writes = 0
+
+    def connect(self):
+        """Abrir (o reabrir tras un fork) la conexión de este proceso"""
+        pid = os.getpid()
+        if self.conn is None or self.pid != pid:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS quota_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                full_at REAL NOT NULL
+            )''')
+            conn.execute('CREATE INDEX IF NOT EXISTS quota_buckets_full_at '
+                         'ON quota_buckets (full_at)')
+            self.conn = conn
+            self.pid = pid
+        return self.conn
+
+    def take(self, key, budget, cost, force=False):
+        now = time.time()
+        with self.lock:
+            conn = self.connect()
+            # Leer y escribir en la misma transacción para que dos workers
+            # no gasten los mismos tokens
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT tokens, updated_at FROM quota_buckets WHERE key = ?',
+                                   (key,)).fetchone()
+                tokens = refill(row[0], row[1], budget, now) if row else budget.capacity
+                tokens, allowed, retry_after = take_tokens(tokens, budget, cost, force)
+                if allowed:
+                    conn.execute(
+                        'INSERT OR REPLACE INTO quota_buckets (key, tokens, updated_at, full_at) '
+                        'VALUES (?, ?, ?, ?)', (key, tokens, now, full_at(tokens, budget, now)))
+                    self.writes += 1
+                    if self.writes % self.PRUNE_EVERY == 0:
+                        conn.execute('DELETE FROM quota_buckets WHERE full_at <= ?', (now,))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        return allowed, retry_after
+
+
+class QuotaEngine:
+    """Comprueba y cobra los presupuestos de cada usuario."""
+
+    def __init__(self, store, budgets, enabled=True, max_denied=QUOTA_MAX_ENTRIES):
+        self.store = store
+        self.budgets = {budget.name: budget for budget in budgets}
+        self.enabled = enabled
+        self.max_denied = max_denied
+        self.lock = threading.Lock()
+        # Camino rápido: (usuario, presupuesto) -> (agotado hasta, consumo rechazado)
+        self.denied = OrderedDict()
+
+    def recently_denied(self, key, now, cost):
+        with self.lock:
+            entry = self.denied.get(key)
+            if entry is None:
+                return False
+            until, denied_cost = entry
+            if until > now:
+                # Un consumo menor que el rechazado aún puede caber
+                return cost >= denied_cost
+            del self.denied[key]
+            return False
+
+    def forget_denied(self, key):
+        with self.lock:
+            self.denied.pop(key, None)
+
+    def remember_denied(self, key, until, cost):
+        with self.lock:
+            self.denied[key] = (until, cost)
+            self.denied.move_to_end(key)
+            while len(self.denied) > self.max_denied:
+                self.denied.popitem(last=False)
+
+    def allow(self, subject, budget_name, cost=1):
+        """Consumir `cost` del presupuesto; False si no queda suficiente (cost=0 solo comprueba)"""
+        budget = self.budgets[budget_name]
+        if not self.enabled or not budget.capacity:
+            return True
+
+        key = f"{budget_name}:{subject}"
+        now = time.time()
+        if self.recently_denied(key, now, cost):
+            return False
+
+        try:
+            allowed, retry_after = self.store.take(key, budget, cost)
+        except sqlite3.Error as e:
+            # Si el almacén falla, no bloquear a los usuarios
+            logger.warning("Quota store error: %s", e)
+            return True
+
+        if not allowed:
+            self.remember_denied(key, now + retry_after, cost)
+        return allowed
+
+    def charge(self, subject, budget_name, amount):
+        """Cobrar un gasto ya realizado (p. ej. el coste en dólares de una respuesta)"""
+        budget = self.budgets[budget_name]
+        if not self.enabled or not budget.capacity or amount <= 0:
+            return
+        try:
+            self.store.take(f"{budget_name}:{subject}", budget, amount, force=True)
+        except sqlite3.Error as e:
+            logger.warning("Quota store error: %s", e)
+
+    def refund(self, subject, budget_name, amount):
+        """Devolver al cubo una reserva que no se llegó a gastar"""
+        budget = self.budgets[budget_name]
+        if not self.enabled or not budget.capacity or amount <= 0:
+            return
+        key = f"{budget_name}:{subject}"
+        try:
+            self.store.take(key, budget, -amount, force=True)
+        except sqlite3.Error as e:
+            logger.warning("Quota store error: %s", e)
+            return
+        self.forget_denied(key)
+
+    def settle(self, subject, budget_name, reserved, spent):
+        """Ajustar una reserva al gasto real: cobrar el exceso o devolver lo que sobra"""
+        if spent > reserved:
+            self.charge(subject, budget_name, spent - reserved)
+        else:
+            self.refund(subject, budget_name, reserved - spent)
+
+
+def create_store(backend=QUOTA_BACKEND):
+    """Crear el almacén configurado ('sqlite' o 'memory')"""
+    if backend == 'memory':
+        return MemoryBucketStore()
+    if backend == 'sqlite':
+        return SQLiteBucketStore(QUOTA_PATH)
+    raise ValueError(f"Unknown quota backend: {backend}")
+
+
+quota_engine = QuotaEngine(create_store(), [
+    Budget('extract', QUOTA_EXTRACT_LIMIT),
+    Budget('analyze', QUOTA_ANALYZE_LIMIT),
+    Budget('llm_dollars', QUOTA_LLM_DOLLARS),
+], enabled=QUOTA_ENABLED)
@@ -0,0 +1,165 @@
+"""Resolución DNS con caché y fijación de IP (pinning) para la protección SSRF.
+
+Cada nombre se resuelve una sola vez por TTL; se comprueban todas las
+direcciones A/AAAA contra las reglas de IPs privadas/loopback, y las
+conexiones posteriores (incluidos los saltos de redirección) se hacen a una
+de esas mismas direcciones ya validadas, sin volver a resolver. Así se evita
+la doble resolución y el DNS rebinding entre la comprobación y la conexión.
+"""
+
+import asyncio
+import ipaddress
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+from .config import DNS_CACHE_TTL, DNS_NEGATIVE_TTL, DNS_CACHE_MAX_ENTRIES
+from .metrics import ssrf_rejections
+
+# Prefijo NAT64 conocido (RFC 6052): los 32 bits finales son la IPv4 de destino
+NAT64_PREFIX = ipaddress.ip_network('64:ff9b::/96')
+
+
+class BlockedAddress(Exception):
+    """El nombre resuelve (al menos) a una IP que no es pública (privada, loopback, etc.)."""
+
+    def __init__(self, host, address):
+        self.host = host
+        self.address = address
+        super().__init__(f"{host} resolves to a blocked address ({address})")
+
+
+def is_blocked_ip(address):
+    """Comprobar si una IP no es una dirección pública de unicast
+
+    Además de las privadas, loopback, link-local y no especificada, se bloquean
+    CGNAT (100.64/10), las reservadas (240/4), documentación, benchmarking y
+    multicast (que ipaddress considera global).
+    """
+    ip_obj = ipaddress.ip_address(address.split('%')[0])
+    # Las IPv4 dentro de una IPv6 (::ffff:127.0.0.1, 6to4 y NAT64) se comprueban como IPv4
+    if ip_obj.version == 6:
+        if ip_obj.ipv4_mapped is not None:
+            ip_obj = ip_obj.ipv4_mapped
+        elif ip_obj.sixtofour is not None:
+            ip_obj = ip_obj.sixtofour
+        elif ip_obj in NAT64_PREFIX:
+            ip_obj = ipaddress.IPv4Address(int(ip_obj) & 0xFFFFFFFF)
+    return not ip_obj.is_global or ip_obj.is_multicast
+
+
+class Resolution:
+    """Resultado (cacheado) de resolver un nombre."""
+
+    def __init__(self, host, addresses, error, expires_at):
+        self.host = host
+        self.addresses = addresses
+        self.error = error
+        self.expires_at = expires_at
+        # Primera dirección bloqueada (si hay alguna)
+        self.blocked = next((a for a in addresses if is_blocked_ip(a)), None)
+
+    @property
+    def fresh(self):
+        return time.monotonic() < self.expires_at
+
+
+class DNSCache:
+    """Caché LRU de resoluciones DNS con TTL, compartida por los hilos del proceso.
+
+    getaddrinfo no expone el TTL real de los registros, así que se usa un TTL
+    configurable (DNS_CACHE_TTL) y otro más corto para los fallos.
+    """
+
+    def __init__(self, ttl=DNS_CACHE_TTL, negative_ttl=DNS_NEGATIVE_TTL,
+                 max_entries=DNS_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'lookups': 0, 'hits': 0, 'misses': 0, 'failures': 0,
+                      'resolve_seconds': 0.0, 'last_resolve_seconds': 0.0}
+
+    def cached(self, host):
+        """Devolver la resolución cacheada si sigue vigente"""
+        with self.lock:
+            self.stats['lookups'] += 1
+            entry = self.entries.get(host)
+            if entry is not None and entry.fresh:
+                self.entries.move_to_end(host)
+                self.stats['hits'] += 1
+                return entry
+            self.stats['misses'] += 1
+            return None
+
+    def store(self, host, infos, error, elapsed):
+        """Guardar el resultado de getaddrinfo y la latencia de la resolución"""
+        addresses = []
+        for info in infos or ():
+            address = info[4][0]
+            if address not in addresses:
+                addresses.append(address)
+
+        ttl = self.ttl if addresses else self.negative_ttl
+        entry = Resolution(host, addresses, error, time.monotonic() + ttl)
+
+        with self.lock:
+            self.stats['resolve_seconds'] += elapsed
+            self.stats['last_resolve_seconds'] = elapsed
+            if error is not None:
+                self.stats['failures'] += 1
+            self.entries[host] = entry
+            self.entries.move_to_end(host)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def resolve(self, host):
+        """Resolver un nombre (bloqueante, con caché)"""
+        entry = self.cached(host)
+        if entry is not None:
+            return entry
+
+        start = time.perf_counter()
+        infos, error = None, None
+        try:
+            infos = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        except (socket.gaierror, UnicodeError) as e:
+            error = e
+        return self.store(host, infos, error, time.perf_counter() - start)
+
+    async def resolve_async(self, host):
+        """Resolver un nombre sin bloquear el bucle de eventos (con caché)"""
+        entry = self.cached(host)
+        if entry is not None:
+            return entry
+
+        start = time.perf_counter()
+        infos, error = None, None
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        except (socket.gaierror, UnicodeError) as e:
+            error = e
+        return self.store(host, infos, error, time.perf_counter() - start)
+
+    def pinned_address(self, host, entry=None):
+        """Dirección validada a la que conectarse (lanza BlockedAddress si no es segura)"""
+        entry = entry or self.resolve(host)
+        if entry.blocked:
+            ssrf_rejections.labels('connect').inc()
+            raise BlockedAddress(host, entry.blocked)
+        if not entry.addresses:
+            raise socket.gaierror(socket.EAI_NONAME, f"Could not resolve {host}")
+        return entry.addresses[0]
+
+    async def pinned_address_async(self, host):
+        return self.pinned_address(host, await self.resolve_async(host))
+
+    def snapshot(self):
+        with self.lock:
+            return {**self.stats, 'entries': len(self.entries)}
+
+
+dns_cache = DNSCache()
@@ -1,41 +1,72 @@
-from flask import Flask, request, jsonify, session, render_template, redirect, url_for, send_from_directory
+from flask import Flask, request, jsonify, session, render_template, redirect, url_for, send_from_directory, Response, stream_with_context
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address 
 from flask_cors import CORS
-from openai import OpenAI
 import requests
-from bs4 import BeautifulSoup
-import traceback
+import json
 import time
 import os
 from dotenv import load_dotenv
 from Crypto.Cipher import AES
 import base64
 import hashlib
+import hmac
 import uuid
 from Crypto.Util.Padding import unpad
-from urllib.parse import urlparse
-import socket
-import ipaddress
 import html
-from datetime import datetime, timedelta
-from collections import defaultdict
 from base64 import b64decode
+from .fetcher import fetch_head, UnsupportedContentType, RedirectRejected, DEFAULT_HEADERS
+from .cache import metadata_cache, analysis_cache, with_cache_status
+from .llm import (analysis_cache_key, read_analysis_input, analysis_payload, request_analysis,
+                  analyze_structured, format_analysis, AnalysisFailed, PROMPT_VERSION,
+                  STRUCTURED_PROMPT_VERSION, token_cost as llm_token_cost)
+from .http_client import pool_stats
+from .openai_clients import openai_clients
+from .resolver import BlockedAddress
+from .extractor import page_response
+from .validation import validate_url
+from .batch import extract_batch
+from .sitemap import crawl_sitemap
+from .duplicates import duplicate_store, site_domain
+from .jobs import (job_store, seal_secret, describe as describe_job, ACTIVE as ACTIVE_JOB_STATUSES,
+                   RETRYABLE as RETRYABLE_JOB_STATUSES)
+from .config import (BATCH_MAX_URLS, SITEMAP_MAX_URLS, BULK_MAX_ITEMS, BULK_MAX_SECONDS,
+                     SCORE_MAX_ITEMS, RATELIMIT_STORAGE_URI,
+                     QUOTA_EXTRACT_LIMIT, QUOTA_ANALYZE_LIMIT, QUOTA_LLM_DOLLARS, QUOTA_LLM_RESERVE,
+                     METRICS_ENABLED,
+                     METRICS_TOKEN, JOBS_MAX_ITEMS, JOBS_MAX_PENDING, JOBS_STREAM_SECONDS)
+from .bulk import BulkAnalyzer
+from .brute_force import brute_force_store
+from .quotas import quota_engine
+from .sessions import init_sessions
+from .scoring import score_inputs, score_batch
+from .metrics import render as render_metrics, rate_limited, quota_denied
+from .logs import setup_logging, request_id
+# Registra el esquema sqlite:// para el almacenamiento de Flask-Limiter
+from . import limiter_storage  # noqa: F401
+
+# Registro JSON en cola (antes de crear la app para que Flask no añada su handler)
+setup_logging()
 
 app = Flask(__name__)
 limiter = Limiter(
     get_remote_address, 
     app=app,
-    default_limits=['3 per hour']
+    default_limits=['3 per hour'],
+    # Contadores compartidos por todos los workers (SQLite o Redis)
+    storage_uri=RATELIMIT_STORAGE_URI,
+    # Si el almacenamiento falla, seguir limitando en memoria del proceso
+    in_memory_fallback_enabled=True
 )
 # Configuración de secreto para las sesiones
 app.secret_key = os.getenv("SECRET_KEY")
-# Configurar la permanencia de las sesiones
-app.config['SESSION_TYPE'] = 'filesystem'
+# Configurar la permanencia y la cookie de las sesiones (las usan todos los backends)
 app.config['SESSION_PERMANENT'] = True
 app.config['PERMANENT_SESSION_LIFETIME'] = 86400  # 24 horas
 app.config['SESSION_COOKIE_SECURE'] = True         # HTTPS
 app.config['SESSION_COOKIE_SAMESITE'] = 'None'     #  Cookie set
+# Sesiones en memoria + tabla compartida (o Flask-Session con SESSION_BACKEND=filesystem)
+init_sessions(app)
 
 
 
@@ -48,12 +79,6 @@ CORS(app, resources={r"/*": {"origins": allowed_origins}},
 # Cargar variables de entorno usando una ruta relativa
 load_dotenv()
 
-# Protección contra ataques de fuerza bruta
-login_attempts = defaultdict(int)
-blocked_ips = {}
-MAX_ATTEMPTS = 5
-BLOCK_TIME_MINUTES = 15
-
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 # Añadir encabezados de seguridad a todas las respuestas
@@ -78,6 +103,8 @@ def add_security_headers(response):
     response.headers['Cache-Control'] = 'no-store'
     # No exponer información de la plataforma
     response.headers['Server'] = ''
+    # Id de la petición para relacionarla con los registros
+    response.headers['X-Request-ID'] = request_id()
     return response
 
 
@@ -96,7 +123,7 @@ def decrypt_api_key(encrypted_key, passphrase=None):
         decrypted = unpad(cipher.decrypt(ciphertext), AES.block_size)
         return decrypted.decode('utf-8')
     except Exception as e:
-        print(f"Error al desencriptar: {e}")
+        app.logger.warning("Error al desencriptar: %s", e)
         return None
 
 
@@ -143,29 +170,72 @@ def set_key():
 
         return {"message": "Key decrypted and saved successfully"}, 200
     except Exception as e:
-        print(f"Error in set-key: {e}")
+        app.logger.warning("Error in set-key: %s", e)
         # Incrementar intentos fallidos en caso de error
         client_ip = request.remote_addr
         increment_attempts(client_ip)
         return {"error": str(e)}, 500
 
 
-def can_use_tool(user_id):
-    # Comentamos temporalmente el código que usa Redis
-    # key = f'user:{user_id}:tool:usage'
-    # count = r.get(key)
-    # if count is None:
-    #     r.set(key, 1, ex=86400)  # Expira en 24 horas (86400 segundos)
-    #     return True
-    # elif int(count) < 3:
-    #     r.incr(key)
-    #     return True
-    # return False
+def analysis_api_key():
+    """API key de OpenAI: la guardada en la sesión con /set-key o la del servidor"""
+    return session.get("openai_key") or OPENAI_API_KEY
+
+
+def quota_subject():
+    """Titular de la cuota: el session_id de la sesión o, en su defecto, la IP
+
+    El user_id del cuerpo no cuenta: bastaría con cambiarlo para estrenar cubo.
+    """
+    if session.get("session_id"):
+        return f"session:{session['session_id']}"
+    return f"ip:{request.remote_addr}"
+
+
+def can_use_tool(budget='extract', cost=1):
+    """Consumir `cost` unidades de la cuota del usuario (una por URL que se descarga)"""
+    return quota_engine.allow(quota_subject(), budget, cost)
+
+
+def refund_extractions(subject, reserved, extracted):
+    """Devolver las extracciones reservadas que no se llegaron a hacer"""
+    quota_engine.refund(subject, 'extract', reserved - extracted)
+
+
+def reserve_analyses(subject, count=1):
+    """Reservar `count` análisis y su gasto estimado en OpenAI antes de llamarlo
 
-    # Temporalmente, siempre permitimos el uso de la herramienta
+    Se ajusta con settle_analyses; así un lote no puede gastar más de lo que queda.
+    """
+    reserved_dollars = count * QUOTA_LLM_RESERVE
+    if not quota_engine.allow(subject, 'llm_dollars', cost=reserved_dollars):
+        return False
+    if not quota_engine.allow(subject, 'analyze', cost=count):
+        quota_engine.refund(subject, 'llm_dollars', reserved_dollars)
+        return False
     return True
 
 
+def settle_analyses(subject, reserved, analyzed, token_cost):
+    """Cobrar el coste real de los análisis hechos y devolver el resto de la reserva"""
+    quota_engine.refund(subject, 'analyze', reserved - analyzed)
+    quota_engine.settle(subject, 'llm_dollars', reserved * QUOTA_LLM_RESERVE, token_cost)
+
+
+def usage_limit_exceeded(budget='extract'):
+    """Respuesta 429 cuando el usuario agotó su cuota"""
+    quota_denied.labels(budget).inc()
+    if budget == 'analyze':
+        message = (f"You have reached the daily analysis limit "
+                   f"({QUOTA_ANALYZE_LIMIT:g} analyses or ${QUOTA_LLM_DOLLARS:g} of usage).")
+    else:
+        message = f"You have reached the daily extraction limit ({QUOTA_EXTRACT_LIMIT:g})."
+    return jsonify({
+        "error": "Usage limit exceeded",
+        "message": f"{message} Please try again tomorrow."
+    }), 429  # 429 = Too Many Requests
+
+
 @app.route('/')
 def index():
     return jsonify({
@@ -173,7 +243,16 @@ def index():
         "message": "SERP Title Checker API is running",
         "endpoints": {
             "analyze": "/analyze - POST: Analyze title and meta description",
+            "analyze-stream": "/analyze/stream - POST: Analyze title and meta description (Server-Sent Events)",
+            "analyze-bulk": "/analyze/bulk - POST: Analyze many title/description pairs (NDJSON)",
+            "score": "/score - POST: Score title and meta description locally against SERP rules",
             "extract-meta": "/extract-meta - POST: Extract metadata from URL",
+            "extract-meta-batch": "/extract-meta/batch - POST: Extract metadata from a list of URLs",
+            "extract-meta-sitemap": "/extract-meta/sitemap - POST: Extract metadata from every URL in a sitemap (NDJSON)",
+            "duplicates": "/duplicates - GET: Near-duplicate titles and descriptions of an audited domain",
+            "jobs": "/jobs - POST: Queue a long extraction or analysis job; /jobs/<id> - GET: Job status",
+            "job-results": "/jobs/<id>/results - GET: Results of a job (paginated)",
+            "job-events": "/jobs/<id>/events - GET: Job progress (NDJSON)",
             "health": "/api/health - GET: Check API health"
         }
     })
@@ -184,204 +263,64 @@ def index():
 def extract_meta():
     data = request.json
     url = data.get("url")
-    # Si no se proporciona ID, usar "anonymous"
-    user_id = data.get("user_id", "anonymous")
 
     if not url:
         return jsonify({"message": "Please provide a URL"}), 400
 
     # Validación de URL para evitar SSRF y otros ataques
-    try:
-        # Comprobar si la URL es válida
-        parsed_url = urlparse(url)
-
-        # Verificar que tiene esquema y dominio
-        if not parsed_url.scheme or not parsed_url.netloc:
-            return jsonify({"error": "Invalid URL format"}), 400
-
-        # Verificar que el esquema es http o https
-        if parsed_url.scheme not in ['http', 'https']:
-            return jsonify({"error": "URL must use HTTP or HTTPS protocol"}), 400
-
-        # Opcional: bloquear IPs privadas/localhost para prevenir SSRF
-        try:
-            domain = parsed_url.netloc.split(':')[0]
-            ip = socket.gethostbyname(domain)
-            ip_obj = ipaddress.ip_address(ip)
-
-            if ip_obj.is_private or ip_obj.is_loopback:
-                return jsonify({"error": "Private or loopback IPs are not allowed"}), 403
-        except:
-            # Si no se puede resolver el dominio, continuar (podría ser un nombre de dominio válido pero no resoluble)
-            pass
-    except Exception as e:
-        return jsonify({"error": f"URL validation error: {str(e)}"}), 400
+    rejected = validate_url(url)
+    if rejected:
+        payload, status = rejected
+        return jsonify(payload), status
 
     # Verificar si el usuario puede usar la herramienta
-    if not can_use_tool(user_id):
-        return jsonify({
-            "error": "Usage limit exceeded",
-            "message": "You have reached the daily extraction limit (3). Please try again tomorrow."
-        }), 429  # 429 = Too Many Requests
+    if not can_use_tool():
+        return usage_limit_exceeded()
 
     # Verificar que tenemos una API key
 
-    try:
-        # Agregar timeout para evitar esperas prolongadas
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Referer': 'https://www.google.com/'
-        }
+    # Consultar la caché de metadatos (compartida entre workers)
+    # La página va al índice de duplicados de este usuario aunque otro ya la tuviera en caché
+    subject = quota_subject()
+    cached = metadata_cache.lookup(url)
+    if cached and cached.fresh:
+        duplicate_store.record(url, cached.value, subject)
+        return jsonify(with_cache_status(cached.value, 'hit'))
 
-        # Iniciar temporizador
-        start_time = time.time()
-
-        # Asegurar la verificación de certificados
-        response = requests.get(url, headers=headers, timeout=10, verify=True)
-
-        # Calcular tiempo de respuesta
-        response_time = time.time() - start_time
-
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            # Extracción del título
-            title = soup.find('title')
-            title_text = title.get_text() if title else 'Title not found'
-
-            # Sanitizar salida
-            title_text = html.escape(title_text)
-
-            # Extracción de metadatos
-            metadata = {}
-
-            # Meta description - diferentes formatos
-            meta_description = soup.find('meta', attrs={'name': 'description'})
-            if not meta_description:
-                meta_description = soup.find(
-                    'meta', attrs={'property': 'og:description'})
-            if not meta_description:
-                meta_description = soup.find(
-                    'meta', attrs={'property': 'twitter:description'})
-            if not meta_description:
-                meta_description = soup.find(
-                    'meta', attrs={'itemprop': 'description'})
-
-            desc_content = meta_description.get(
-                'content') if meta_description else 'Meta description not found'
-            # Sanitizar contenido
-            desc_content = html.escape(desc_content)
-            metadata['description'] = desc_content
-
-            # Detección de plataforma CMS
-            is_wordpress = False
-            generator = soup.find('meta', attrs={'name': 'generator'})
-            if generator and 'wordpress' in generator.get('content', '').lower():
-                is_wordpress = True
-
-            # WordPress suele tener enlaces a wp-json
-            wp_api_links = soup.find_all(
-                'link', attrs={'rel': 'https://api.w.org/'})
-            if wp_api_links:
-                is_wordpress = True
-
-            metadata['platform'] = 'WordPress' if is_wordpress else 'Unknown'
-
-            # Open Graph title
-            og_title = soup.find('meta', attrs={'property': 'og:title'})
-            metadata['og_title'] = og_title.get(
-                'content') if og_title else title_text
-
-            # Twitter title
-            twitter_title = soup.find(
-                'meta', attrs={'property': 'twitter:title'})
-            if not twitter_title:
-                twitter_title = soup.find(
-                    'meta', attrs={'name': 'twitter:title'})
-            metadata['twitter_title'] = twitter_title.get(
-                'content') if twitter_title else title_text
-
-            # Open Graph image - buscar diferentes variantes
-            og_image = soup.find('meta', attrs={'property': 'og:image'})
-            if not og_image:
-                og_image = soup.find('meta', attrs={'name': 'og:image'})
-            if not og_image:
-                og_image = soup.find(
-                    'meta', attrs={'property': 'twitter:image'})
-            if not og_image:
-                og_image = soup.find('meta', attrs={'name': 'twitter:image'})
-
-            metadata['og_image'] = og_image.get(
-                'content') if og_image else 'Image not found'
-
-            # Canonical URL - varios formatos
-            canonical = soup.find('link', attrs={'rel': 'canonical'})
-            if not canonical:
-                # Buscar en meta tags alternativas
-                canonical_meta = soup.find(
-                    'meta', attrs={'property': 'og:url'})
-                if canonical_meta:
-                    metadata['canonical'] = canonical_meta.get('content')
-                else:
-                    metadata['canonical'] = url
-            else:
-                metadata['canonical'] = canonical.get(
-                    'href') if canonical else url
-
-            # Meta keywords
-            keywords = soup.find('meta', attrs={'name': 'keywords'})
-            metadata['keywords'] = keywords.get(
-                'content') if keywords else 'Keywords not found'
-
-            # Extracción de etiquetas para WordPress
-            if is_wordpress:
-                # Extraer categorías y etiquetas en WordPress
-                categories = []
-                tags = []
-
-                # Buscar enlaces a categorías
-                category_links = soup.find_all('a', attrs={'rel': 'category'})
-                for link in category_links:
-                    if link.get_text():
-                        categories.append(link.get_text().strip())
-
-                # Buscar enlaces a etiquetas
-                tag_links = soup.find_all('a', attrs={'rel': 'tag'})
-                for link in tag_links:
-                    if link.get_text():
-                        tags.append(link.get_text().strip())
-
-                metadata['categories'] = categories if categories else []
-                metadata['tags'] = tags if tags else []
-
-                # Si no hay keywords pero hay etiquetas, usar etiquetas como keywords
-                if metadata['keywords'] == 'Keywords not found' and tags:
-                    metadata['keywords'] = ', '.join(tags)
-
-            # H1 (primer encabezado)
-            h1 = soup.find('h1')
-            metadata['h1'] = h1.get_text().strip() if h1 else 'H1 not found'
-
-            # Información adicional para diagnóstico
-            metadata['response_time'] = f"{response_time:.2f} seconds"
-            metadata['status_code'] = response.status_code
-            metadata['content_type'] = response.headers.get(
-                'Content-Type', 'Unknown')
-            # URL final después de redirecciones
-            metadata['url_final'] = response.url
-
-            return jsonify({
-                "title": title_text,
-                "meta_description": metadata['description'],
-                "metadata": metadata
-            })
-        else:
-            return jsonify({
-                "error": f"Failed with status code: {response.status_code}",
-                "message": f"Request failed with status code {response.status_code}"
-            }), 500
+    try:
+        # Si hay una entrada caducada, revalidarla con un GET condicional
+        headers = None
+        if cached:
+            headers = {**DEFAULT_HEADERS, **cached.conditional_headers()}
+
+        # Descarga en streaming: se corta la conexión tras </head>
+        # (más el presupuesto configurado para h1 y categorías/etiquetas)
+        response = fetch_head(url, headers=headers)
+
+        if response.status_code == 304 and cached:
+            metadata_cache.revalidated(cached)
+            duplicate_store.record(url, cached.value, subject)
+            return jsonify(with_cache_status(cached.value, 'revalidated'))
+
+        # Tiempo de respuesta
+        response_time = response.elapsed
+
+        payload, status = page_response(response, url, response_time)
+        if status == 200:
+            metadata_cache.save(url, payload, response.headers)
+            duplicate_store.record(url, payload, subject)
+            payload = with_cache_status(payload, 'miss')
+        return jsonify(payload), status
+    except RedirectRejected as e:
+        return jsonify(e.payload), e.status
+    except BlockedAddress:
+        # El nombre pasó a resolver a una IP privada entre la validación y la conexión
+        return jsonify({"error": "Private or loopback IPs are not allowed"}), 403
+    except UnsupportedContentType as e:
+        return jsonify({
+            "error": "Unsupported Content-Type",
+            "message": f"The URL did not return an HTML document ({e.content_type})"
+        }), 415
     except requests.exceptions.Timeout:
         return jsonify({
             "error": "Timeout",
@@ -399,8 +338,7 @@ def extract_meta():
         }), 500
     except Exception as e:
         # Registrar el error completo
-        print(f"Error extracting metadata from {url}: {str(e)}")
-        print(traceback.format_exc())
+        app.logger.exception("Error extracting metadata", extra={'url': url})
 
         return jsonify({
             "error": str(e),
@@ -408,109 +346,155 @@ def extract_meta():
         }), 500
 
 
-@app.route('/analyze', methods=['POST'])
+@app.route('/extract-meta/batch', methods=['POST'])
 @limiter.limit("5 per day")
-def analyze_AI():
+def extract_meta_batch():
+    data = request.json or {}
+    urls = data.get("urls")
+
+    if not urls or not isinstance(urls, list):
+        return jsonify({"message": "Please provide a list of URLs"}), 400
+
+    if len(urls) > BATCH_MAX_URLS:
+        return jsonify({
+            "error": "Too many URLs",
+            "message": (f"A batch can contain at most {BATCH_MAX_URLS} URLs; "
+                        f"submit longer lists to POST /jobs")
+        }), 400
+
+    # Verificar si el usuario puede usar la herramienta (una extracción por URL)
+    if not can_use_tool(cost=len(urls)):
+        return usage_limit_exceeded()
+
     try:
-        # Obtener datos del request
-        data = request.json
-        title = data.get("title", "")
-        meta_description = data.get("description", "")
-        user_id = data.get("user_id", "anonymous")
-        keyword = data.get("keyword", "")
-        brand = data.get("brand", "")
-
-        # Validar entradas
-        if not title or len(title) > 150:
-            return jsonify({
-                "error": "Invalid title",
-                "message": "Title is required and must be less than 150 characters"
-            }), 400
+        # Descargas concurrentes; cada URL lleva su propio resultado o error
+        subject = quota_subject()
+        results, expired = extract_batch(urls, subject)
+        # Devolver las URLs que no dio tiempo a extraer
+        refund_extractions(subject, len(urls), len(urls) - expired)
+        return jsonify({"count": len(results), "deadline_reached": bool(expired),
+                        "results": results})
+    except Exception as e:
+        app.logger.exception("Error in batch extraction")
 
-        if len(meta_description) > 500:
-            return jsonify({
-                "error": "Invalid description",
-                "message": "Description must be less than 500 characters"
-            }), 400
-
-        # Sanitizar entradas para evitar inyección
-        title = html.escape(title)
-        meta_description = html.escape(meta_description)
-        keyword = html.escape(keyword)
-        brand = html.escape(brand)
-
-        # Verificar si el usuario puede usar la herramienta
-        if not can_use_tool(user_id):
-            return jsonify({
-                "error": "Usage limit exceeded",
-                "message": "You have reached the daily analysis limit (3). Please try again tomorrow."
-            }), 429
+        return jsonify({
+            "error": str(e),
+            "message": "An error occurred while processing the request"
+        }), 500
 
 
-        # Crear el prompt para OpenAI
-        prompt = f"""
-       As a SEO Expert, evaluate the current Title "{title}" and Meta Description "{meta_description}" for SEO effectiveness and CTR potential in the SERP.
+@app.route('/extract-meta/sitemap', methods=['POST'])
+@limiter.limit("5 per day")
+def extract_meta_sitemap():
+    # Rastreo de un sitemap o índice de sitemaps; resultados en NDJSON según terminan
+    data = request.json or {}
+    url = data.get("url")
+    max_urls = data.get("max_urls", SITEMAP_MAX_URLS)
 
-The focus keyword is: "{keyword} and brand is: {brand}"
+    if not url or not isinstance(url, str):
+        return jsonify({"message": "Please provide a sitemap URL"}), 400
 
-Your task:
+    if (not isinstance(max_urls, int) or isinstance(max_urls, bool)
+            or not 0 < max_urls <= SITEMAP_MAX_URLS):
+        return jsonify({
+            "error": "Invalid max_urls",
+            "message": f"max_urls must be between 1 and {SITEMAP_MAX_URLS}"
+        }), 400
 
-1. Estimate the CTR of the current Title and Meta Description.
-2. Propose a new SEO-optimized Title and Meta Description, using the focus keyword to increase both ranking and CTR.
-3. STRICTLY RESPECT character limits:
-   - Title: maximum 60 characters including spaces and {brand} at the end.
-   - Meta Description: maximum 155 characters including spaces.
-   - You MUST count the characters (including spaces) and ensure the Title is max 60 and the Meta Description max 155. Never exceed. If needed, rewrite or shorten.
-4. Capitalize every word in the Title, except for articles, prepositions, and conjunctions (e.g., "di", "e", "a", "con", "su").
-5. The Meta Description must include the focus keyword **if possible** in a natural way and should help to increase the CTR by being clear, appealing, and action-oriented.
-6. Provide an estimation of how much the new Title and Description could increase the CTR. DON'T USE DATA (YEAR) IN TITLE OR META DESCRIPTION.
+    # Validación de URL para evitar SSRF (cada URL del sitemap se valida también)
+    rejected = validate_url(url)
+    if rejected:
+        payload, status = rejected
+        return jsonify(payload), status
 
-Format your answer exactly as follows and REPLY IN THE SAME LANGUAGE as the user:
+    # Verificar si el usuario puede usar la herramienta (se reservan max_urls extracciones)
+    if not can_use_tool(cost=max_urls):
+        return usage_limit_exceeded()
 
-SEO Title: [new title, max 60 characters]  
-Meta Description: [new description, max 155 characters]  
-CTR Estimation (Original): [estimated CTR in %]  
-CTR Estimation (Optimized): [estimated CTR in %]  
-CTR Increase: [estimated % increase]
+    subject = quota_subject()
 
+    def generate():
+        extracted = 0
+        try:
+            for result in crawl_sitemap(url, max_urls, subject):
+                if "url" in result:
+                    extracted += 1
+                yield json.dumps(result) + "\n"
+        finally:
+            # Devolver las URLs que el sitemap no tenía o que no dio tiempo a extraer
+            refund_extractions(subject, max_urls, extracted)
 
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no'})
+
+
+@app.route('/analyze', methods=['POST'])
+@limiter.limit("5 per day")
+def analyze_AI():
+    try:
+        # Obtener datos del request
+        data = request.json
 
-"""
+        inputs, error = read_analysis_input(data)
+        if error:
+            payload, status = error
+            return jsonify(payload), status
 
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        
+        # Puntuación local: si el par ya cumple todas las reglas no se llama a OpenAI
+        score = score_inputs(inputs) if data.get("prescreen") else None
+        if score and score['passed']:
+            return jsonify(analysis_payload(inputs, None, 0, 'skipped', score))
 
-        response = client.responses.create(
-            model="gpt-4.1",
-            instructions="You are SEO Expert with more over 11 years of experience, please provide the best solution for the user to increase CTR in SERP.",
-            input=prompt
-        )
+        # Verificar si el usuario puede usar la herramienta (reserva el gasto estimado)
+        subject = quota_subject()
+        if not reserve_analyses(subject):
+            return usage_limit_exceeded('analyze')
 
-        result = response.output_text
-        token_input = response.usage.input_tokens
-        token_input_cost = int(token_input) * (3 / 1000000)
-        token_output = response.usage.output_tokens
-        token_output_cost = int(token_output) * (12 / 1000000)
-        token_cost = token_input_cost + token_output_cost
-        print(f"{token_cost} $")
-        print(result)
+        token_cost = 0
+        try:
+            # Consultar la caché de resultados (salvo que se pida ignorarla)
+            use_cache = not data.get("no_cache", False)
+            # Modo estructurado: campos tipados y límites comprobados en local
+            structured = bool(data.get("structured"))
+            cache_key = analysis_cache_key(
+                **inputs, prompt_version=STRUCTURED_PROMPT_VERSION if structured else PROMPT_VERSION)
+            if use_cache:
+                cached = analysis_cache.get(cache_key)
+                if cached and cached.fresh:
+                    return jsonify(analysis_payload(inputs, cached.value['analysis'], 0, 'hit',
+                                                    score, cached.value.get('result')))
+
+            fields = None
+            with openai_clients.lease(analysis_api_key()) as client:
+                if structured:
+                    try:
+                        fields, token_cost = analyze_structured(client, inputs)
+                    except AnalysisFailed as e:
+                        # Respuesta inservible: se cobran igualmente los tokens gastados
+                        token_cost = e.token_cost
+                        raise
+                    result = format_analysis(fields)
+                else:
+                    response = request_analysis(client, inputs)
+                    result = response.output_text
+                    token_cost = llm_token_cost(response.usage)
+        finally:
+            # Cobrar el coste real y devolver el resto de la reserva
+            settle_analyses(subject, 1, 1, token_cost)
+        # Registro de éxito muestreado (el análisis se recorta a LOG_MAX_FIELD_CHARS)
+        app.logger.info("Analysis completed", extra={
+            'sample': True, 'token_cost': token_cost, 'analysis': result})
+
+        # No guardar un resultado estructurado que siga incumpliendo los límites
+        if fields is None or fields['valid']:
+            analysis_cache.set(cache_key, {'analysis': result, 'result': fields})
 
         # Devolver respuesta
-        return jsonify({
-            'status': 'success',
-            'data': {
-                'analysis': result,
-                'original': {
-                    'title': title,
-                    'description': meta_description,
-                    'token_cost': token_cost
-                }
-            }
-        })
+        return jsonify(analysis_payload(inputs, result, token_cost,
+                                        'miss' if use_cache else 'bypass', score, fields))
     except Exception as e:
         # Loguear el error
-        print("ERROR:", str(e))
-        print(traceback.format_exc())
+        app.logger.exception("Analysis failed")
 
         # Devolver error al cliente
         return jsonify({
@@ -518,8 +502,394 @@ CTR Increase: [estimated % increase]
             'message': str(e)
         }), 500
 
+
+def sse_event(event, data):
+    """Formatear un evento Server-Sent Events con datos JSON"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route('/analyze/stream', methods=['POST'])
+@limiter.limit("5 per day")
+def analyze_AI_stream():
+    # Igual que /analyze, pero reenvía los tokens por SSE a medida que llegan
+    data = request.json or {}
+
+    inputs, error = read_analysis_input(data)
+    if error:
+        payload, status = error
+        return jsonify(payload), status
+
+    # Verificar si el usuario puede usar la herramienta (reserva el gasto estimado)
+    subject = quota_subject()
+    if not reserve_analyses(subject):
+        return usage_limit_exceeded('analyze')
+
+    use_cache = not data.get("no_cache", False)
+    cache_key = analysis_cache_key(**inputs)
+    api_key = analysis_api_key()
+
+    def generate():
+        token_cost = 0
+        try:
+            # En un acierto de caché se envía el texto completo de una vez
+            if use_cache:
+                cached = analysis_cache.get(cache_key)
+                if cached and cached.fresh:
+                    analysis = cached.value['analysis']
+                    yield sse_event('delta', {'text': analysis})
+                    yield sse_event('done', analysis_payload(inputs, analysis, 0, 'hit'))
+                    return
+
+            parts = []
+            usage = None
+            # El cliente sigue prestado mientras dura el stream
+            with openai_clients.lease(api_key) as client:
+                for event in request_analysis(client, inputs, stream=True):
+                    if event.type == 'response.output_text.delta':
+                        parts.append(event.delta)
+                        yield sse_event('delta', {'text': event.delta})
+                    elif event.type == 'response.completed':
+                        usage = event.response.usage
+                    elif event.type in ('response.failed', 'error'):
+                        raise RuntimeError(f"OpenAI stream error: {event.type}")
+
+            result = ''.join(parts)
+            token_cost = llm_token_cost(usage) if usage else 0
+            app.logger.info("Streamed analysis completed", extra={
+                'sample': True, 'token_cost': token_cost})
+
+            analysis_cache.set(cache_key, {'analysis': result})
+
+            # Evento final con el mismo cuerpo que /analyze (uso y token_cost)
+            yield sse_event('done', analysis_payload(inputs, result, token_cost,
+                                                     'miss' if use_cache else 'bypass'))
+        except Exception as e:
+            app.logger.exception("Streamed analysis failed")
+            yield sse_event('error', {'status': 'error', 'message': str(e)})
+        finally:
+            settle_analyses(subject, 1, 1, token_cost)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'X-Accel-Buffering': 'no'})
+
+@app.route('/analyze/bulk', methods=['POST'])
+@limiter.limit("5 per day")
+def analyze_AI_bulk():
+    # Análisis de muchos pares título/descripción; resultados en NDJSON según terminan
+    data = request.json or {}
+    items = data.get("items")
+
+    if not items or not isinstance(items, list):
+        return jsonify({"message": "Please provide a list of items"}), 400
+
+    if len(items) > BULK_MAX_ITEMS:
+        return jsonify({
+            "error": "Too many items",
+            "message": (f"A bulk request can contain at most {BULK_MAX_ITEMS} items; "
+                        f"submit larger batches to POST /jobs")
+        }), 400
+
+    # Cada elemento cuenta como un análisis: se reservan todos con su gasto estimado
+    subject = quota_subject()
+    if not reserve_analyses(subject, len(items)):
+        return usage_limit_exceeded('analyze')
+
+    api_key = analysis_api_key()
+    use_cache = not data.get("no_cache", False)
+    prescreen = bool(data.get("prescreen"))
+
+    def settle_item(analyzed, token_cost):
+        # Cada elemento se cobra al terminar (aunque el worker muera después)
+        settle_analyses(subject, 1, int(analyzed), token_cost)
+
+    def generate():
+        with openai_clients.lease(api_key) as client:
+            # Los reintentos los gestiona BulkAnalyzer con su propio backoff; el lote tiene
+            # que terminar antes del timeout del worker
+            analyzer = BulkAnalyzer(client.with_options(max_retries=0), use_cache=use_cache,
+                                    prescreen=prescreen, max_seconds=BULK_MAX_SECONDS,
+                                    on_item=settle_item)
+            try:
+                for result in analyzer.run(items):
+                    yield json.dumps(result) + "\n"
+            finally:
+                # Devolver la reserva de los elementos que no llegaron a lanzarse
+                # (el cliente se desconectó a mitad)
+                finished = analyzer.totals['succeeded'] + analyzer.totals['failed']
+                settle_analyses(subject, len(items) - finished, 0, 0)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no'})
+
+
+@app.route('/score', methods=['POST'])
+@limiter.limit("60 per minute")
+def score():
+    # Puntuación local de las reglas de la SERP (sin llamar a OpenAI)
+    data = request.json or {}
+    items = data.get("items")
+
+    if items is None:
+        inputs, error = read_analysis_input(data)
+        if error:
+            payload, status = error
+            return jsonify(payload), status
+        return jsonify({"status": "success", "data": score_inputs(inputs)})
+
+    if not isinstance(items, list):
+        return jsonify({"message": "Please provide a list of items"}), 400
+
+    if len(items) > SCORE_MAX_ITEMS:
+        return jsonify({
+            "error": "Too many items",
+            "message": f"A score request can contain at most {SCORE_MAX_ITEMS} items"
+        }), 400
+
+    scores = score_batch(items)
+    return jsonify({
+        "status": "success",
+        "count": len(scores),
+        "passed": sum(1 for item_score in scores if item_score['passed']),
+        "results": scores
+    })
+
+
+@app.route('/duplicates', methods=['GET'])
+@limiter.limit("60 per hour")
+def duplicates():
+    # Títulos y descripciones casi duplicados entre las páginas de un dominio que extrajo el usuario
+    domain = site_domain(request.args.get("domain"))
+    limit = request.args.get("limit", 100, type=int)
+
+    if not domain:
+        return jsonify({"message": "Please provide a domain"}), 400
+
+    if not 0 < limit <= 1000:
+        return jsonify({
+            "error": "Invalid limit",
+            "message": "limit must be between 1 and 1000"
+        }), 400
+
+    if not duplicate_store.enabled:
+        return jsonify({"error": "Not found"}), 404
+
+    try:
+        report = duplicate_store.report(quota_subject(), domain, limit)
+        return jsonify({"status": "success", "data": report})
+    except Exception as e:
+        app.logger.exception("Error building duplicate report", extra={'domain': domain})
+        return jsonify({
+            "error": str(e),
+            "message": "An error occurred while processing the request"
+        }), 500
+
+
+# Campo del cuerpo de POST /jobs con los elementos de cada tipo de trabajo
+JOB_ITEMS = {
+    'extract': 'urls',
+    'analyze': 'items',
+}
+
+
+def sealed_session_key():
+    """API key de la sesión cifrada para el worker (None si se usa la del servidor)"""
+    api_key = session.get("openai_key")
+    return seal_secret(api_key) if api_key else None
+
+
+def job_not_found():
+    return jsonify({"error": "Not found", "message": "Job not found"}), 404
+
+
+def job_not_retryable(job):
+    return jsonify({
+        "error": "Job not retryable",
+        "message": f"Only failed, dead or cancelled jobs can be retried (status: {job['status']})"
+    }), 409
+
+
+def owned_job(job_id):
+    """Trabajo del usuario actual (None si no existe o es de otro: se responde igual, 404)"""
+    job = job_store.get(job_id)
+    if job is None or not hmac.compare_digest(job['subject'], quota_subject()):
+        return None
+    return job
+
+
+def admit_job(kind, subject, count):
+    """Comprobaciones para encolar un trabajo (también al reintentarlo); None si se admite
+
+    Cada elemento cuenta como una extracción o un análisis; el gasto en OpenAI
+    lo reserva y cobra el worker según avanza.
+    """
+    if job_store.pending(subject) >= JOBS_MAX_PENDING:
+        return jsonify({
+            "error": "Too many pending jobs",
+            "message": f"You can have at most {JOBS_MAX_PENDING} unfinished jobs"
+        }), 429
+
+    # Verificar si el usuario puede usar la herramienta
+    if kind == 'analyze':
+        if (not quota_engine.allow(subject, 'llm_dollars', cost=0)
+                or not quota_engine.allow(subject, 'analyze', cost=count)):
+            return usage_limit_exceeded('analyze')
+    elif not quota_engine.allow(subject, 'extract', cost=count):
+        return usage_limit_exceeded()
+    return None
+
+
+@app.route('/jobs', methods=['POST'])
+@limiter.limit("5 per day")
+def submit_job():
+    # Extracción o análisis largo en segundo plano: devuelve el id para consultar el progreso
+    data = request.json or {}
+    kind = data.get("type")
+
+    if kind not in JOB_ITEMS:
+        return jsonify({
+            "error": "Invalid job type",
+            "message": f"type must be one of: {', '.join(JOB_ITEMS)}"
+        }), 400
+
+    items = data.get(JOB_ITEMS[kind])
+    if not items or not isinstance(items, list):
+        return jsonify({"message": f"Please provide a list of {JOB_ITEMS[kind]}"}), 400
+
+    if len(items) > JOBS_MAX_ITEMS:
+        return jsonify({
+            "error": "Too many items",
+            "message": f"A job can contain at most {JOBS_MAX_ITEMS} items"
+        }), 400
+
+    subject = quota_subject()
+    rejected = admit_job(kind, subject, len(items))
+    if rejected:
+        return rejected
+
+    params = {}
+    api_key = None
+    if kind == 'analyze':
+        params = {"no_cache": bool(data.get("no_cache", False)),
+                  "prescreen": bool(data.get("prescreen"))}
+        try:
+            api_key = sealed_session_key()
+        except ValueError:
+            return jsonify({
+                "error": "Service unavailable",
+                "message": "Jobs with a session API key require ENCRYPTION_KEY"
+            }), 503
+
+    job_id = job_store.submit(kind, subject, items, params, api_key)
+    app.logger.info("Job queued", extra={'job_id': job_id, 'kind': kind, 'items': len(items)})
+    return jsonify({"status": "success", "data": describe_job(job_store.get(job_id))}), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+@limiter.limit("60 per minute")
+def job_status(job_id):
+    job = owned_job(job_id)
+    if job is None:
+        return job_not_found()
+    return jsonify({"status": "success", "data": describe_job(job)})
+
+
+@app.route('/jobs/<job_id>/results', methods=['GET'])
+@limiter.limit("60 per minute")
+def job_results(job_id):
+    # Resultados guardados hasta ahora, en orden; next_offset sirve para la siguiente página
+    offset = request.args.get("offset", 0, type=int)
+    limit = request.args.get("limit", 500, type=int)
+
+    if offset < 0 or not 0 < limit <= 1000:
+        return jsonify({
+            "error": "Invalid pagination",
+            "message": "offset must be positive and limit between 1 and 1000"
+        }), 400
+
+    job = owned_job(job_id)
+    if job is None:
+        return job_not_found()
+
+    results = job_store.results(job_id, offset, limit)
+    return jsonify({
+        "status": "success",
+        "data": describe_job(job),
+        "count": len(results),
+        "next_offset": results[-1][0] + 1 if len(results) == limit else None,
+        "results": [result for _, result in results]
+    })
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+@limiter.limit("60 per minute")
+def job_events(job_id):
+    # Estado del trabajo en NDJSON cada vez que cambia. La conexión se cierra antes del
+    # timeout de gunicorn: si el trabajo sigue en marcha, la última línea pide reconectar
+    job = owned_job(job_id)
+    if job is None:
+        return job_not_found()
+
+    def generate():
+        deadline = time.monotonic() + JOBS_STREAM_SECONDS
+        last = None
+        while True:
+            current = describe_job(job_store.get(job_id))
+            if current != last:
+                yield json.dumps(current) + "\n"
+                last = current
+            if current['status'] not in ACTIVE_JOB_STATUSES:
+                return
+            if time.monotonic() >= deadline:
+                yield json.dumps({"reconnect": True}) + "\n"
+                return
+            time.sleep(1)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no'})
+
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+@limiter.limit("60 per minute")
+def cancel_job(job_id):
+    if owned_job(job_id) is None:
+        return job_not_found()
+    job_store.cancel(job_id)
+    return jsonify({"status": "success", "data": describe_job(job_store.get(job_id))})
+
+
+@app.route('/jobs/<job_id>/retry', methods=['POST'])
+@limiter.limit("5 per day")
+def retry_job(job_id):
+    # Volver a encolar un trabajo fallido o cancelado; los resultados ya guardados se conservan
+    job = owned_job(job_id)
+    if job is None:
+        return job_not_found()
+
+    if job['status'] not in RETRYABLE_JOB_STATUSES:
+        return job_not_retryable(job)
+
+    # Las mismas comprobaciones que al enviarlo, con los elementos que faltan
+    remaining = len(json.loads(job['params'])['items']) - len(job_store.done_items(job_id))
+    rejected = admit_job(job['kind'], job['subject'], remaining)
+    if rejected:
+        return rejected
+
+    try:
+        api_key = sealed_session_key() if job['kind'] == 'analyze' else None
+    except ValueError:
+        return jsonify({
+            "error": "Service unavailable",
+            "message": "Jobs with a session API key require ENCRYPTION_KEY"
+        }), 503
+
+    if not job_store.requeue(job_id, api_key):
+        return job_not_retryable(job_store.get(job_id))
+    return jsonify({"status": "success", "data": describe_job(job_store.get(job_id))}), 202
+
+
 @app.errorhandler(429)
 def ratelimit_handler(e):
+    rate_limited.labels(request.endpoint or 'unknown').inc()
     app.logger.warning(f"You are Reach 3 optmization for today, come back tomorrow {e.description}")
 
     return jsonify(error="You are reached 3 optimization today", message="You have reached 5 optimization per day."), 429
@@ -531,6 +901,38 @@ def health_check():
     return jsonify({'status': 'ok'})
 
 
+def metrics_unauthorized():
+    """Respuesta 401 si se exige METRICS_TOKEN y la petición no lo trae (None si puede pasar)"""
+    if METRICS_TOKEN:
+        auth = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(auth, f"Bearer {METRICS_TOKEN}"):
+            return jsonify({"error": "Unauthorized", "message": "Invalid metrics token"}), 401
+    return None
+
+
+@app.route('/api/pool-stats', methods=['GET'])
+@limiter.limit("60 per minute")
+def upstream_pool_stats():
+    # Estadísticas de los pools de conexiones del worker que atiende la petición
+    unauthorized = metrics_unauthorized()
+    if unauthorized:
+        return unauthorized
+    return jsonify({**pool_stats(), 'openai': openai_clients.snapshot()})
+
+
+@app.route('/metrics', methods=['GET'])
+@limiter.exempt
+def metrics():
+    # Métricas de Prometheus sumadas de todos los workers
+    if not METRICS_ENABLED:
+        return jsonify({"error": "Not found"}), 404
+    unauthorized = metrics_unauthorized()
+    if unauthorized:
+        return unauthorized
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+
 @app.route('/favicon.ico')
 def favicon():
     # Respuesta No Content para evitar errores de favicon
@@ -539,16 +941,11 @@ def favicon():
 
 def check_brute_force(ip):
     """Verificar si una IP debe ser bloqueada por muchos intentos fallidos"""
-    if ip in blocked_ips:
-        block_until = blocked_ips[ip]
-        if datetime.now() < block_until:
-            # IP aún bloqueada
-            remaining = (block_until - datetime.now()).total_seconds() / 60
-            return False, f"Too many failed attempts. Please try again in {int(remaining)} minutes."
-        else:
-            # Ha pasado el tiempo de bloqueo, eliminar el bloqueo
-            del blocked_ips[ip]
-            login_attempts[ip] = 0
+    block_until = brute_force_store.blocked_until(ip)
+    if block_until:
+        # IP aún bloqueada (el estado es compartido por todos los workers)
+        remaining = (block_until - time.time()) / 60
+        return False, f"Too many failed attempts. Please try again in {int(remaining)} minutes."
 
     return True, None
 
@@ -557,16 +954,10 @@ def increment_attempts(ip, success=False):
     """Incrementar conteo de intentos y bloquear IP si necesario"""
     if success:
         # Restablece el contador si es exitoso
-        login_attempts[ip] = 0
+        brute_force_store.reset(ip)
         return
 
-    login_attempts[ip] += 1
-
-    if login_attempts[ip] >= MAX_ATTEMPTS:
-        # Bloquear la IP por el tiempo configurado
-        blocked_ips[ip] = datetime.now(
-        ) + timedelta(minutes=BLOCK_TIME_MINUTES)
-        login_attempts[ip] = 0
+    brute_force_store.record_failure(ip)
 
 
 if __name__ == '__main__':
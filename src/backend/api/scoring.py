@@ -0,0 +1,271 @@
+"""Puntuación local de títulos y meta descripciones para la SERP.
+
+Comprueba en local las mismas reglas que el prompt de /analyze pide al
+modelo (longitudes, marca al final, mayúsculas, palabra clave, sin años) y
+estima si Google cortará el texto a partir del ancho en píxeles de cada
+carácter. Sirve para responder sin llamar a OpenAI cuando un par ya cumple
+todas las reglas, o para enviar al modelo solo los que fallan.
+"""
+
+import html
+import re
+import unicodedata
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+# Límites del prompt (caracteres, incluidos los espacios)
+TITLE_MAX_CHARS = 60
+DESCRIPTION_MAX_CHARS = 155
+
+# Ancho visible en la SERP de escritorio: título en Arial 20px y descripción
+# en Arial 14px (unas dos líneas)
+TITLE_FONT_SIZE = 20
+TITLE_MAX_PIXELS = 580
+DESCRIPTION_FONT_SIZE = 14
+DESCRIPTION_MAX_PIXELS = 920
+
+# Anchos de Arial en milésimas de em (métricas AFM, compatibles con Helvetica)
+ARIAL_WIDTHS = {
+    ' ': 278, '!': 278, '"': 355, '#': 556, '$': 556, '%': 889, '&': 667, "'": 191,
+    '(': 333, ')': 333, '*': 389, '+': 584, ',': 278, '-': 333, '.': 278, '/': 278,
+    '0': 556, '1': 556, '2': 556, '3': 556, '4': 556, '5': 556, '6': 556, '7': 556,
+    '8': 556, '9': 556, ':': 278, ';': 278, '<': 584, '=': 584, '>': 584, '?': 556,
+    '@': 1015, 'A': 667, 'B': 667, 'C': 722, 'D': 722, 'E': 667, 'F': 611, 'G': 778,
+    'H': 722, 'I': 278, 'J': 500, 'K': 667, 'L': 556, 'M': 833, 'N': 722, 'O': 778,
+    'P': 667, 'Q': 778, 'R': 722, 'S': 667, 'T': 611, 'U': 722, 'V': 667, 'W': 944,
+    'X': 667, 'Y': 667, 'Z': 611, '[': 278, '\\': 278, ']': 278, '^': 469, '_': 556,
+    '`': 333, 'a': 556, 'b': 556, 'c': 500, 'd': 556, 'e': 556, 'f': 278, 'g': 556,
+    'h': 556, 'i': 222, 'j': 222, 'k': 500, 'l': 222, 'm': 833, 'n': 556, 'o': 556,
+    'p': 556, 'q': 556, 'r': 333, 's': 500, 't': 278, 'u': 556, 'v': 500, 'w': 722,
+    'x': 500, 'y': 500, 'z': 500, '{': 334, '|': 260, '}': 334, '~': 584,
+    ' ': 278, '–': 556, '—': 1000, '‘': 222, '’': 222,
+    '“': 333, '”': 333, '•': 350, '…': 1000, '¿': 611,
+    '¡': 333, '«': 556, '»': 556, '€': 556,
+}
+# Ancho de los caracteres desconocidos (media de las minúsculas) y de los de ancho completo (CJK)
+DEFAULT_WIDTH = 556
+WIDE_WIDTH = 1000
+
+
+class WidthTable(dict):
+    """Tabla para str.translate: carácter -> carácter cuyo código es su ancho.
+
+    Los caracteres que no están en ARIAL_WIDTHS se calculan la primera vez
+    (letra base sin acentos o ancho completo) y se guardan.
+    """
+
+    def __init__(self):
+        super().__init__((ord(char), chr(width)) for char, width in ARIAL_WIDTHS.items())
+
+    def __missing__(self, code):
+        char = chr(code)
+        base = unicodedata.normalize('NFD', char)[0]
+        if base in ARIAL_WIDTHS:
+            width = ARIAL_WIDTHS[base]
+        elif unicodedata.combining(char) or unicodedata.category(char) in ('Cc', 'Cf'):
+            width = 0
+        elif unicodedata.east_asian_width(char) in ('W', 'F'):
+            width = WIDE_WIDTH
+        else:
+            width = DEFAULT_WIDTH
+        self[code] = chr(width)
+        return self[code]
+
+
+WIDTHS = WidthTable()
+
+
+def text_units(text):
+    """Ancho de un texto en milésimas de em (la suma se hace en C, sin bucle por carácter)"""
+    return sum(array('H', text.translate(WIDTHS).encode('utf-16-le')))
+
+
+def pixel_width(text, font_size):
+    return text_units(text) * font_size / 1000
+
+
+def pixel_widths(texts, font_size):
+    """Anchos en píxeles de muchos textos con una sola traducción y una suma acumulada"""
+    if not texts:
+        return []
+    # Separador de ancho 0 para poder unir todos los textos
+    joined = '\x00'.join(texts).translate(WIDTHS)
+    totals = list(accumulate(array('H', joined.encode('utf-16-le'))))
+    widths = []
+    end = -1
+    previous = 0
+    for text in texts:
+        end += len(text) + 1
+        total = totals[end - 1] if len(text) else previous
+        widths.append((total - previous) * font_size / 1000)
+        previous = total
+    return widths
+
+
+# Palabras que no se escriben con mayúscula en el título (artículos, preposiciones y
+# conjunciones en los idiomas habituales de la herramienta)
+LOWERCASE_WORDS = frozenset("""
+a an the and or but nor of in on at to for with by from as vs via
+el la los las un una unos unas y e o u de del al en con para por sin sobre entre
+il lo gli le i di da su per tra fra ed od
+le les des du et ou pour avec dans sur aux
+""".split())
+
+WORD_RE = re.compile(r"[^\W\d_][\w'’-]*", re.UNICODE)
+YEAR_RE = re.compile(r'\b(?:19|20)\d{2}\b')
+SEPARATORS = ' -|–—:·•,'
+# Marcas diacríticas combinables (tildes, diéresis, cedillas...)
+COMBINING_RE = re.compile('[\u0300-\u036f]')
+
+
+def normalize(text):
+    """Minúsculas, sin acentos y con los espacios normalizados (para buscar la palabra clave)"""
+    text = text.casefold()
+    if not text.isascii():
+        text = COMBINING_RE.sub('', unicodedata.normalize('NFD', text))
+    return ' '.join(text.split())
+
+
+def normalize_all(texts):
+    """normalize() de muchos textos con un solo casefold y una sola NFD sobre el texto unido"""
+    joined = '\x00'.join(texts)
+    if joined.count('\x00') != len(texts) - 1:
+        # Algún texto ya trae el separador: uno a uno
+        return [normalize(text) for text in texts]
+    joined = joined.casefold()
+    if not joined.isascii():
+        joined = COMBINING_RE.sub('', unicodedata.normalize('NFD', joined))
+    return [' '.join(text.split()) for text in joined.split('\x00')] if texts else []
+
+
+def with_year(*columns):
+    """Índices de los elementos con un año en alguno de sus textos (una búsqueda por columna)"""
+    found = set()
+    for texts in columns:
+        # Inicio de cada texto en el texto unido (el separador no es carácter de palabra)
+        starts = list(accumulate((len(text) + 1 for text in texts[:-1]), initial=0))
+        for match in YEAR_RE.finditer('\x00'.join(texts)):
+            found.add(bisect_right(starts, match.start()) - 1)
+    return found
+
+
+def title_case_errors(title, brand='', brand_words=None):
+    """Palabras del título que no respetan la regla de mayúsculas"""
+    if brand_words is None:
+        brand_words = set(WORD_RE.findall(brand))
+    errors = []
+    for index, word in enumerate(WORD_RE.findall(title)):
+        if word in brand_words:
+            continue
+        # Artículos, preposiciones y conjunciones pueden ir en minúscula (salvo al principio)
+        if index > 0 and word.lower() in LOWERCASE_WORDS:
+            continue
+        if not word[0].isupper():
+            errors.append(word)
+    return errors
+
+
+# Peso de cada regla en la puntuación (suman 100)
+CHECK_WEIGHTS = {
+    'title_length': 20,
+    'description_length': 15,
+    'title_pixels': 15,
+    'description_pixels': 10,
+    'brand_at_end': 10,
+    'title_case': 10,
+    'keyword_in_title': 10,
+    'keyword_in_description': 5,
+    'no_year': 5,
+}
+
+
+def score_serp(title, description, keyword='', brand='', title_pixels=None,
+               description_pixels=None):
+    """Puntuar un título y una descripción; devuelve las comprobaciones y una nota de 0 a 100"""
+    if title_pixels is None:
+        title_pixels = pixel_width(title, TITLE_FONT_SIZE)
+    if description_pixels is None:
+        description_pixels = pixel_width(description, DESCRIPTION_FONT_SIZE)
+    return build_score(title, description, title_pixels, description_pixels,
+                       normalize(title), normalize(description), normalize(keyword),
+                       normalize(brand) if brand else '', title_case_errors(title, brand),
+                       bool(YEAR_RE.search(title) or YEAR_RE.search(description)))
+
+
+def build_score(title, description, title_pixels, description_pixels, title_norm,
+                description_norm, keyword_norm, brand_norm, case_errors, has_year):
+    """Comprobaciones y nota a partir de los valores ya calculados de un elemento"""
+    checks = {
+        'title_length': {'passed': 0 < len(title) <= TITLE_MAX_CHARS,
+                         'value': len(title), 'limit': TITLE_MAX_CHARS},
+        'description_length': {'passed': 0 < len(description) <= DESCRIPTION_MAX_CHARS,
+                               'value': len(description), 'limit': DESCRIPTION_MAX_CHARS},
+        'title_pixels': {'passed': title_pixels <= TITLE_MAX_PIXELS,
+                         'value': round(title_pixels, 1), 'limit': TITLE_MAX_PIXELS},
+        'description_pixels': {'passed': description_pixels <= DESCRIPTION_MAX_PIXELS,
+                               'value': round(description_pixels, 1),
+                               'limit': DESCRIPTION_MAX_PIXELS},
+        'brand_at_end': {
+            'passed': not brand_norm or title_norm.rstrip(SEPARATORS).endswith(brand_norm)},
+        'title_case': {'passed': not case_errors, 'value': case_errors},
+        'keyword_in_title': {'passed': not keyword_norm or keyword_norm in title_norm},
+        'keyword_in_description': {
+            'passed': not keyword_norm or keyword_norm in description_norm},
+        'no_year': {'passed': not has_year},
+    }
+
+    score = sum(CHECK_WEIGHTS[name] for name, check in checks.items() if check['passed'])
+    return {
+        'score': score,
+        'passed': score == 100,
+        'checks': checks,
+        'truncated': {
+            'title': not checks['title_pixels']['passed'],
+            'description': not checks['description_pixels']['passed'],
+        },
+    }
+
+
+def score_inputs(inputs):
+    """Puntuar las entradas ya sanitizadas de read_analysis_input (se deshace el escape HTML)"""
+    return score_serp(html.unescape(inputs['title']), html.unescape(inputs['meta_description']),
+                      html.unescape(inputs['keyword']), html.unescape(inputs['brand']))
+
+
+def text_field(item, name):
+    """Campo de texto de un elemento del lote ('' si falta o no es texto)"""
+    value = item.get(name) if isinstance(item, dict) else None
+    return value if isinstance(value, str) else ''
+
+
+def score_batch(items):
+    """Puntuar una lista de dicts con title/description/keyword/brand
+
+    Cada dato se calcula por columnas para todo el lote: anchos en píxeles,
+    textos normalizados, años y, una vez por valor distinto, la palabra clave
+    y la marca. Por elemento solo queda montar sus comprobaciones.
+    """
+    titles = [text_field(item, 'title') for item in items]
+    descriptions = [text_field(item, 'description') for item in items]
+    keywords = [text_field(item, 'keyword') for item in items]
+    brands = [text_field(item, 'brand') for item in items]
+
+    title_pixels = pixel_widths(titles, TITLE_FONT_SIZE)
+    description_pixels = pixel_widths(descriptions, DESCRIPTION_FONT_SIZE)
+    title_norms = normalize_all(titles)
+    description_norms = normalize_all(descriptions)
+    years = with_year(titles, descriptions)
+    # Las palabras clave y marcas suelen repetirse en todo el lote
+    keyword_norms = {keyword: normalize(keyword) for keyword in set(keywords)}
+    brand_norms = {brand: normalize(brand) if brand else '' for brand in set(brands)}
+    brand_words = {brand: set(WORD_RE.findall(brand)) for brand in brand_norms}
+
+    return [
+        build_score(title, description, title_pixels[index], description_pixels[index],
+                    title_norms[index], description_norms[index], keyword_norms[keyword],
+                    brand_norms[brand], title_case_errors(title, brand, brand_words[brand]),
+                    index in years)
+        for index, (title, description, keyword, brand)
+        in enumerate(zip(titles, descriptions, keywords, brands))
+    ]
@@ -0,0 +1,261 @@
+"""Sesiones en el servidor sin archivos por sesión.
+
+Sustituye a Flask-Session en modo 'filesystem', que lee y escribe un archivo
+por petición y nunca borra los caducados. Aquí cada worker guarda las
+sesiones en una LRU en memoria y las comparte con los demás a través de una
+tabla SQLite compacta. La cookie lleva el id de la sesión y su versión: si
+la LRU tiene esa misma versión, la sesión se lee sin tocar el disco; si no,
+se lee de SQLite. Un hilo en segundo plano borra las sesiones caducadas
+según PERMANENT_SESSION_LIFETIME.
+"""
+
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from .config import (SESSION_BACKEND, SESSION_PATH, SESSION_CACHE_SIZE,
+                     SESSION_SWEEP_INTERVAL)
+
+logger = logging.getLogger(__name__)
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Sesión cuyo contenido se guarda en el servidor."""
+
+    def __init__(self, initial=None, sid=None, version=0, expires_at=0.0, new=False):
+        def on_update(session):
+            session.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.version = version
+        self.expires_at = expires_at
+        self.new = new
+        self.modified = False
+
+
+class MemorySessionStore:
+    """LRU de sesiones del proceso: sid -> (versión, datos, caduca en)."""
+
+    def __init__(self, max_entries=SESSION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, sid):
+        with self.lock:
+            entry = self.entries.get(sid)
+            if entry is None:
+                return None
+            if entry[2] <= time.time():
+                del self.entries[sid]
+                return None
+            self.entries.move_to_end(sid)
+            return entry
+
+    def set(self, sid, version, data, expires_at):
+        with self.lock:
+            self.entries[sid] = (version, data, expires_at)
+            self.entries.move_to_end(sid)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, sid):
+        with self.lock:
+            self.entries.pop(sid, None)
+
+    def sweep(self, now):
+        with self.lock:
+            for sid in [sid for sid, entry in self.entries.items() if entry[2] <= now]:
+                del self.entries[sid]
+
+
+class SQLiteSessionStore:
+    """Tabla de sesiones compartida entre workers."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+
+    def connect(self):
+        """Abrir (o reabrir tras un fork) la conexión de este proceso"""
+        pid = os.getpid()
+        if self.conn is None or self.pid != pid:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )''')
+            conn.execute('CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)')
+            self.conn = conn
+            self.pid = pid
+        return self.conn
+
+    def get(self, sid):
+        with self.lock:
+            return self.connect().execute(
+                'SELECT version, data, expires_at FROM sessions WHERE sid = ? AND expires_at > ?',
+                (sid, time.time())).fetchone()
+
+    def set(self, sid, version, data, expires_at):
+        with self.lock:
+            self.connect().execute(
+                'INSERT OR REPLACE INTO sessions (sid, version, data, expires_at) VALUES (?, ?, ?, ?)',
+                (sid, version, data, expires_at))
+
+    def delete(self, sid):
+        with self.lock:
+            self.connect().execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def sweep(self, now):
+        with self.lock:
+            self.connect().execute('DELETE FROM sessions WHERE expires_at <= ?', (now,))
+
+
+class CachedSessionInterface(SessionInterface):
+    """Sesiones con LRU en memoria delante de un almacén compartido opcional."""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, shared=None, cache_size=SESSION_CACHE_SIZE,
+                 sweep_interval=SESSION_SWEEP_INTERVAL):
+        self.shared = shared
+        self.cache = MemorySessionStore(cache_size)
+        self.sweep_interval = sweep_interval
+        self.sweeper_pid = None
+
+    def start_sweeper(self):
+        """Arrancar (una vez por proceso) el hilo que borra las sesiones caducadas"""
+        if self.sweeper_pid == os.getpid():
+            return
+        self.sweeper_pid = os.getpid()
+        threading.Thread(target=self.sweep_forever, daemon=True).start()
+
+    def sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            now = time.time()
+            self.cache.sweep(now)
+            if self.shared is not None:
+                try:
+                    self.shared.sweep(now)
+                except sqlite3.Error as e:
+                    logger.warning("Session sweep error: %s", e)
+
+    def lifetime(self, app):
+        return app.permanent_session_lifetime.total_seconds()
+
+    def new_session(self, app):
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def get_expiration_time(self, app, session):
+        # SESSION_PERMANENT (como en Flask-Session) hace permanentes todas las sesiones
+        # sin guardar la marca en cada una
+        if app.config.get('SESSION_PERMANENT', True) or session.permanent:
+            return datetime.now(timezone.utc) + app.permanent_session_lifetime
+        return None
+
+    def open_session(self, app, request):
+        self.start_sweeper()
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie or '.' not in cookie:
+            return self.new_session(app)
+
+        sid, _, version = cookie.rpartition('.')
+        try:
+            version = int(version)
+        except ValueError:
+            return self.new_session(app)
+
+        # Camino rápido: la LRU tiene la misma versión que la cookie
+        entry = self.cache.get(sid)
+        if self.shared is not None and (entry is None or entry[0] != version):
+            try:
+                entry = self.shared.get(sid)
+            except sqlite3.Error as e:
+                logger.warning("Session read error: %s", e)
+                entry = None
+            if entry is not None:
+                self.cache.set(sid, *entry)
+        if entry is None:
+            return self.new_session(app)
+
+        stored_version, data, expires_at = entry
+        session = ServerSession(self.serializer.loads(data), sid=sid, version=stored_version,
+                                expires_at=expires_at)
+        return session
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            # Sesión vaciada: borrarla del servidor y del navegador
+            if session.modified and not session.new:
+                self.cache.delete(session.sid)
+                if self.shared is not None:
+                    try:
+                        self.shared.delete(session.sid)
+                    except sqlite3.Error as e:
+                        logger.warning("Session write error: %s", e)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        lifetime = self.lifetime(app)
+        # Renovar la caducidad solo cuando ha pasado la mitad de la vida de la sesión,
+        # para no escribir en cada petición
+        renew = session.expires_at - now < lifetime / 2
+        if not (session.modified or renew):
+            return
+
+        version = session.version + 1
+        expires_at = now + lifetime
+        data = self.serializer.dumps(dict(session))
+        self.cache.set(session.sid, version, data, expires_at)
+        if self.shared is not None:
+            try:
+                self.shared.set(session.sid, version, data, expires_at)
+            except sqlite3.Error as e:
+                logger.warning("Session write error: %s", e)
+
+        response.set_cookie(
+            name, f"{session.sid}.{version}",
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def init_sessions(app, backend=SESSION_BACKEND):
+    """Instalar el backend de sesiones configurado ('sqlite', 'memory' o 'filesystem')"""
+    if backend == 'filesystem':
+        # Flask-Session con un archivo por sesión (comportamiento anterior)
+        from flask_session import Session
+        app.config['SESSION_TYPE'] = 'filesystem'
+        Session(app)
+    elif backend == 'memory':
+        app.session_interface = CachedSessionInterface()
+    elif backend == 'sqlite':
+        app.session_interface = CachedSessionInterface(SQLiteSessionStore(SESSION_PATH))
+    else:
+        raise ValueError(f"Unknown session backend: {backend}")
@@ -0,0 +1,274 @@
+"""Rastreo de sitemaps: metadatos de todas las URLs de un sitemap.xml.
+
+El sitemap (o índice de sitemaps) se descarga a un archivo temporal y se lee
+por bloques con expat, sin construir árbol: de cada bloque solo se guardan
+los <loc> que contiene. Las URLs pasan por una cola acotada a un grupo de
+workers que usan la misma extracción que /extract-meta/batch (validación
+SSRF de cada URL, caché de metadatos y descarga hasta </head>), y los
+resultados se devuelven según terminan. Como las colas están acotadas, la
+lectura del sitemap espera a los workers y la memoria no depende del número
+de URLs. El rastreo tiene un plazo (max_seconds): al cumplirse se paran las
+descargas y el resumen lo indica con deadline_reached.
+"""
+
+import asyncio
+import tempfile
+import zlib
+from collections import defaultdict, deque
+from contextlib import aclosing
+from urllib.parse import urlparse
+from xml.parsers import expat
+
+from .config import (FETCH_TIMEOUT, SITEMAP_MAX_SECONDS, SITEMAP_MAX_URLS, SITEMAP_MAX_SITEMAPS, SITEMAP_MAX_BYTES,
+                     SITEMAP_FETCH_TIMEOUT, SITEMAP_SPOOL_BYTES, SITEMAP_CONCURRENCY,
+                     SITEMAP_PER_HOST_CONCURRENCY)
+from .fetcher import DEFAULT_HEADERS
+from .batch import build_async_client, extract_page_async, error_response
+
+# Bloques en los que se lee (y descomprime) el sitemap
+READ_CHUNK_SIZE = 64 * 1024
+# El protocolo de sitemaps limita las URLs a 2048 caracteres
+MAX_LOC_LENGTH = 2048
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+class SitemapError(Exception):
+    """El sitemap no se pudo descargar o no es un sitemap válido."""
+
+    def __init__(self, message, status=422):
+        self.status = status
+        super().__init__(message)
+
+
+def sitemap_error_response(exc):
+    """(payload, status) del error al leer un sitemap"""
+    if isinstance(exc, SitemapError):
+        return {"error": "Invalid sitemap", "message": str(exc)}, exc.status
+    return error_response(exc)
+
+
+class SitemapParser:
+    """Parser incremental de sitemaps con expat.
+
+    `feed` devuelve los (tipo, loc) leídos en ese bloque: 'url' para las
+    páginas de un <urlset> y 'sitemap' para los sitemaps de un <sitemapindex>.
+    """
+
+    def __init__(self):
+        parser = expat.ParserCreate(namespace_separator=' ')
+        parser.StartElementHandler = self.start
+        parser.EndElementHandler = self.end
+        parser.CharacterDataHandler = self.characters
+        # Un sitemap no necesita DTD: rechazarla evita las bombas de entidades
+        parser.StartDoctypeDeclHandler = self.reject_doctype
+        self.parser = parser
+        self.root = None
+        self.path = []
+        self.text = None
+        self.text_length = 0
+        self.entries = []
+
+    def reject_doctype(self, *args):
+        raise SitemapError("Sitemaps with a DOCTYPE are not supported")
+
+    def start(self, name, attrs):
+        local = name.rpartition(' ')[2]
+        if self.root is None:
+            if local not in ('urlset', 'sitemapindex'):
+                raise SitemapError(f"Not a sitemap: unexpected root element <{local}>")
+            self.root = local
+        # Solo los <loc> de <url> y <sitemap> (no los de image:image, video:video...)
+        if local == 'loc' and self.path and self.path[-1] in ('url', 'sitemap'):
+            self.text = []
+            self.text_length = 0
+        self.path.append(local)
+
+    def characters(self, data):
+        if self.text is not None and self.text_length <= MAX_LOC_LENGTH:
+            self.text.append(data)
+            self.text_length += len(data)
+
+    def end(self, name):
+        local = self.path.pop()
+        if local == 'loc' and self.text is not None:
+            loc = ''.join(self.text).strip()
+            self.text = None
+            if loc and len(loc) <= MAX_LOC_LENGTH:
+                self.entries.append((self.path[-1], loc))
+
+    def feed(self, data, final=False):
+        try:
+            self.parser.Parse(data, final)
+        except expat.ExpatError as e:
+            raise SitemapError(f"Invalid sitemap XML: {e}")
+        if final and self.root is None:
+            raise SitemapError("Not a sitemap: empty document")
+        entries, self.entries = self.entries, []
+        return entries
+
+
+def read_chunks(spool, max_bytes=SITEMAP_MAX_BYTES, chunk_size=READ_CHUNK_SIZE):
+    """Bloques del sitemap guardado, descomprimidos si es un .xml.gz"""
+    spool.seek(0)
+    gzipped = spool.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+    spool.seek(0)
+    if not gzipped:
+        while chunk := spool.read(chunk_size):
+            yield chunk
+        return
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    total = 0
+    while chunk := spool.read(chunk_size):
+        # Descomprimir en trozos acotados (una bomba gzip no llega a memoria)
+        while chunk:
+            data = decompressor.decompress(chunk, chunk_size)
+            total += len(data)
+            if total > max_bytes:
+                raise SitemapError(f"Sitemap exceeds {max_bytes} bytes", 413)
+            yield data
+            chunk = decompressor.unconsumed_tail
+
+
+class SitemapCrawler:
+    """Rastrea un sitemap (o índice de sitemaps) y extrae los metadatos de cada URL."""
+
+    def __init__(self, concurrency=SITEMAP_CONCURRENCY, per_host=SITEMAP_PER_HOST_CONCURRENCY,
+                 max_urls=SITEMAP_MAX_URLS, max_sitemaps=SITEMAP_MAX_SITEMAPS,
+                 max_bytes=SITEMAP_MAX_BYTES, fetch_timeout=SITEMAP_FETCH_TIMEOUT,
+                 timeout=FETCH_TIMEOUT, max_seconds=SITEMAP_MAX_SECONDS, subject=None):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.max_urls = max_urls
+        self.max_sitemaps = max_sitemaps
+        self.max_bytes = max_bytes
+        self.fetch_timeout = fetch_timeout
+        self.timeout = timeout
+        self.max_seconds = max_seconds
+        self.subject = subject
+        self.deadline = None
+        self.totals = {'sitemaps': 0, 'sitemap_errors': 0, 'urls': 0, 'succeeded': 0,
+                       'failed': 0, 'limit_reached': False, 'deadline_reached': False}
+
+    def remaining(self):
+        """Segundos que quedan del plazo del rastreo"""
+        return max(0.0, self.deadline - asyncio.get_running_loop().time())
+
+    async def download(self, client, url, spool):
+        """Descargar el sitemap al archivo temporal (httpx ya quita el Content-Encoding)"""
+        async with client.stream('GET', url, headers=DEFAULT_HEADERS) as response:
+            if response.status_code != 200:
+                raise SitemapError(
+                    f"Sitemap request failed with status code {response.status_code}", 502)
+            size = 0
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise SitemapError(f"Sitemap exceeds {self.max_bytes} bytes", 413)
+                spool.write(chunk)
+
+    async def read_sitemap(self, client, url):
+        """Generar los (tipo, loc) de un sitemap bloque a bloque"""
+        with tempfile.SpooledTemporaryFile(SITEMAP_SPOOL_BYTES) as spool:
+            await asyncio.wait_for(self.download(client, url, spool),
+                                   min(self.fetch_timeout, self.remaining()))
+            parser = SitemapParser()
+            for data in read_chunks(spool, self.max_bytes):
+                for entry in parser.feed(data):
+                    yield entry
+            for entry in parser.feed(b'', final=True):
+                yield entry
+
+    async def produce(self, client, sitemap_url, urls, results):
+        """Leer los sitemaps y poner sus URLs en la cola (espera si está llena)"""
+        pending = deque([sitemap_url])
+        while pending and not self.totals['limit_reached']:
+            current = pending.popleft()
+            self.totals['sitemaps'] += 1
+            try:
+                async with aclosing(self.read_sitemap(client, current)) as entries:
+                    async for kind, loc in entries:
+                        if kind == 'sitemap':
+                            if self.totals['sitemaps'] + len(pending) < self.max_sitemaps:
+                                pending.append(loc)
+                        elif self.totals['urls'] >= self.max_urls:
+                            self.totals['limit_reached'] = True
+                            break
+                        else:
+                            self.totals['urls'] += 1
+                            await urls.put(loc)
+            except Exception as e:
+                self.totals['sitemap_errors'] += 1
+                payload, status = sitemap_error_response(e)
+                await results.put({"sitemap": current, "status": status, **payload})
+
+        # Una marca de fin por worker
+        for _ in range(self.concurrency):
+            await urls.put(None)
+
+    async def work(self, client, urls, results, host_limits):
+        """Extraer las URLs de la cola hasta recibir la marca de fin"""
+        while (url := await urls.get()) is not None:
+            host = urlparse(url).netloc.lower()
+            try:
+                payload, status = await extract_page_async(
+                    client, url, (host_limits[host],), min(self.timeout, self.remaining()),
+                    self.subject)
+            except Exception as e:
+                payload, status = error_response(e)
+            self.totals['succeeded' if status == 200 else 'failed'] += 1
+            await results.put({"url": url, "status": status, **payload})
+        await results.put(None)
+
+    async def run(self, sitemap_url):
+        """Generar los resultados según terminan y, al final, el resumen"""
+        urls = asyncio.Queue(self.concurrency)
+        results = asyncio.Queue(self.concurrency)
+        host_limits = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+        self.deadline = asyncio.get_running_loop().time() + self.max_seconds
+
+        # Una conexión más para ir leyendo los sitemaps mientras trabajan los workers
+        async with build_async_client(self.concurrency + 1) as client:
+            tasks = [asyncio.create_task(self.produce(client, sitemap_url, urls, results))]
+            tasks += [asyncio.create_task(self.work(client, urls, results, host_limits))
+                      for _ in range(self.concurrency)]
+            try:
+                running = self.concurrency
+                while running:
+                    try:
+                        result = await asyncio.wait_for(results.get(), self.remaining())
+                    except asyncio.TimeoutError:
+                        # Plazo cumplido: las URLs pendientes se quedan sin extraer
+                        self.totals['deadline_reached'] = True
+                        break
+                    if result is None:
+                        running -= 1
+                    else:
+                        yield result
+            finally:
+                # Si el cliente se desconecta, no seguir descargando
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        yield {"summary": dict(self.totals)}
+
+
+def crawl_sitemap(sitemap_url, max_urls=SITEMAP_MAX_URLS, subject=None):
+    """Punto de entrada síncrono para las vistas de Flask: genera los resultados
+
+    El bucle de eventos solo avanza mientras se espera el siguiente resultado,
+    así que los workers no se adelantan a lo que ya se ha enviado al cliente.
+    """
+    loop = asyncio.new_event_loop()
+    results = SitemapCrawler(max_urls=max_urls, subject=subject).run(sitemap_url)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(results.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(results.aclose())
+        loop.run_until_complete(loop.shutdown_default_executor())
+        loop.close()
@@ -0,0 +1,53 @@
+"""Validación de URLs para evitar SSRF y otros ataques."""
+
+from urllib.parse import urlparse
+
+from .resolver import dns_cache
+from .metrics import ssrf_rejections
+
+
+def check_url_format(url):
+    """Comprobar esquema y dominio; devuelve (host, rechazo)"""
+    try:
+        # Comprobar si la URL es válida
+        parsed_url = urlparse(url)
+
+        # Verificar que tiene esquema y dominio
+        if not parsed_url.scheme or not parsed_url.netloc:
+            return None, ({"error": "Invalid URL format"}, 400)
+
+        # Verificar que el esquema es http o https
+        if parsed_url.scheme not in ['http', 'https']:
+            return None, ({"error": "URL must use HTTP or HTTPS protocol"}, 400)
+
+        host = parsed_url.hostname
+        if not host:
+            return None, ({"error": "Invalid URL format"}, 400)
+        return host, None
+    except Exception as e:
+        return None, ({"error": f"URL validation error: {str(e)}"}, 400)
+
+
+def check_resolution(entry):
+    """Bloquear IPs privadas/localhost: se comprueban todos los registros A/AAAA"""
+    # Si no se puede resolver el dominio, continuar (la conexión fallará igualmente)
+    if entry.blocked:
+        ssrf_rejections.labels('validation').inc()
+        return {"error": "Private or loopback IPs are not allowed"}, 403
+    return None
+
+
+def validate_url(url):
+    """Validar una URL; devuelve (payload, status) si se rechaza o None si es válida"""
+    host, rejected = check_url_format(url)
+    if rejected:
+        return rejected
+    return check_resolution(dns_cache.resolve(host))
+
+
+async def validate_url_async(url):
+    """Versión asíncrona de validate_url (no bloquea el bucle de eventos)"""
+    host, rejected = check_url_format(url)
+    if rejected:
+        return rejected
+    return check_resolution(await dns_cache.resolve_async(host))
@@ -1,9 +1,13 @@
+import os
+
 from api.routes import app
-from flask_session import Session
+from api.jobs import job_pool
 
 if __name__ == '__main__':
-    # Inicializar el manejo de sesiones
-    Session(app)
+    # El manejo de sesiones se inicializa en api.routes (SESSION_BACKEND)
     print("Iniciando servidor Flask...")
     print("API disponible en http://localhost:5002")
+    # Con el recargador, solo el proceso hijo ejecuta trabajos de la cola
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        job_pool.start()
     app.run(debug=True, host='0.0.0.0', port=5002)
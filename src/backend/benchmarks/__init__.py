@@ -0,0 +1,15 @@
+"""Benchmarks y pruebas de carga del backend.
+
+- `python -m benchmarks.micro`: extracción de metadatos sobre el corpus de
+  HTML de corpus.py (página mínima, artículo de 5 MB, HTML mal formado y
+  WordPress con muchas etiquetas).
+- `python -m benchmarks.load`: carga de extremo a extremo de /extract-meta y
+  /analyze contra gunicorn, con un servidor de origen y una imitación de la
+  API de Responses de OpenAI en local.
+
+Ambos imprimen p50/p95/p99 y el rendimiento, pueden guardar los resultados en
+JSON (--output) y compararlos con una ejecución anterior (--baseline): si
+algo empeora más de la tolerancia, terminan con código 1.
+
+Se ejecutan desde src/backend.
+"""
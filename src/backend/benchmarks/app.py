@@ -0,0 +1,23 @@
+"""Aplicación para las pruebas de carga. NO usar en producción.
+
+Es la app normal con dos cambios: permite descargar de 127.0.0.1 (el
+servidor de origen local; la protección SSRF sigue activa para cualquier
+otra IP privada) y desactiva Flask-Limiter. Las cuotas y las cachés se
+desactivan desde benchmarks.load con variables de entorno.
+"""
+
+from api import resolver
+from api.routes import app as wsgi_app, limiter
+from api.asgi import app as asgi_app
+
+is_blocked_ip = resolver.is_blocked_ip
+
+
+def allow_loopback_origin(address):
+    return address != '127.0.0.1' and is_blocked_ip(address)
+
+
+resolver.is_blocked_ip = allow_loopback_origin
+limiter.enabled = False
+
+__all__ = ['wsgi_app', 'asgi_app']
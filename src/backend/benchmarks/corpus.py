@@ -0,0 +1,105 @@
+"""Corpus de HTML para los benchmarks (generado, siempre el mismo)."""
+
+import random
+
+# Semilla fija para que todas las ejecuciones midan exactamente los mismos documentos
+SEED = 1234
+
+WORDS = ('seo título descripción página marca búsqueda resultado clic usuario google '
+         'contenido palabra clave guía mejor precio envío gratis tienda online '
+         'zapatillas running mujer hombre oferta nuevo análisis web').split()
+
+
+def sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def tiny_page():
+    return ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>Tiny Page | Marca</title>'
+            '<meta name="description" content="Una página mínima."></head>'
+            '<body><h1>Tiny</h1></body></html>')
+
+
+def article_page(rng, size=5_000_000):
+    """Artículo largo (~`size` bytes) con una cabecera realista"""
+    head = (
+        '<!DOCTYPE html><html lang="es"><head><meta charset="utf-8">'
+        '<title>Guía Completa de SEO Para Tiendas Online | Marca</title>'
+        '<meta name="description" content="Todo lo que necesitas saber para posicionar tu tienda.">'
+        '<meta property="og:title" content="Guía Completa de SEO">'
+        '<meta property="og:image" content="https://example.com/cover.jpg">'
+        '<link rel="canonical" href="https://example.com/guia-seo">'
+        + ''.join(f'<link rel="preload" href="/static/font{i}.woff2" as="font">' for i in range(20))
+        + ''.join(f'<script src="/static/chunk{i}.js" defer></script>' for i in range(20))
+        + '</head><body><h1>Guía Completa de SEO</h1>'
+    )
+    parts = [head]
+    length = len(head)
+    index = 0
+    while length < size:
+        index += 1
+        block = (f'<h2 id="s{index}">{sentence(rng, 5)}</h2>'
+                 f'<p>{sentence(rng, 60)} <a href="/post/{index}">{sentence(rng, 3)}</a></p>'
+                 f'<p>{sentence(rng, 80)}</p>')
+        parts.append(block)
+        length += len(block)
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+
+def malformed_page(rng):
+    """Etiquetas sin cerrar, atributos sin comillas y anidamiento incorrecto"""
+    rows = ''.join(f'<tr><td>{sentence(rng, 4)}<td><b><i>{sentence(rng, 3)}</b></i>'
+                   for _ in range(300))
+    return ('<html><head><title>Página <b>rota</title><meta name=description content=Sin comillas>'
+            "<meta property=og:title content='Comillas simples'<meta name=\"keywords\" content=\"a,b\">"
+            '<link rel=canonical href=/rota></head><body><h1>Rota<p>Sin cerrar<div><span>'
+            f'<table>{rows}</table><a rel=tag>uno<a rel=tag>dos</div></p></span><!-- comentario '
+            'sin cerrar <p>&notanentity; &amp &#xZZ;</body>')
+
+
+def wordpress_page(rng, tags=1500, categories=200):
+    """Plantilla de WordPress con muchas etiquetas, categorías y metadatos"""
+    head = (
+        '<!DOCTYPE html><html lang="es-ES"><head><meta charset="UTF-8">'
+        '<title>Zapatillas Running Para Mujer | Tienda</title>'
+        '<meta name="generator" content="WordPress 6.5.2">'
+        '<meta name="description" content="Las mejores zapatillas de running para mujer.">'
+        '<meta property="og:type" content="article"><meta property="og:url" content="https://example.com/z">'
+        '<meta property="og:image" content="https://example.com/z.jpg">'
+        '<meta name="twitter:card" content="summary_large_image">'
+        '<link rel="https://api.w.org/" href="https://example.com/wp-json/">'
+        + ''.join(f'<link rel="stylesheet" id="css{i}" href="/wp-content/plugins/p{i}/style.css">'
+                  for i in range(40))
+        + ''.join(f'<meta property="article:tag" content="{rng.choice(WORDS)}">' for _ in range(60))
+        + '<script type="application/ld+json">{"@context":"https://schema.org"}</script></head>'
+    )
+    body = ['<body class="post-template-default"><header><nav>']
+    body += [f'<a href="/c/{i}" rel="category tag">{rng.choice(WORDS)} {i}</a>' for i in range(categories)]
+    body.append('</nav></header><article><h1>Zapatillas Running Para Mujer</h1>')
+    body += [f'<p>{sentence(rng, 40)}</p>' for _ in range(200)]
+    body.append('<footer class="entry-meta">')
+    body += [f'<a href="/tag/{i}" rel="tag">{rng.choice(WORDS)}-{i}</a>' for i in range(tags)]
+    body.append('</footer></article></body></html>')
+    return head + ''.join(body)
+
+
+def legacy_page(rng, size=2_000_000):
+    """Artículo en windows-1252 sin charset en la cabecera ni en el HTML"""
+    return article_page(rng, size).replace('<meta charset="utf-8">', '').encode('cp1252')
+
+
+def build_corpus():
+    """nombre -> (Content-Type, bytes)"""
+    rng = random.Random(SEED)
+    pages = {
+        'tiny': tiny_page(),
+        'article_5mb': article_page(rng),
+        'malformed': malformed_page(rng),
+        'wordpress': wordpress_page(rng),
+    }
+    corpus = {name: ('text/html; charset=utf-8', html.encode('utf-8'))
+              for name, html in pages.items()}
+    # Sin declaración: la codificación se detecta
+    corpus['legacy_2mb'] = ('text/html', legacy_page(rng))
+    return corpus
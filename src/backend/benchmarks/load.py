@@ -0,0 +1,216 @@
+"""Prueba de carga de /extract-meta y /analyze contra gunicorn.
+
+Arranca un servidor de origen con el corpus y una imitación de la API de
+Responses de OpenAI, y para cada configuración de gunicorn (modo y número
+de workers) lanza `gunicorn -c gunicorn_config.py benchmarks.app:...` y lo
+carga con `--concurrency` clientes durante `--duration` segundos por
+endpoint. Las cachés y las cuotas se desactivan para medir el camino
+completo (--cache las mantiene).
+
+    python -m benchmarks.load --config sync:3 --config asgi:1 --output load.json
+    python -m benchmarks.load --config sync:3 --baseline load.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from .corpus import build_corpus
+from .servers import start_origin, start_openai
+from .stats import add_arguments, finish, summarize
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_MODULES = {'sync': 'benchmarks.app:wsgi_app', 'asgi': 'benchmarks.app:asgi_app'}
+ENDPOINTS = ('extract-meta', 'analyze')
+
+
+def parse_config(spec):
+    """'sync', 'sync:4' o 'asgi:2' -> (modo, workers o None para el valor de gunicorn_config)"""
+    mode, _, workers = spec.partition(':')
+    if mode not in APP_MODULES:
+        raise argparse.ArgumentTypeError(f"Unknown server mode: {mode}")
+    return mode, int(workers) if workers else None
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_env(mode, openai_port, workdir, use_cache):
+    env = dict(os.environ)
+    env.update({
+        'SERVER_MODE': mode,
+        'OPENAI_BASE_URL': f"http://127.0.0.1:{openai_port}/v1",
+        'OPENAI_API_KEY': 'sk-bench',
+        'SECRET_KEY': 'bench',
+        'QUOTA_ENABLED': 'false',
+        'METADATA_CACHE_ENABLED': str(use_cache).lower(),
+        'ANALYSIS_CACHE_ENABLED': str(use_cache).lower(),
+        'METADATA_CACHE_PATH': os.path.join(workdir, 'cache.sqlite3'),
+        'ANALYSIS_CACHE_PATH': os.path.join(workdir, 'analysis.sqlite3'),
+        'DUPLICATES_PATH': os.path.join(workdir, 'duplicates.sqlite3'),
+        'JOBS_PATH': os.path.join(workdir, 'jobs.sqlite3'),
+        'BRUTE_FORCE_PATH': os.path.join(workdir, 'brute_force.sqlite3'),
+        'QUOTA_PATH': os.path.join(workdir, 'quotas.sqlite3'),
+        'SESSION_PATH': os.path.join(workdir, 'sessions.sqlite3'),
+        'RATELIMIT_STORAGE_URI': 'memory://',
+        'METRICS_MULTIPROC_DIR': os.path.join(workdir, 'metrics'),
+        'LOG_LEVEL': 'WARNING',
+        # run.sh añade los certificados TLS aquí; la prueba usa HTTP
+        'GUNICORN_CMD_ARGS': '',
+    })
+    return env
+
+
+class GunicornServer:
+    """gunicorn en un subproceso con la configuración del repositorio."""
+
+    def __init__(self, mode, workers, openai_port, use_cache):
+        self.mode = mode
+        self.workers = workers
+        self.port = free_port()
+        self.workdir = tempfile.mkdtemp(prefix='serp_bench_')
+        self.log_path = os.path.join(self.workdir, 'gunicorn.log')
+        self.env = server_env(mode, openai_port, self.workdir, use_cache)
+        self.process = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout=30):
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn_config.py',
+                   '-b', f"127.0.0.1:{self.port}", APP_MODULES[self.mode]]
+        if self.workers:
+            command += ['-w', str(self.workers)]
+        self.log = open(self.log_path, 'wb')
+        self.process = subprocess.Popen(command, cwd=BACKEND_DIR, env=self.env,
+                                        stdout=self.log, stderr=subprocess.STDOUT)
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                if httpx.get(f"{self.base_url}/api/health", timeout=1).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"gunicorn did not start, see {self.log_path}")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.log.close()
+
+
+def request_bodies(endpoint, origin_url, fixtures):
+    """Cuerpos de las peticiones (infinitos); los títulos cambian para no repetir entradas"""
+    if endpoint == 'extract-meta':
+        return ({'url': f"{origin_url}/{name}"} for name in itertools.cycle(fixtures))
+    return ({'title': f"Título de prueba {i}", 'description': 'Descripción de la página.',
+             'keyword': 'prueba', 'brand': 'Marca'} for i in itertools.count())
+
+
+async def run_load(base_url, endpoint, bodies, concurrency, duration, warmup):
+    """Cargar un endpoint; devuelve (latencias correctas, errores, segundos medidos)"""
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        loop = asyncio.get_running_loop()
+        measure_from = loop.time() + warmup
+        stop_at = measure_from + duration
+
+        async def user():
+            nonlocal errors
+            while loop.time() < stop_at:
+                began = loop.time()
+                try:
+                    response = await client.post(f"/{endpoint}", json=next(bodies))
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                # Las peticiones del calentamiento no cuentan
+                if began < measure_from:
+                    continue
+                if ok:
+                    latencies.append(loop.time() - began)
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        return latencies, errors, max(loop.time() - measure_from, 1e-9)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--config', action='append', type=parse_config,
+                        help="Modo y workers de gunicorn: sync, sync:4, asgi:1... (se puede repetir)")
+    parser.add_argument('--endpoint', action='append', choices=ENDPOINTS)
+    parser.add_argument('--fixture', action='append',
+                        help='Páginas del corpus para /extract-meta (por defecto todas)')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=10, help='Segundos medidos por endpoint')
+    parser.add_argument('--warmup', type=float, default=2, help='Segundos sin medir al empezar')
+    parser.add_argument('--origin-latency', type=float, default=0.0,
+                        help='Segundos de espera del servidor de origen por página')
+    parser.add_argument('--llm-latency', type=float, default=0.5,
+                        help='Segundos de espera de la imitación de OpenAI por llamada')
+    parser.add_argument('--cache', action='store_true', help='Mantener las cachés activadas')
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    configs = args.config or [('sync', None), ('asgi', None)]
+    endpoints = args.endpoint or list(ENDPOINTS)
+    corpus = build_corpus()
+    fixtures = args.fixture or list(corpus)
+
+    origin, origin_port = start_origin(corpus, args.origin_latency)
+    openai_server, openai_port, openai_stats = start_openai(args.llm_latency)
+    origin_url = f"http://127.0.0.1:{origin_port}"
+
+    results = {}
+    try:
+        for mode, workers in configs:
+            name = f"{mode}:{workers}" if workers else mode
+            server = GunicornServer(mode, workers, openai_port, args.cache)
+            server.start()
+            try:
+                for endpoint in endpoints:
+                    print(f"{name} /{endpoint}: {args.concurrency} clients, {args.duration:g}s",
+                          file=sys.stderr)
+                    latencies, errors, elapsed = asyncio.run(run_load(
+                        server.base_url, endpoint, request_bodies(endpoint, origin_url, fixtures),
+                        args.concurrency, args.duration, args.warmup))
+                    results[f"{name}/{endpoint}"] = summarize(latencies, elapsed, errors)
+            finally:
+                server.stop()
+    finally:
+        origin.shutdown()
+        openai_server.shutdown()
+
+    options = {key: value for key, value in vars(args).items()
+               if key not in ('output', 'baseline', 'tolerance')}
+    options['config'] = [f"{mode}:{workers or ''}" for mode, workers in configs]
+    return finish(args, 'load', results, options)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""Microbenchmark de la extracción de metadatos sobre el corpus.
+
+Mide page_response (parseo y extracción en una pasada) con cada backend de
+api.parsers y el documento completo de cada página, como si la descarga no
+se hubiera cortado tras </head>. Antes de medir comprueba que todos los
+backends dan los mismos metadatos que html.parser en todo el corpus.
+
+    python -m benchmarks.micro --iterations 50 --output micro.json
+    python -m benchmarks.micro --backend events --baseline micro.json
+"""
+
+import argparse
+import sys
+import time
+
+from requests.structures import CaseInsensitiveDict
+
+from api.charset import decode_page
+from api.extractor import extract_content, page_response
+from api.fetcher import FetchResult
+from api.parsers import BACKENDS, resolve_backend
+
+from .corpus import build_corpus
+from .stats import add_arguments, finish, summarize
+
+
+def fetch_result(name, content_type, content):
+    return FetchResult(url=f"https://bench.example/{name}", status_code=200,
+                       headers=CaseInsensitiveDict({'Content-Type': content_type}),
+                       content=content, truncated=False, elapsed=0.0)
+
+
+def parity_errors(corpus, backends):
+    """Páginas en las que un backend no da los mismos metadatos que html.parser"""
+    errors = []
+    for name, (content_type, content) in corpus.items():
+        url = f"https://bench.example/{name}"
+        markup = decode_page(content, content_type)[0]
+        expected = extract_content(markup, url, 'html.parser')
+        for backend in backends:
+            if extract_content(markup, url, backend) != expected:
+                errors.append(f"{name}: {backend} differs from html.parser")
+    return errors
+
+
+def run_fixture(name, content_type, content, iterations, warmup, backend):
+    """Latencias de `iterations` extracciones (tras `warmup` sin medir)"""
+    response = fetch_result(name, content_type, content)
+    for _ in range(warmup):
+        page_response(response, response.url, 0.0, backend)
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        began = time.perf_counter()
+        payload, status = page_response(response, response.url, 0.0, backend)
+        latencies.append(time.perf_counter() - began)
+        if status != 200:
+            raise RuntimeError(f"{name}: unexpected status {status}")
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20,
+                        help='Extracciones medidas por página (el artículo de 5 MB usa 1/10)')
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--fixture', action='append',
+                        help='Medir solo estas páginas (se puede repetir)')
+    parser.add_argument('--backend', action='append', choices=BACKENDS,
+                        help='Medir solo estos backends de parseo (se puede repetir)')
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    corpus = build_corpus()
+    # Sin lxml instalado su backend es 'events': no se mide dos veces
+    backends = list(dict.fromkeys(resolve_backend(name) for name in args.backend or BACKENDS))
+
+    errors = parity_errors(corpus, backends)
+    for error in errors:
+        print(f"MISMATCH {error}")
+    if errors:
+        return 1
+
+    results = {}
+    for name, (content_type, content) in corpus.items():
+        if args.fixture and name not in args.fixture:
+            continue
+        # El artículo grande tarda segundos por extracción: menos iteraciones
+        iterations = max(1, args.iterations // 10) if len(content) > 1_000_000 else args.iterations
+        for backend in backends:
+            results[f"extract/{backend}/{name}"] = run_fixture(
+                name, content_type, content, iterations, min(args.warmup, iterations), backend)
+    return finish(args, 'micro', results, {'iterations': args.iterations, 'backends': backends})
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Servidores locales para las pruebas de carga: origen HTML y OpenAI de imitación."""
+
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANALYSIS_TEXT = ("SEO Title: Mejor Título Para Tu Web | Marca\n"
+                 "Meta Description: Descubre cómo mejorar tu CTR con esta guía práctica.\n"
+                 "CTR Estimation (Original): 2%\n"
+                 "CTR Estimation (Optimized): 4%\n"
+                 "CTR Increase: 100%")
+
+ANALYSIS_JSON = json.dumps({
+    'seo_title': 'Mejor Título Para Tu Web | Marca',
+    'meta_description': 'Descubre cómo mejorar tu CTR con esta guía práctica.',
+    'ctr_original': 2, 'ctr_optimized': 4, 'ctr_increase': 100,
+})
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Cola de conexiones amplia para no rechazar picos de la prueba de carga
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # La app cierra la conexión en cuanto tiene el </head>: no es un error
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # La app corta la descarga tras </head>
+            pass
+
+
+def origin_handler(corpus, latency):
+    class OriginHandler(QuietHandler):
+        """GET /<página del corpus>"""
+
+        def do_GET(self):
+            page = corpus.get(self.path.split('?')[0].lstrip('/'))
+            if page is None:
+                self.send_body(404, 'text/html', b'<html><head><title>404</title></head></html>')
+                return
+            if latency:
+                time.sleep(latency)
+            self.send_body(200, *page)
+
+    return OriginHandler
+
+
+def openai_handler(latency, stats):
+    class OpenAIHandler(QuietHandler):
+        """POST /v1/responses con el formato de la API de Responses"""
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            with stats['lock']:
+                stats['calls'] += 1
+            if latency:
+                time.sleep(latency)
+            structured = (body.get('text') or {}).get('format', {}).get('type') == 'json_schema'
+            text = ANALYSIS_JSON if structured else ANALYSIS_TEXT
+            self.send_body(200, 'application/json', json.dumps(response_object(text)).encode())
+
+    return OpenAIHandler
+
+
+def response_object(text):
+    return {
+        'id': 'resp_bench', 'object': 'response', 'created_at': int(time.time()),
+        'model': 'gpt-4.1', 'status': 'completed', 'parallel_tool_calls': True,
+        'tool_choice': 'auto', 'tools': [],
+        'output': [{'type': 'message', 'id': 'msg_bench', 'status': 'completed',
+                    'role': 'assistant',
+                    'content': [{'type': 'output_text', 'text': text, 'annotations': []}]}],
+        'usage': {'input_tokens': 350, 'output_tokens': 80, 'total_tokens': 430,
+                  'input_tokens_details': {'cached_tokens': 0},
+                  'output_tokens_details': {'reasoning_tokens': 0}},
+    }
+
+
+def start(handler):
+    """Arrancar un servidor en un hilo; devuelve (servidor, puerto)"""
+    server = Server(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+
+def start_origin(corpus, latency=0.0):
+    return start(origin_handler(corpus, latency))
+
+
+def start_openai(latency=0.0):
+    """Devuelve (servidor, puerto, estadísticas con el número de llamadas)"""
+    stats = {'calls': 0, 'lock': threading.Lock()}
+    server, port = start(openai_handler(latency, stats))
+    return server, port, stats
@@ -0,0 +1,104 @@
+"""Percentiles, informes y comparación con una ejecución anterior."""
+
+import json
+import math
+import os
+import platform
+
+
+def percentile(ordered, fraction):
+    """Percentil por el método del rango más cercano (`ordered` ya ordenado)"""
+    if not ordered:
+        return 0.0
+    index = max(0, math.ceil(fraction * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Resumen de una serie de latencias (segundos) medidas durante `elapsed` segundos"""
+    ordered = sorted(latencies)
+    count = len(ordered)
+    return {
+        'count': count,
+        'errors': errors,
+        'mean': sum(ordered) / count if count else 0.0,
+        'p50': percentile(ordered, 0.50),
+        'p95': percentile(ordered, 0.95),
+        'p99': percentile(ordered, 0.99),
+        'throughput': count / elapsed if elapsed else 0.0,
+    }
+
+
+def print_table(results):
+    """Tabla con las latencias en milisegundos y el rendimiento en peticiones/s"""
+    width = max([len('name')] + [len(name) for name in results])
+    print(f"{'name':<{width}} {'count':>7} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'req/s':>9}")
+    for name, summary in results.items():
+        print(f"{name:<{width}} {summary['count']:>7} {summary['errors']:>6} "
+              f"{summary['p50'] * 1000:>9.2f} {summary['p95'] * 1000:>9.2f} "
+              f"{summary['p99'] * 1000:>9.2f} {summary['throughput']:>9.1f}")
+
+
+def environment():
+    """Datos de la máquina para saber si dos ejecuciones son comparables"""
+    return {'python': platform.python_version(), 'machine': platform.machine(),
+            'cpus': os.cpu_count()}
+
+
+def save(path, kind, results, options):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'kind': kind, 'environment': environment(), 'options': options,
+                   'results': results}, f, indent=2)
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(results, baseline, tolerance):
+    """Regresiones respecto a la línea base (lista de textos; vacía si no hay)
+
+    Empeora si el p95 sube, el rendimiento baja más de `tolerance` (fracción)
+    o la tasa de errores sube más de un punto.
+    """
+    regressions = []
+    for name, base in baseline['results'].items():
+        current = results.get(name)
+        if current is None:
+            continue
+        if base['p95'] and current['p95'] > base['p95'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95'] * 1000:.2f} ms -> "
+                               f"{current['p95'] * 1000:.2f} ms")
+        if base['throughput'] and current['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput']:.1f} -> "
+                               f"{current['throughput']:.1f} req/s")
+        base_rate = base['errors'] / max(1, base['count'] + base['errors'])
+        current_rate = current['errors'] / max(1, current['count'] + current['errors'])
+        if current_rate > base_rate + 0.01:
+            regressions.append(f"{name}: error rate {base_rate:.1%} -> {current_rate:.1%}")
+    return regressions
+
+
+def add_arguments(parser):
+    """Opciones comunes de salida y comparación"""
+    parser.add_argument('--output', help='Guardar los resultados en este JSON')
+    parser.add_argument('--baseline', help='JSON de una ejecución anterior con la que comparar')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='Empeoramiento permitido respecto a la línea base (0.15 = 15%%)')
+
+
+def finish(args, kind, results, options):
+    """Imprimir, guardar y comparar; devuelve el código de salida (1 si hay regresiones)"""
+    print_table(results)
+    if args.output:
+        save(args.output, kind, results, options)
+    if not args.baseline:
+        return 0
+    regressions = compare(results, load(args.baseline), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 1 if regressions else 0
@@ -9,21 +9,44 @@ incluyendo protecciones contra ataques de request smuggling.
 
 import multiprocessing
 import os
-
-# Número de workers - basado en la cantidad de núcleos
-workers = multiprocessing.cpu_count() * 2 + 1
-
-# Clase de worker que soporta SSL
-worker_class = 'sync'
+import shutil
+import tempfile
+
+# Modo de servidor: 'sync' (WSGI, api.routes:app) o 'asgi' (api.asgi:app)
+SERVER_MODE = os.getenv('SERVER_MODE', 'sync').lower()
+
+if SERVER_MODE == 'asgi':
+    # Un bucle de eventos por núcleo: cada worker atiende cientos de peticiones
+    # en vuelo en /extract-meta y /analyze, y ASYNC_WSGI_THREADS a la vez en el
+    # resto de rutas, así que no hace falta multiplicar los procesos.
+    # El worker de uvicorn no llama a pre_request; h11 ya rechaza las
+    # peticiones con Transfer-Encoding y Content-Length a la vez.
+    workers = multiprocessing.cpu_count()
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    # Número de workers - basado en la cantidad de núcleos
+    workers = multiprocessing.cpu_count() * 2 + 1
+
+    # Clase de worker que soporta SSL
+    worker_class = 'sync'
+
+# Métricas de Prometheus: cada worker escribe sus valores en este directorio y
+# /metrics los suma (debe definirse antes de que los workers importen la app)
+METRICS_MULTIPROC_DIR = os.getenv(
+    'METRICS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'serp_title_metrics'))
+os.environ['PROMETHEUS_MULTIPROC_DIR'] = METRICS_MULTIPROC_DIR
 
 # Timeouts - para prevenir ataques DoS
 timeout = 30
 keepalive = 2
 
 # Configuración de registros
+# Los hooks de abajo pasan los registros de gunicorn a la cola JSON de api.logs
 accesslog = '-'
 errorlog = '-'
 loglevel = 'info'
+# La línea de acceso lleva el X-Request-ID que la app añade a cada respuesta
+access_log_format = '%(h)s "%(r)s" %(s)s %(b)s %(M)sms rid=%({x-request-id}o)s'
 
 # Limitar el tamaño máximo de la solicitud (10 MB)
 limit_request_line = 8190
@@ -42,16 +65,55 @@ secure_scheme_headers = {
 # Función de configuración de la aplicación
 
 
+def on_starting(server):
+    """Vaciar las métricas de una ejecución anterior antes de arrancar los workers."""
+    shutil.rmtree(METRICS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+    attach_logs(server.log)
+
+
+def on_reload(server):
+    """gunicorn vuelve a crear sus handlers al recargar: reconectarlos a la cola."""
+    attach_logs(server.log)
+
+
+def attach_logs(glogger):
+    """Registros de gunicorn (y de uvicorn en modo asgi) en JSON sin bloquear."""
+    from api.logs import attach_gunicorn
+    attach_gunicorn(glogger)
+
+
+def child_exit(server, worker):
+    """Quitar de /metrics los valores en vivo de un worker que ha terminado."""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
 def post_fork(server, worker):
     """Configuración después de la bifurcación del trabajador."""
+    attach_logs(worker.log)
     server.log.info("Worker spawned (pid: %s)", worker.pid)
 
 
+def post_worker_init(worker):
+    """Arrancar los hilos de la cola de trabajos (/jobs) en cada worker."""
+    from api.jobs import job_pool
+    job_pool.start()
+
+
+def worker_exit(server, worker):
+    """Devolver a la cola los trabajos en curso del worker que termina."""
+    from api.jobs import job_pool
+    job_pool.stop()
+
+
 def pre_request(worker, req):
     """Validación previa a la solicitud para protección contra request smuggling."""
     # Validar encabezados Transfer-Encoding y Content-Length
-    has_transfer_encoding = 'HTTP_TRANSFER_ENCODING' in req.environ
-    has_content_length = 'CONTENT_LENGTH' in req.environ
+    # (el Request de gunicorn no tiene environ: las cabeceras son pares en mayúsculas)
+    headers = dict(req.headers)
+    has_transfer_encoding = 'TRANSFER-ENCODING' in headers
+    has_content_length = 'CONTENT-LENGTH' in headers
 
     # Si ambos encabezados están presentes, rechazar la solicitud
     # para prevenir ataques de request smuggling TE.CL
@@ -64,7 +126,7 @@ def pre_request(worker, req):
 
     # Si Transfer-Encoding está presente, validar su valor
     if has_transfer_encoding:
-        transfer_encoding = req.environ['HTTP_TRANSFER_ENCODING'].lower()
+        transfer_encoding = headers['TRANSFER-ENCODING'].lower()
         if transfer_encoding != 'chunked':
             worker.log.warning(
                 "Valor inválido de Transfer-Encoding: %s",
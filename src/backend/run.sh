@@ -26,8 +26,14 @@ if [ ! -d "./certs" ]; then
     openssl req -x509 -newkey rsa:4096 -keyout ./certs/key.pem -out ./certs/cert.pem -days 365 -nodes -subj "/CN=localhost" 2>/dev/null
 fi
 
+# Aplicación según el modo de servidor (SERVER_MODE=asgi para el modo asíncrono)
+APP_MODULE="api.routes:app"
+if [ "$SERVER_MODE" = "asgi" ]; then
+    APP_MODULE="api.asgi:app"
+fi
+
 echo "Iniciando Gunicorn con configuración segura..."
 gunicorn \
     --config gunicorn_config.py \
     --bind 0.0.0.0:5002 \
-    api.routes:app 
\ No newline at end of file
+    $APP_MODULE 
\ No newline at end of file
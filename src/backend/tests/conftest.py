@@ -0,0 +1,130 @@
+"""Configuración común de las pruebas.
+
+Los almacenes globales se crean al importar `api` a partir de las variables
+de entorno, así que aquí se apuntan todos a un directorio temporal antes de
+que ninguna prueba importe la API.
+"""
+
+import itertools
+import os
+import socket
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+DATA_DIR = tempfile.mkdtemp(prefix='serp_title_tests_')
+
+for name in ('METADATA_CACHE', 'ANALYSIS_CACHE', 'DUPLICATES', 'JOBS', 'BRUTE_FORCE',
+             'QUOTA', 'SESSION'):
+    os.environ[f'{name}_PATH'] = os.path.join(DATA_DIR, f'{name.lower()}.sqlite3')
+os.environ['RATELIMIT_STORAGE_URI'] = 'memory://'
+
+# Cada cliente de prueba tiene su IP: cuotas y límites de uso propios
+ADDRESSES = itertools.count(1)
+
+
+class Clock:
+    """Reloj manual para las pruebas que dependen de time.time()."""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def client():
+    from api.routes import app
+    client = app.test_client()
+    address = next(ADDRESSES)
+    client.environ_base['REMOTE_ADDR'] = f'198.51.{address // 256}.{address % 256}'
+    return client
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'store.sqlite3')
+
+
+class Origin:
+    """Servidor de origen local: ruta -> (estado, cabeceras, cuerpo, segundos de espera)."""
+
+    def __init__(self, port):
+        self.port = port
+        self.pages = {}
+        self.requests = []
+
+    def url(self, path, host='site.test'):
+        return f'http://{host}:{self.port}{path}'
+
+    def add(self, path, body=b'', status=200, headers=None, delay=0):
+        headers = {'Content-Type': 'text/html; charset=utf-8', **(headers or {})}
+        self.pages[path] = (status, headers, body, delay)
+
+
+@pytest.fixture
+def origin(monkeypatch):
+    """Origen en 127.0.0.1 para los nombres *.test (evil.test resuelve a una IP privada)"""
+    from api import resolver
+
+    real_getaddrinfo = socket.getaddrinfo
+
+    def getaddrinfo(host, *args, **kwargs):
+        if isinstance(host, bytes):
+            host = host.decode()
+        if host.endswith('.test'):
+            address = '10.0.0.5' if host.startswith('evil') else '127.0.0.1'
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (address, 0))]
+        return real_getaddrinfo(host, *args, **kwargs)
+
+    is_blocked_ip = resolver.is_blocked_ip
+    monkeypatch.setattr(socket, 'getaddrinfo', getaddrinfo)
+    monkeypatch.setattr(resolver, 'is_blocked_ip',
+                        lambda address: address != '127.0.0.1' and is_blocked_ip(address))
+    resolver.dns_cache.entries.clear()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            server.requests.append(self.path)
+            status, headers, body, delay = server.pages.get(self.path, (404, {}, b'not found', 0))
+            time.sleep(delay)
+            if 'ETag' in headers and self.headers.get('If-None-Match') == headers['ETag']:
+                status, body = 304, b''
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    server = Origin(httpd.server_address[1])
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    httpd.shutdown()
+    httpd.server_close()
+    resolver.dns_cache.entries.clear()
@@ -0,0 +1,42 @@
+"""Extracción por lotes con plazo."""
+
+import asyncio
+import time
+from functools import partial
+
+from api import batch
+from api.batch import BatchExtractor
+
+HEAD = b'<html><head><title>T</title></head>'
+
+
+def test_batch_keeps_order_and_reports_errors(origin):
+    origin.add('/batch/a', HEAD)
+    urls = [origin.url('/batch/a'), origin.url('/batch/missing'), '', origin.url('/', 'evil.test')]
+    results = asyncio.run(BatchExtractor().run(urls))
+    assert [result['status'] for result in results] == [200, 500, 400, 403]
+    assert [result['url'] for result in results] == urls
+    assert results[0]['title'] == 'T'
+
+
+def test_batch_returns_partial_results_at_the_deadline(origin):
+    origin.add('/batch/fast', HEAD)
+    origin.add('/batch/slow', HEAD, delay=2)
+    extractor = BatchExtractor(max_seconds=0.5)
+    start = time.monotonic()
+    fast, slow = asyncio.run(extractor.run([origin.url('/batch/fast'), origin.url('/batch/slow')]))
+    assert time.monotonic() - start < 1.5
+    assert fast['status'] == 200
+    assert (slow['status'], slow['error']) == (504, 'Deadline exceeded')
+    assert extractor.expired == 1
+
+
+def test_batch_route_refunds_urls_cut_by_the_deadline(client, origin, monkeypatch):
+    monkeypatch.setattr(batch, 'BatchExtractor', partial(BatchExtractor, max_seconds=0.5))
+    origin.add('/batch/route-fast', HEAD)
+    origin.add('/batch/route-slow', HEAD, delay=2)
+    urls = [origin.url('/batch/route-fast'), origin.url('/batch/route-slow')]
+    response = client.post('/extract-meta/batch', json={'urls': urls})
+    assert response.json['deadline_reached'] and response.json['count'] == 2
+    # De las 3 extracciones de la cuota solo se gastó una
+    assert client.post('/extract-meta/batch', json={'urls': urls[:1] * 2}).status_code == 200
@@ -0,0 +1,43 @@
+"""Análisis masivo: qué elementos cuentan como análisis."""
+
+from types import SimpleNamespace
+
+import pytest
+
+from api.bulk import BulkAnalyzer
+from api.llm import token_cost
+
+USAGE = SimpleNamespace(input_tokens=1000, output_tokens=200)
+
+
+class FakeClient:
+    """Cliente de OpenAI que falla con los títulos que empiezan por 'fail'."""
+
+    def __init__(self):
+        self.responses = self
+
+    def create(self, input, **kwargs):
+        if 'Title "fail' in input:
+            raise RuntimeError("upstream error")
+        return SimpleNamespace(output_text='SEO Title: T', usage=USAGE)
+
+
+def run(items):
+    charged = []
+    analyzer = BulkAnalyzer(FakeClient(), use_cache=False,
+                            on_item=lambda analyzed, cost: charged.append((analyzed, cost)))
+    results = list(analyzer.run(items))
+    return results[:-1], results[-1]['summary'], charged
+
+
+def test_failed_call_is_not_an_analysis():
+    results, summary, charged = run([{'title': 'fail once', 'keyword': 'k'}])
+    assert results[0]['status'] == 'error' and 'upstream error' in results[0]['message']
+    assert summary['failed'] == 1
+    assert charged == [(False, 0)]
+
+
+def test_successful_and_invalid_items():
+    _, summary, charged = run([{'title': 'ok', 'keyword': 'k'}, {'title': ''}])
+    assert (summary['succeeded'], summary['failed']) == (1, 1)
+    assert sorted(charged) == [(False, 0), (True, pytest.approx(token_cost(USAGE)))]
@@ -0,0 +1,78 @@
+"""Resolución de la codificación de las páginas descargadas."""
+
+import codecs
+
+import pytest
+
+from api.charset import decode_page, normalize_encoding, resolve_encoding
+
+SPANISH = 'Título de la página: camión, señal y pingüino'
+
+
+def page(text, encoding, head=''):
+    return f'<html><head>{head}<title>{text}</title></head></html>'.encode(encoding)
+
+
+def test_bom_wins_over_header_and_meta():
+    content = codecs.BOM_UTF8 + page(SPANISH, 'utf-8', '<meta charset="iso-8859-1">')
+    assert resolve_encoding(content, 'text/html; charset=windows-1251') == ('utf-8', 'bom', 3)
+    text, encoding, source = decode_page(content)
+    assert text.startswith('<html>') and SPANISH in text
+
+
+def test_utf16_bom():
+    content = codecs.BOM_UTF16_LE + page(SPANISH, 'utf-16-le')
+    text, encoding, source = decode_page(content)
+    assert (encoding, source) == ('utf-16-le', 'bom') and SPANISH in text
+
+
+def test_header_wins_over_meta():
+    content = page(SPANISH, 'cp1252', '<meta charset="utf-8">')
+    text, encoding, source = decode_page(content, 'text/html; charset="ISO-8859-1"')
+    assert (encoding, source) == ('cp1252', 'header') and SPANISH in text
+
+
+@pytest.mark.parametrize('head', [
+    '<meta charset="windows-1252">',
+    "<meta charset='latin1'>",
+    '<meta http-equiv="Content-Type" content="text/html; charset=iso-8859-1">',
+])
+def test_meta_declaration(head):
+    text, encoding, source = decode_page(page(SPANISH, 'cp1252', head), 'text/html')
+    assert (encoding, source) == ('cp1252', 'meta') and SPANISH in text
+
+
+def test_meta_after_sniff_window_is_ignored():
+    content = page(SPANISH, 'utf-8', '<!--' + ' ' * 5000 + '--><meta charset="koi8-r">')
+    assert resolve_encoding(content)[:2] == ('utf-8', 'detected')
+
+
+def test_meta_cannot_declare_utf16_or_utf7():
+    assert normalize_encoding('utf-16', from_meta=True) == 'utf-8'
+    assert normalize_encoding('utf-7') is None
+    assert normalize_encoding('no-such-charset') is None
+    content = page('+ADw-script+AD4-', 'ascii', '<meta charset="utf-7">')
+    assert resolve_encoding(content)[1] == 'detected'
+
+
+@pytest.mark.parametrize('label, expected', [
+    ('ascii', 'cp1252'), ('ISO-8859-1', 'cp1252'), ('ISO-8859-9', 'cp1254'),
+    ('GB2312', 'gb18030'), ('Shift_JIS', 'shift_jis'), ('UTF8', 'utf-8'),
+])
+def test_browser_superset_overrides(label, expected):
+    assert normalize_encoding(label) == expected
+
+
+def test_detection_without_declaration():
+    assert resolve_encoding(page('solo ascii', 'ascii'))[:2] == ('utf-8', 'detected')
+    assert resolve_encoding(page(SPANISH, 'utf-8'))[:2] == ('utf-8', 'detected')
+    text, encoding, source = decode_page(page(SPANISH * 5, 'cp1252'))
+    assert (encoding, source) == ('cp1252', 'detected') and SPANISH in text
+    russian = 'Заголовок страницы о погоде в Москве и новостях дня ' * 5
+    text, encoding, source = decode_page(page(russian, 'cp1251'))
+    assert (encoding, source) == ('cp1251', 'detected') and russian in text
+
+
+def test_utf8_cut_at_the_detection_limit_is_still_utf8():
+    content = page('ñ' * 40000, 'utf-8')
+    assert resolve_encoding(content)[:2] == ('utf-8', 'detected')
@@ -0,0 +1,64 @@
+"""Índice de casi duplicados por usuario."""
+
+PAGE = ('<html><head><title>{title}</title><meta name="description" content="{description}">'
+        '</head></html>')
+
+
+def add_pages(origin, prefix):
+    for index, title in enumerate(('Zapatillas running baratas para hombre | Tienda online',
+                                   'Zapatillas running baratas para hombres | Tienda online',
+                                   'Guía de tallas')):
+        origin.add(f'{prefix}/{index}', PAGE.format(title=title, description=title).encode(),
+                   headers={'ETag': f'"{prefix}{index}"'})
+    return [origin.url(f'{prefix}/{index}') for index in range(3)]
+
+
+def report(client):
+    response = client.get('/duplicates', query_string={'domain': 'site.test'})
+    assert response.status_code == 200
+    return response.json['data']
+
+
+def test_cached_pages_are_recorded_for_every_user(origin, client):
+    from api.routes import app
+    other = app.test_client()
+    other.environ_base['REMOTE_ADDR'] = '192.0.2.200'
+
+    urls = add_pages(origin, '/dup-single')
+    for url in urls:
+        assert client.post('/extract-meta', json={'url': url}).json['metadata']['cache'] == 'miss'
+    assert report(other)['pages'] == 0
+    for url in urls:
+        assert other.post('/extract-meta', json={'url': url}).json['metadata']['cache'] == 'hit'
+
+    for user in (client, other):
+        data = report(user)
+        assert data['pages'] == 3
+        assert len(data['title']['groups']) == 1
+
+
+def test_revalidated_pages_are_recorded(origin, client, clock):
+    from api.routes import app
+    other = app.test_client()
+    other.environ_base['REMOTE_ADDR'] = '192.0.2.201'
+
+    urls = add_pages(origin, '/dup-revalidated')
+    for url in urls:
+        client.post('/extract-meta', json={'url': url})
+    # La caché caduca: el segundo usuario la revalida con un GET condicional (304)
+    clock.advance(24 * 3600)
+    for url in urls:
+        assert other.post('/extract-meta', json={'url': url}).json['metadata']['cache'] == 'revalidated'
+    assert report(other)['pages'] == 3
+
+
+def test_batch_records_cached_pages(origin, client):
+    from api.routes import app
+    other = app.test_client()
+    other.environ_base['REMOTE_ADDR'] = '192.0.2.202'
+
+    urls = add_pages(origin, '/dup-batch')
+    assert client.post('/extract-meta/batch', json={'urls': urls}).status_code == 200
+    response = other.post('/extract-meta/batch', json={'urls': urls})
+    assert {result['metadata']['cache'] for result in response.json['results']} == {'hit'}
+    assert report(client)['pages'] == report(other)['pages'] == 3
@@ -0,0 +1,44 @@
+"""La cuota de extracciones se cobra por URL descargada (QUOTA_EXTRACT_LIMIT=3)."""
+
+HEAD = b'<html><head><title>T</title></head>'
+
+
+def test_batch_charges_one_extraction_per_url(client, origin):
+    origin.add('/a', HEAD)
+    urls = [origin.url('/a')] * 2
+    assert client.post('/extract-meta/batch', json={'urls': urls * 2}).status_code == 429
+    assert client.post('/extract-meta/batch', json={'urls': urls}).status_code == 200
+    assert client.post('/extract-meta/batch', json={'urls': urls}).status_code == 429
+    assert client.post('/extract-meta/batch', json={'urls': urls[:1]}).status_code == 200
+
+
+def test_sitemap_refunds_urls_it_did_not_extract(client, origin):
+    origin.add('/a', HEAD)
+    origin.add('/sitemap.xml', (
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        f'<url><loc>{origin.url("/a")}</loc></url></urlset>').encode(),
+        headers={'Content-Type': 'application/xml'})
+    sitemap = {'url': origin.url('/sitemap.xml'), 'max_urls': 4}
+    assert client.post('/extract-meta/sitemap', json=sitemap).status_code == 429
+
+    response = client.post('/extract-meta/sitemap', json={**sitemap, 'max_urls': 3})
+    assert response.status_code == 200
+    assert response.get_data(as_text=True).count('"url"') == 1
+    # Se reservaron 3 y solo se extrajo 1
+    urls = [origin.url('/a')] * 2
+    assert client.post('/extract-meta/batch', json={'urls': urls}).status_code == 200
+    assert client.post('/extract-meta/batch', json={'urls': urls[:1]}).status_code == 429
+
+
+def test_extract_job_charges_every_url(client):
+    urls = [f'https://example.com/{i}' for i in range(4)]
+    assert client.post('/jobs', json={'type': 'extract', 'urls': urls}).status_code == 429
+    assert client.post('/jobs', json={'type': 'extract', 'urls': urls[:3]}).status_code == 202
+    assert client.post('/jobs', json={'type': 'extract', 'urls': urls[:1]}).status_code == 429
+
+
+def test_extract_job_retry_charges_remaining_urls(client):
+    urls = ['https://example.com/a', 'https://example.com/b']
+    job = client.post('/jobs', json={'type': 'extract', 'urls': urls}).json['data']
+    assert client.post(f"/jobs/{job['id']}/cancel").status_code == 200
+    assert client.post(f"/jobs/{job['id']}/retry").status_code == 429
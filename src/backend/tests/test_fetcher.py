@@ -0,0 +1,84 @@
+"""Descarga en streaming que se detiene tras </head>."""
+
+import time
+
+import pytest
+import requests
+
+from api.fetcher import (HeadBuffer, RedirectRejected, UnsupportedContentType, fetch_head,
+                         read_until_head)
+
+HEAD = b'<html><head><title>T</title></head>'
+
+
+def test_head_end_split_between_chunks():
+    head = HeadBuffer(body_budget=4, max_bytes=1000)
+    assert not head.feed(b'<html><head><title>T</title></he')
+    assert not head.feed(b'AD>ab')
+    assert head.feed(b'cdef')
+    assert head.content() == b'<html><head><title>T</title></heAD>abcd'
+
+
+def test_read_until_head():
+    assert read_until_head([HEAD, b'<body>' * 10], body_budget=6) == (HEAD + b'<body>', True)
+    # Página corta: se lee entera
+    assert read_until_head([HEAD, b'', b'<body>'], body_budget=100) == (HEAD + b'<body>', False)
+    # Sin </head> se para en max_bytes
+    content, truncated = read_until_head([b'x' * 100] * 10, max_bytes=250)
+    assert (len(content), truncated) == (250, True)
+
+
+def test_read_until_head_deadline():
+    with pytest.raises(requests.exceptions.Timeout):
+        read_until_head([b'x'], deadline=time.monotonic() - 1)
+
+
+def test_fetch_stops_after_head(origin):
+    origin.add('/big', HEAD + b'<body>' + b'x' * 1_000_000)
+    result = fetch_head(origin.url('/big'), body_budget=1024)
+    assert result.status_code == 200 and result.truncated
+    assert result.content == (HEAD + b'<body>' + b'x' * 1_000_000)[:len(HEAD) + 1024]
+
+
+def test_fetch_byte_cap_without_head(origin):
+    origin.add('/nohead', b'<p>' + b'x' * 500_000)
+    result = fetch_head(origin.url('/nohead'), max_bytes=64 * 1024)
+    assert len(result.content) == 64 * 1024 and result.truncated
+
+
+def test_fetch_small_page_is_read_whole(origin):
+    origin.add('/small', HEAD + b'<body><h1>H</h1></body></html>')
+    result = fetch_head(origin.url('/small'))
+    assert result.content == HEAD + b'<body><h1>H</h1></body></html>'
+    assert not result.truncated
+
+
+def test_fetch_rejects_non_html(origin):
+    origin.add('/file.pdf', b'%PDF', headers={'Content-Type': 'application/pdf'})
+    with pytest.raises(UnsupportedContentType):
+        fetch_head(origin.url('/file.pdf'))
+
+
+def test_fetch_non_200_has_no_body(origin):
+    result = fetch_head(origin.url('/missing'))
+    assert result.status_code == 404 and result.content == b''
+
+
+def test_redirects_are_followed_and_validated(origin):
+    origin.add('/page', HEAD)
+    origin.add('/moved', status=301, headers={'Location': '/page'})
+    result = fetch_head(origin.url('/moved'))
+    assert result.status_code == 200 and result.url == origin.url('/page')
+
+    # Cada salto pasa la validación SSRF antes de conectarse
+    origin.add('/to-private', status=302, headers={'Location': origin.url('/', 'evil.test')})
+    with pytest.raises(RedirectRejected) as rejected:
+        fetch_head(origin.url('/to-private'))
+    assert rejected.value.status == 403
+    assert rejected.value.url == origin.url('/', 'evil.test')
+
+
+def test_redirect_loop_is_bounded(origin):
+    origin.add('/loop', status=302, headers={'Location': '/loop'})
+    with pytest.raises(requests.exceptions.TooManyRedirects):
+        fetch_head(origin.url('/loop'))
@@ -0,0 +1,93 @@
+"""Cola de trabajos: reservas (leases) compartidas entre workers."""
+
+import pytest
+
+from api.jobs import CANCELLED, DEAD, FAILED, QUEUED, RUNNING, JobStore
+
+LEASE = 60
+
+
+@pytest.fixture
+def store(db_path):
+    return JobStore(db_path)
+
+
+def test_claim_takes_oldest_job_once(db_path, clock):
+    first, second = JobStore(db_path), JobStore(db_path)
+    job_id = first.submit('extract', 'ip:1', ['https://a.test/'])
+    clock.advance(1)
+    later_id = first.submit('extract', 'ip:1', ['https://b.test/'])
+
+    job = first.claim(LEASE)
+    assert job['id'] == job_id
+    assert job['status'] == RUNNING and job['attempts'] == 1
+    assert job['locked_until'] == clock.now + LEASE
+    assert second.claim(LEASE)['id'] == later_id
+    assert second.claim(LEASE) is None
+
+
+def test_extend_renews_only_own_lease(store, clock):
+    store.submit('extract', 'ip:1', ['https://a.test/'])
+    job = store.claim(LEASE)
+    clock.advance(LEASE - 1)
+    assert store.extend({job['id']: job['worker']}, LEASE) == {}
+    assert store.get(job['id'])['locked_until'] == clock.now + LEASE
+    assert store.extend({job['id']: 'other-token'}, LEASE) == {job['id']: 'lost'}
+
+
+def test_expired_lease_is_reclaimed(db_path, clock):
+    first, second = JobStore(db_path), JobStore(db_path)
+    first.submit('extract', 'ip:1', ['https://a.test/'])
+    job = first.claim(LEASE)
+    assert second.claim(LEASE) is None
+
+    # El primer worker deja de renovar: su reserva caduca y otro se queda el trabajo
+    clock.advance(LEASE + 1)
+    reclaimed = second.claim(LEASE)
+    assert reclaimed['id'] == job['id']
+    assert reclaimed['attempts'] == 2 and reclaimed['worker'] != job['worker']
+    assert first.extend({job['id']: job['worker']}, LEASE) == {job['id']: 'lost'}
+
+    # Lo que escriba el worker anterior ya no cambia el trabajo
+    first.finish(job, FAILED, 'late')
+    assert second.get(job['id'])['status'] == RUNNING
+
+
+def test_expired_lease_without_attempts_left_is_dead(store, clock):
+    job_id = store.submit('extract', 'ip:1', ['https://a.test/'], max_attempts=1)
+    store.claim(LEASE)
+    clock.advance(LEASE + 1)
+    assert store.claim(LEASE) is None
+    job = store.get(job_id)
+    assert job['status'] == DEAD and 'lease expired' in job['error']
+
+
+def test_release_requeues_without_spending_an_attempt(store, clock):
+    store.submit('extract', 'ip:1', ['https://a.test/'])
+    job = store.claim(LEASE)
+    store.release(job)
+    released = store.get(job['id'])
+    assert released['status'] == QUEUED and released['attempts'] == 0
+    assert released['worker'] is None and released['locked_until'] is None
+    assert store.claim(LEASE)['attempts'] == 1
+
+
+def test_cancel_running_job_stops_at_next_renewal(store, clock):
+    store.submit('extract', 'ip:1', ['https://a.test/'])
+    job = store.claim(LEASE)
+    store.cancel(job['id'])
+    assert store.extend({job['id']: job['worker']}, LEASE) == {job['id']: 'cancelled'}
+
+
+def test_requeue_keeps_finished_items(store, clock):
+    job_id = store.submit('extract', 'ip:1', ['https://a.test/', 'https://b.test/'])
+    assert not store.requeue(job_id)
+    job = store.claim(LEASE)
+    store.add_result(job_id, 0, {'title': 'A'})
+    store.add_result(job_id, 0, {'title': 'repetido'})
+    store.finish(job, CANCELLED)
+    assert store.requeue(job_id)
+    assert store.get(job_id)['status'] == QUEUED
+    assert store.done_items(job_id) == {0}
+    assert store.results(job_id) == [(0, {'title': 'A'})]
+    assert store.pending('ip:1') == 1 and store.pending('ip:2') == 0
@@ -0,0 +1,39 @@
+"""Almacenamiento sqlite:// de Flask-Limiter."""
+
+from limits import RateLimitItemPerMinute
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+
+from api.limiter_storage import SQLiteStorage
+
+
+def test_counters_expire_with_their_window(db_path, clock):
+    storage = SQLiteStorage(f'sqlite://{db_path}')
+    assert storage.incr('k', 60) == 1
+    assert storage.incr('k', 60, amount=2) == 3
+    assert storage.get('k') == 3
+    assert storage.get_expiry('k') == clock.now + 60
+    clock.advance(60)
+    assert storage.get('k') == 0
+    assert storage.incr('k', 60) == 1
+
+
+def test_reset_and_clear(db_path, clock):
+    storage = SQLiteStorage(f'sqlite://{db_path}')
+    storage.incr('a', 60)
+    storage.incr('b', 60)
+    storage.clear('a')
+    assert storage.get('a') == 0 and storage.get('b') == 1
+    assert storage.reset() == 1
+    assert storage.check()
+
+
+def test_limit_is_shared_between_workers(db_path, clock):
+    uri = f'sqlite://{db_path}'
+    assert isinstance(storage_from_string(uri), SQLiteStorage)
+    workers = [FixedWindowRateLimiter(storage_from_string(uri)) for _ in range(2)]
+    limit = RateLimitItemPerMinute(3)
+    hits = [workers[i % 2].hit(limit, 'ip', '1') for i in range(4)]
+    assert hits == [True, True, True, False]
+    clock.advance(60)
+    assert workers[1].hit(limit, 'ip', '1')
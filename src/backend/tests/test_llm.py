@@ -0,0 +1,61 @@
+"""Análisis estructurado: lo gastado en OpenAI se cobra aunque la respuesta falle."""
+
+import json
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from api import routes
+from api.llm import AnalysisFailed, analyze_structured, token_cost
+
+INPUTS = {'title': 'Zapatillas', 'meta_description': 'Envío gratis', 'keyword': 'zapatillas',
+          'brand': 'Tienda'}
+USAGE = SimpleNamespace(input_tokens=1000, output_tokens=200)
+ANALYSIS = {'seo_title': 'Zapatillas Running | Tienda', 'meta_description': 'Envío gratis.',
+            'ctr_original': 2.0, 'ctr_optimized': 3.0, 'ctr_increase': 50.0}
+
+
+class FakeClient:
+    """Cliente de OpenAI que devuelve las respuestas indicadas, en orden."""
+
+    def __init__(self, *outputs):
+        self.outputs = list(outputs)
+        self.responses = self
+
+    def create(self, **kwargs):
+        return SimpleNamespace(output_text=self.outputs.pop(0), usage=USAGE)
+
+
+def test_valid_analysis():
+    result, cost = analyze_structured(FakeClient(json.dumps(ANALYSIS)), INPUTS)
+    assert result['valid'] and result['repairs'] == 0
+    assert cost == pytest.approx(token_cost(USAGE))
+
+
+def test_malformed_analysis_keeps_its_cost():
+    with pytest.raises(AnalysisFailed) as failed:
+        analyze_structured(FakeClient('not an analysis'), INPUTS)
+    assert failed.value.token_cost == pytest.approx(token_cost(USAGE))
+
+
+def test_malformed_repair_keeps_every_call():
+    too_long = {**ANALYSIS, 'meta_description': 'x' * 400}
+    with pytest.raises(AnalysisFailed) as failed:
+        analyze_structured(FakeClient(json.dumps(too_long), 'not json'), INPUTS)
+    assert failed.value.token_cost == pytest.approx(2 * token_cost(USAGE))
+
+
+def test_route_settles_the_cost_of_a_failed_analysis(client, monkeypatch):
+    @contextmanager
+    def lease(api_key):
+        yield FakeClient('not an analysis')
+
+    settled = []
+    monkeypatch.setattr(routes.openai_clients, 'lease', lease)
+    monkeypatch.setattr(routes, 'settle_analyses', lambda *args: settled.append(args))
+    response = client.post('/analyze', json={**INPUTS, 'description': INPUTS['meta_description'],
+                                             'structured': True, 'no_cache': True})
+    assert response.status_code == 500
+    (_, reserved, analyzed, cost), = settled
+    assert (reserved, analyzed) == (1, 1) and cost == pytest.approx(token_cost(USAGE))
@@ -0,0 +1,67 @@
+"""Los backends de parseo devuelven los mismos metadatos que html.parser."""
+
+import random
+
+import pytest
+
+from api.extractor import extract_content
+from api.parsers import BACKENDS, parse_elements, resolve_backend
+from benchmarks.corpus import SEED, malformed_page, wordpress_page
+
+URL = 'https://example.test/page'
+
+PAGES = {
+    'basic': (
+        '<!DOCTYPE html><html lang="es"><head><meta charset="utf-8">'
+        '<title>  Zapatillas &amp; running | Tienda  </title>'
+        '<meta name="description" content="Envío gratis en 24 h &lt;solo hoy&gt;">'
+        '<meta property="og:title" content="OG título"><meta name="keywords" content="a, b">'
+        '<meta property="og:image" content="/img.png"><link rel="canonical" href="/canon">'
+        '</head><body><h1>Hola <b>mundo</b></h1></body></html>'),
+    'no_head': '<title>Sin head</title><h1>Uno</h1><h1>Dos</h1>',
+    'script_text': ('<head><script>var t = "<title>falso</title>";</script>'
+                    '<title>Real</title></head>'),
+    'uppercase': '<HTML><HEAD><TITLE>Mayúsculas</TITLE><META NAME="Description" CONTENT="D">',
+    'multi_valued': ('<link rel="alternate canonical" href="/c">'
+                     '<meta name="generator" content="WordPress 6.4">'
+                     '<a rel="category tag" href="/c">Cat</a><a rel="tag" href="/t">Etiqueta</a>'),
+    'cdata': '<title>Antes</title><![CDATA[<title>dentro</title>]]><h1>h</h1>',
+    'truncated': '<title>Cortado</title><meta name="description" content="sin cer',
+    'self_closing': '<title>T</title><div/><h1>Después</h1>',
+    'duplicate_attr': '<meta name="description" content="uno" content="dos"><title>T</title>',
+    'empty': '',
+}
+
+
+def generated_pages():
+    rng = random.Random(SEED)
+    return {'malformed': malformed_page(rng), 'wordpress': wordpress_page(rng, 50, 10)}
+
+
+@pytest.mark.parametrize('backend', [backend for backend in BACKENDS if backend != 'html.parser'])
+@pytest.mark.parametrize('name, markup', [*PAGES.items(), *generated_pages().items()])
+def test_backend_matches_html_parser(backend, name, markup):
+    if backend == 'lxml':
+        pytest.importorskip('lxml')
+    assert extract_content(markup, URL, backend) == extract_content(markup, URL, 'html.parser')
+
+
+def test_metadata_values():
+    title, metadata = extract_content(PAGES['basic'], URL, 'events')
+    assert title.strip() == 'Zapatillas &amp; running | Tienda'
+    assert metadata['canonical'] == '/canon'
+    assert metadata['h1'] == 'Hola mundo'
+
+
+def test_lxml_falls_back_on_repaired_markup():
+    pytest.importorskip('lxml')
+    from api.metrics import parser_fallbacks
+    fallbacks = parser_fallbacks.labels('lxml')
+    before = fallbacks._value.get()
+    parse_elements(PAGES['cdata'], 'lxml')
+    assert fallbacks._value.get() == before + 1
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        resolve_backend('html5lib')
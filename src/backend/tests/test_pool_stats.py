@@ -0,0 +1,12 @@
+"""/api/pool-stats exige el mismo token que /metrics."""
+
+from api import routes
+
+
+def test_pool_stats_requires_metrics_token(client, monkeypatch):
+    monkeypatch.setattr(routes, 'METRICS_TOKEN', 'secret')
+    assert client.get('/api/pool-stats').status_code == 401
+    wrong = {'Authorization': 'Bearer nope'}
+    assert client.get('/api/pool-stats', headers=wrong).status_code == 401
+    response = client.get('/api/pool-stats', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200 and 'openai' in response.json
@@ -0,0 +1,118 @@
+"""Cubos de tokens y motor de cuotas."""
+
+import pytest
+
+from api.quotas import (Budget, MemoryBucketStore, QuotaEngine, SQLiteBucketStore, refill,
+                        take_tokens)
+
+
+def test_refill_is_linear_and_capped():
+    budget = Budget('extract', 10, period=100)
+    assert refill(0, 0, budget, 50) == 5
+    assert refill(4, 0, budget, 1000) == 10
+
+
+def test_take_tokens():
+    budget = Budget('extract', 10, period=100)
+    assert take_tokens(3, budget, 2, False) == (1, True, 0.0)
+    tokens, allowed, retry_after = take_tokens(1, budget, 2, False)
+    assert (tokens, allowed) == (1, False)
+    assert retry_after == pytest.approx(10)
+    # cost=0 solo comprueba que quede saldo
+    assert take_tokens(0.5, budget, 0, False)[1]
+    assert not take_tokens(0, budget, 0, False)[1]
+    # force cobra aunque quede en negativo; un cost negativo no pasa de la capacidad
+    assert take_tokens(1, budget, 3, True) == (-2, True, 0.0)
+    assert take_tokens(9, budget, -5, True) == (10, True, 0.0)
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_store(request, db_path):
+    if request.param == 'memory':
+        store = MemoryBucketStore()
+        return lambda: store
+    return lambda: SQLiteBucketStore(db_path)
+
+
+def test_bucket_empties_and_refills(make_store, clock):
+    store = make_store()
+    budget = Budget('analyze', 3, period=300)
+    assert [store.take('k', budget, 1)[0] for _ in range(4)] == [True, True, True, False]
+    allowed, retry_after = store.take('k', budget, 1)
+    assert not allowed and retry_after == pytest.approx(100)
+    clock.advance(100)
+    assert store.take('k', budget, 1) == (True, 0.0)
+    assert not store.take('k', budget, 1)[0]
+    # Los demás usuarios tienen su propio cubo
+    assert store.take('other', budget, 1)[0]
+
+
+def test_sqlite_buckets_are_shared_between_workers(db_path, clock):
+    budget = Budget('extract', 2, period=100)
+    first, second = SQLiteBucketStore(db_path), SQLiteBucketStore(db_path)
+    assert first.take('k', budget, 1)[0]
+    assert second.take('k', budget, 1)[0]
+    assert not first.take('k', budget, 1)[0]
+    assert not second.take('k', budget, 1)[0]
+
+
+def test_memory_store_evicts_least_recently_used(clock):
+    store = MemoryBucketStore(max_entries=2)
+    budget = Budget('extract', 1, period=100)
+    for key in ('a', 'b', 'c'):
+        store.take(key, budget, 1)
+    assert list(store.buckets) == ['b', 'c']
+    # Un cubo que ya se ha rellenado del todo se descarta
+    clock.advance(100)
+    store.take('d', budget, 0)
+    assert 'b' not in store.buckets
+
+
+def engine(store, **budgets):
+    return QuotaEngine(store, [Budget(name, capacity, period=1000)
+                               for name, capacity in budgets.items()])
+
+
+def test_engine_allow_and_charge(clock):
+    quotas = engine(MemoryBucketStore(), llm_dollars=1.0, analyze=0)
+    assert quotas.allow('ip:1', 'llm_dollars', 0)
+    quotas.charge('ip:1', 'llm_dollars', 1.5)
+    assert not quotas.allow('ip:1', 'llm_dollars', 0)
+    assert quotas.allow('ip:2', 'llm_dollars', 0)
+    # Capacidad 0 = sin límite
+    assert all(quotas.allow('ip:1', 'analyze') for _ in range(10))
+
+
+def test_engine_disabled_allows_everything(clock):
+    quotas = QuotaEngine(MemoryBucketStore(), [Budget('extract', 1)], enabled=False)
+    assert all(quotas.allow('ip:1', 'extract') for _ in range(5))
+
+
+def test_settle_charges_excess_and_refunds_the_rest(clock):
+    store = MemoryBucketStore()
+    quotas = engine(store, llm_dollars=1.0)
+    assert quotas.allow('s', 'llm_dollars', 0.5)
+    quotas.settle('s', 'llm_dollars', 0.5, 0.2)
+    assert store.buckets['llm_dollars:s'][0] == pytest.approx(0.8)
+    assert quotas.allow('s', 'llm_dollars', 0.5)
+    quotas.settle('s', 'llm_dollars', 0.5, 0.7)
+    assert store.buckets['llm_dollars:s'][0] == pytest.approx(0.1)
+
+
+def test_denied_fast_path_does_not_block_smaller_costs(clock):
+    store = MemoryBucketStore()
+    quotas = engine(store, analyze=5)
+    assert quotas.allow('s', 'analyze', 3)
+    assert not quotas.allow('s', 'analyze', 3)
+    # Rechazado sin consultar el almacén
+    store.buckets.clear()
+    assert not quotas.allow('s', 'analyze', 3)
+    assert quotas.allow('s', 'analyze', 2)
+
+
+def test_refund_clears_denied_fast_path(clock):
+    quotas = engine(MemoryBucketStore(), analyze=2)
+    assert quotas.allow('s', 'analyze', 2)
+    assert not quotas.allow('s', 'analyze', 1)
+    quotas.refund('s', 'analyze', 2)
+    assert quotas.allow('s', 'analyze', 2)
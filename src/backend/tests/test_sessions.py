@@ -0,0 +1,118 @@
+"""Sesiones versionadas con LRU por worker y tabla SQLite compartida."""
+
+from datetime import timedelta
+
+import pytest
+from flask import Flask, session
+
+from api.sessions import CachedSessionInterface, SQLiteSessionStore
+
+LIFETIME = 3600
+
+
+def make_worker(shared_path=None):
+    """App de Flask equivalente a un worker con su propia LRU"""
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.permanent_session_lifetime = timedelta(seconds=LIFETIME)
+    shared = SQLiteSessionStore(shared_path) if shared_path else None
+    app.session_interface = CachedSessionInterface(shared, sweep_interval=3600)
+
+    @app.post('/set/<value>')
+    def set_value(value):
+        session['value'] = value
+        return ''
+
+    @app.get('/get')
+    def get_value():
+        return session.get('value', '')
+
+    @app.post('/clear')
+    def clear():
+        session.clear()
+        return ''
+
+    return app
+
+
+def cookie(client):
+    found = client.get_cookie('session')
+    return found.value if found else None
+
+
+@pytest.fixture
+def workers(db_path):
+    return make_worker(db_path).test_client(), make_worker(db_path).test_client()
+
+
+def test_cookie_carries_sid_and_version(workers, clock):
+    first, _ = workers
+    assert cookie(first) is None
+    first.post('/set/a')
+    sid, version = cookie(first).rsplit('.', 1)
+    assert len(sid) > 20 and version == '1'
+    first.post('/set/b')
+    assert cookie(first) == f'{sid}.2'
+
+
+def test_other_worker_reloads_newer_version(workers, clock):
+    first, second = workers
+    first.post('/set/a')
+    second.set_cookie('session', cookie(first))
+    assert second.get('/get').text == 'a'
+
+    # El primer worker cambia la sesión: la LRU del segundo tiene una versión vieja
+    first.post('/set/b')
+    second.set_cookie('session', cookie(first))
+    assert second.get('/get').text == 'b'
+
+
+def test_same_version_is_read_from_memory(workers, clock):
+    first, _ = workers
+    first.post('/set/a')
+    interface = first.application.session_interface
+    interface.shared.delete(cookie(first).rsplit('.', 1)[0])
+    assert first.get('/get').text == 'a'
+
+
+def test_unknown_or_malformed_cookie_starts_new_session(workers, clock):
+    first, _ = workers
+    for value in ('nosuchsid.1', 'no-version', 'sid.notanumber'):
+        first.set_cookie('session', value)
+        assert first.get('/get').text == ''
+
+
+def test_session_is_only_renewed_when_modified_or_half_expired(workers, clock):
+    first, _ = workers
+    first.post('/set/a')
+    sid = cookie(first).rsplit('.', 1)[0]
+    assert first.get('/get').headers.get('Set-Cookie') is None
+    clock.advance(LIFETIME / 2 - 10)
+    assert first.get('/get').headers.get('Set-Cookie') is None
+    clock.advance(20)
+    assert first.get('/get').headers.get('Set-Cookie') is not None
+    assert cookie(first) == f'{sid}.2'
+
+
+def test_expired_session_is_not_loaded(workers, clock):
+    first, _ = workers
+    first.post('/set/a')
+    clock.advance(LIFETIME + 1)
+    assert first.get('/get').text == ''
+
+
+def test_cleared_session_is_deleted_everywhere(workers, clock):
+    first, second = workers
+    first.post('/set/a')
+    value = cookie(first)
+    first.post('/clear')
+    assert cookie(first) is None
+    second.set_cookie('session', value)
+    assert second.get('/get').text == ''
+
+
+def test_memory_backend_is_per_worker(clock):
+    first, second = make_worker().test_client(), make_worker().test_client()
+    first.post('/set/a')
+    second.set_cookie('session', cookie(first))
+    assert second.get('/get').text == ''